@@ -0,0 +1,34 @@
+"""city coordinates
+
+Revision ID: 134af6dd8b13
+Revises: 32d503ec5784
+Create Date: 2026-10-17 20:41:09.377152
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "134af6dd8b13"
+down_revision = "32d503ec5784"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("cities", sa.Column("latitude", sa.Float(), nullable=True))
+    op.add_column("cities", sa.Column("longitude", sa.Float(), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_cities_latitude_longitude",
+            "cities",
+            ["latitude", "longitude"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_cities_latitude_longitude", table_name="cities")
+    op.drop_column("cities", "longitude")
+    op.drop_column("cities", "latitude")
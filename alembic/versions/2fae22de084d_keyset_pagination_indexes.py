@@ -0,0 +1,45 @@
+"""keyset pagination indexes
+
+Revision ID: 2fae22de084d
+Revises: 697edd489799
+Create Date: 2026-10-17 19:02:11.482915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "2fae22de084d"
+down_revision = "697edd489799"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Built concurrently, so the tables stay writable while indexes are created
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_messages_conversation_id_id",
+            "messages",
+            ["conversation_id", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_messages_author_id_id",
+            "messages",
+            ["author_id", "id"],
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_images_classified_id_id",
+            "images",
+            ["classified_id", "id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_images_classified_id_id", table_name="images")
+    op.drop_index("ix_messages_author_id_id", table_name="messages")
+    op.drop_index("ix_messages_conversation_id_id", table_name="messages")
@@ -0,0 +1,41 @@
+"""classified title trigram
+
+Revision ID: 32d503ec5784
+Revises: ddff6e0cf76a
+Create Date: 2026-10-17 20:12:38.604917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "32d503ec5784"
+down_revision = "ddff6e0cf76a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_classifieds_title_trgm",
+            "classifieds",
+            ["title"],
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+        )
+        op.create_index(
+            "ix_classifieds_active_title_lower",
+            "classifieds",
+            [sa.text("lower(title) text_pattern_ops")],
+            postgresql_where=sa.text("status = 'active'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_classifieds_active_title_lower", table_name="classifieds")
+    op.drop_index("ix_classifieds_title_trgm", table_name="classifieds")
@@ -0,0 +1,52 @@
+"""image blobs
+
+Revision ID: 47f0a9c3e8d1
+Revises: e19a4c7d2b60
+Create Date: 2026-10-17 23:58:40.116524
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "47f0a9c3e8d1"
+down_revision = "e19a4c7d2b60"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "image_blobs",
+        sa.Column("checksum", sa.String(length=64), nullable=False),
+        sa.Column("extension", sa.String(length=8), nullable=False),
+        sa.Column("refcount", sa.Integer(), nullable=False),
+        sa.Column("processed", sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint("checksum"),
+    )
+    # Existing images keep their flat files until app.commands.rehome_images
+    op.add_column(
+        "images", sa.Column("blob_checksum", sa.String(length=64), nullable=True)
+    )
+    op.create_foreign_key(
+        "images_blob_checksum_fkey",
+        "images",
+        "image_blobs",
+        ["blob_checksum"],
+        ["checksum"],
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_images_blob_checksum",
+            "images",
+            ["blob_checksum"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_images_blob_checksum", table_name="images")
+    op.drop_constraint("images_blob_checksum_fkey", "images", type_="foreignkey")
+    op.drop_column("images", "blob_checksum")
+    op.drop_table("image_blobs")
@@ -0,0 +1,57 @@
+"""classified filter indexes
+
+Revision ID: 54dc831055ec
+Revises: 2fae22de084d
+Create Date: 2026-10-17 19:21:47.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "54dc831055ec"
+down_revision = "2fae22de084d"
+branch_labels = None
+depends_on = None
+
+classifieds_indexes = {
+    "ix_classifieds_created_id": ["created", "id"],
+    "ix_classifieds_updated_id": ["updated", "id"],
+    "ix_classifieds_price_id": ["price", "id"],
+    "ix_classifieds_category_id_created_id": ["category_id", "created", "id"],
+    "ix_classifieds_category_id_price_id": ["category_id", "price", "id"],
+    "ix_classifieds_city_id_created_id": ["city_id", "created", "id"],
+    "ix_classifieds_user_id_created_id": ["user_id", "created", "id"],
+}
+
+classifieds_active_indexes = {
+    "ix_classifieds_active_created_id": ["created", "id"],
+    "ix_classifieds_active_category_id_price_id": ["category_id", "price", "id"],
+}
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, columns in classifieds_indexes.items():
+            op.create_index(name, "classifieds", columns, postgresql_concurrently=True)
+        for name, columns in classifieds_active_indexes.items():
+            op.create_index(
+                name,
+                "classifieds",
+                columns,
+                postgresql_where=sa.text("status = 'active'"),
+                postgresql_concurrently=True,
+            )
+        op.create_index(
+            op.f("ix_cities_voivodeship_id"),
+            "cities",
+            ["voivodeship_id"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_cities_voivodeship_id"), table_name="cities")
+    for name in {**classifieds_indexes, **classifieds_active_indexes}:
+        op.drop_index(name, table_name="classifieds")
@@ -0,0 +1,62 @@
+"""classified facets view
+
+Revision ID: 603aece1ff08
+Revises: 134af6dd8b13
+Create Date: 2026-10-17 21:05:52.118634
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "603aece1ff08"
+down_revision = "134af6dd8b13"
+branch_labels = None
+depends_on = None
+
+price_bucket = (
+    "width_bucket(classifieds.price, "
+    "CAST(ARRAY[0, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000] AS NUMERIC[]))"
+)
+
+
+def upgrade():
+    op.execute(
+        f"""
+        CREATE MATERIALIZED VIEW classified_facets AS
+        SELECT
+            CASE
+                WHEN (grouping(classifieds.category_id) = 0) THEN 'category_id'
+                WHEN (grouping(cities.voivodeship_id) = 0) THEN 'voivodeship_id'
+                WHEN (grouping(classifieds.city_id) = 0) THEN 'city_id'
+                WHEN (grouping({price_bucket}) = 0) THEN 'price'
+            END AS facet,
+            coalesce(
+                classifieds.category_id,
+                cities.voivodeship_id,
+                classifieds.city_id,
+                {price_bucket}
+            ) AS value,
+            count(*) AS count
+        FROM classifieds JOIN cities ON cities.id = classifieds.city_id
+        WHERE classifieds.status = 'active'
+        GROUP BY GROUPING SETS (
+            (classifieds.category_id),
+            (cities.voivodeship_id),
+            (classifieds.city_id),
+            ({price_bucket})
+        )
+        """
+    )
+    # REFRESH ... CONCURRENTLY needs a unique index
+    op.create_index(
+        "ix_classified_facets_facet_value",
+        "classified_facets",
+        ["facet", "value"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW classified_facets")
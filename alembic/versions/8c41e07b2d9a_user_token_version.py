@@ -0,0 +1,28 @@
+"""user token version
+
+Revision ID: 8c41e07b2d9a
+Revises: 603aece1ff08
+Create Date: 2026-10-17 22:14:36.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "8c41e07b2d9a"
+down_revision = "603aece1ff08"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A constant default, so existing rows aren't rewritten
+    op.add_column(
+        "users",
+        sa.Column("token_version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade():
+    op.drop_column("users", "token_version")
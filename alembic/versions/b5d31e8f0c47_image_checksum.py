@@ -0,0 +1,25 @@
+"""image checksum
+
+Revision ID: b5d31e8f0c47
+Revises: 8c41e07b2d9a
+Create Date: 2026-10-17 23:05:12.417390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b5d31e8f0c47"
+down_revision = "8c41e07b2d9a"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable, images uploaded before have no checksum
+    op.add_column("images", sa.Column("checksum", sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column("images", "checksum")
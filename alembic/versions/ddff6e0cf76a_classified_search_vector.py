@@ -0,0 +1,62 @@
+"""classified search vector
+
+Revision ID: ddff6e0cf76a
+Revises: 54dc831055ec
+Create Date: 2026-10-17 19:48:05.216470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "ddff6e0cf76a"
+down_revision = "54dc831055ec"
+branch_labels = None
+depends_on = None
+
+search_vector = (
+    "setweight(to_tsvector('polish', title), 'A') || "
+    "setweight(to_tsvector('polish', content), 'B') || "
+    "setweight(to_tsvector('simple', title), 'C') || "
+    "setweight(to_tsvector('simple', content), 'D')"
+)
+
+
+def upgrade():
+    # No Polish stemmer ships with PostgreSQL, start from a copy of "simple"
+    op.execute(
+        """
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'polish') THEN
+                CREATE TEXT SEARCH CONFIGURATION polish (COPY = simple);
+            END IF;
+        END
+        $$
+        """
+    )
+    # Adding a stored generated column rewrites the table once
+    op.add_column(
+        "classifieds",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed(search_vector, persisted=True),
+            nullable=False,
+        ),
+    )
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_classifieds_search_vector",
+            "classifieds",
+            ["search_vector"],
+            postgresql_using="gin",
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade():
+    op.drop_index("ix_classifieds_search_vector", table_name="classifieds")
+    op.drop_column("classifieds", "search_vector")
@@ -0,0 +1,34 @@
+"""image variants
+
+Revision ID: e19a4c7d2b60
+Revises: b5d31e8f0c47
+Create Date: 2026-10-17 23:41:27.902113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "e19a4c7d2b60"
+down_revision = "b5d31e8f0c47"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("images", sa.Column("width", sa.Integer(), nullable=True))
+    op.add_column("images", sa.Column("height", sa.Integer(), nullable=True))
+    op.add_column("images", sa.Column("size", sa.Integer(), nullable=True))
+    op.add_column(
+        "images",
+        sa.Column("variants", postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    )
+
+
+def downgrade():
+    op.drop_column("images", "variants")
+    op.drop_column("images", "size")
+    op.drop_column("images", "height")
+    op.drop_column("images", "width")
@@ -1,18 +1,19 @@
 from typing import Any, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
-from app.deps.db import get_db
+from app.deps.db import get_db, get_read_db
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.reference_data import reference_data
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.category import Category
 from app.models.user import User
 from app.schemas.category import Category as CategorySchema, CategoryDelete
 from app.schemas.category import CategoryCreate, CategoryUpdate
 from app.schemas.request_params import RequestParams
+from app.core.cache import response_cache
 from app.core.logger import logger
 
 router = APIRouter(prefix="/categories")
@@ -21,20 +22,15 @@ router = APIRouter(prefix="/categories")
 @router.get("", response_model=List[CategorySchema])
 def get_categories(
     response: Response,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     request_params: RequestParams = Depends(parse_react_admin_params(Category)),
 ) -> Any:
-    total = db.query(func.count(Category.id)).scalar()
-    query_categories = db.query(Category).order_by(request_params.order_by)
-    categories = (
-        query_categories.offset(request_params.skip).limit(request_params.limit).all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(categories)}/{total}"
-
     logger.info(f"Getting all categories")
+    if not request_params.keyset:
+        return reference_data.paginate("categories", request_params)
+
+    query_categories = db.query(Category)
+    categories = paginate(response, query_categories, request_params)
     return categories
 
 
@@ -47,6 +43,7 @@ def create_category(
     category = Category(**category_in.dict())
     db.add(category)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} creating category {category.name} ID {category.id}")
     return category
@@ -67,6 +64,7 @@ def update_category(
         setattr(category, field, value)
     db.add(category)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} updating category ID {category.id}")
     return category
@@ -75,13 +73,12 @@ def update_category(
 @router.get("/{category_id}", response_model=CategorySchema)
 def get_category(
     category_id: int,
-    db: Session = Depends(get_db),
 ) -> Any:
-    category: Optional[Category] = db.get(Category, category_id)
-    if not category:
+    category = reference_data.get("categories", category_id)
+    if category is None:
         raise HTTPException(404)
 
-    logger.info(f"Getting category ID {category.id}")
+    logger.info(f"Getting category ID {category_id}")
     return category
 
 
@@ -94,8 +91,16 @@ def delete_category(
     category: Optional[Category] = db.get(Category, category_id)
     if not category:
         raise HTTPException(404)
+    # Deleted along with it, through the relationship's cascade
+    classified_ids = [classified.id for classified in category.classifieds]
     db.delete(category)
     db.commit()
+    reference_data.invalidate()
+    response_cache.invalidate(
+        "classifieds",
+        *[f"classified:{id}" for id in classified_ids],
+        *[f"classified:{id}:images" for id in classified_ids],
+    )
 
     logger.info(f"{user} deleting category ID {category.id}")
     return category
@@ -1,18 +1,19 @@
 from typing import Any, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
-from app.deps.db import get_db
+from app.deps.db import get_db, get_read_db
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.reference_data import reference_data
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.city import City
 from app.models.user import User
 from app.schemas.city import City as CitySchema, CityDelete
 from app.schemas.city import CityCreate, CityUpdate
 from app.schemas.request_params import RequestParams
+from app.core.cache import response_cache
 from app.core.logger import logger
 
 router = APIRouter(prefix="/cities")
@@ -21,18 +22,15 @@ router = APIRouter(prefix="/cities")
 @router.get("", response_model=List[CitySchema])
 def get_cities(
     response: Response,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     request_params: RequestParams = Depends(parse_react_admin_params(City)),
 ) -> Any:
-    total = db.query(func.count(City.id)).scalar()
-    query_cities = db.query(City).order_by(request_params.order_by)
-    cities = query_cities.offset(request_params.skip).limit(request_params.limit).all()
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(cities)}/{total}"
-
     logger.info(f"Getting all cities")
+    if not request_params.keyset:
+        return reference_data.paginate("cities", request_params)
+
+    query_cities = db.query(City)
+    cities = paginate(response, query_cities, request_params)
     return cities
 
 
@@ -45,6 +43,7 @@ def create_city(
     city = City(**city_in.dict())
     db.add(city)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} creating city {city.name} (ID {city.id})")
     return city
@@ -65,6 +64,7 @@ def update_city(
         setattr(city, field, value)
     db.add(city)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} updating city (ID {city.id})")
     return city
@@ -73,13 +73,12 @@ def update_city(
 @router.get("/{city_id}", response_model=CitySchema)
 def get_city(
     city_id: int,
-    db: Session = Depends(get_db),
 ) -> Any:
-    city: Optional[City] = db.get(City, city_id)
-    if not city:
+    city = reference_data.get("cities", city_id)
+    if city is None:
         raise HTTPException(404)
 
-    logger.info(f"Getting city {city.name} (ID {city.id})")
+    logger.info(f"Getting city (ID {city_id})")
     return city
 
 
@@ -92,8 +91,16 @@ def delete_city(
     city: Optional[City] = db.get(City, city_id)
     if not city:
         raise HTTPException(404)
+    # Deleted along with it, through the relationship's cascade
+    classified_ids = [classified.id for classified in city.classifieds]
     db.delete(city)
     db.commit()
+    reference_data.invalidate()
+    response_cache.invalidate(
+        "classifieds",
+        *[f"classified:{id}" for id in classified_ids],
+        *[f"classified:{id}:images" for id in classified_ids],
+    )
 
     logger.info(f"{user} deleting city {city.name} (ID {city.id})")
     return city
@@ -1,75 +1,264 @@
-from typing import Any, List, Optional
+import os
+import tempfile
+import uuid
+from typing import Any, List, Literal, Optional, Set
 
-from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Security
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.query import Query as ORMQuery
 from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.expression import literal, or_
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.sqltypes import String
 from starlette.responses import Response
 
-from app.deps.db import get_db
+from app.deps.classifieds import classified_filters, count_facets, escape_like
+from app.deps.classifieds import classified_fields, classified_values
+from app.deps.classifieds import expand_classifieds, expand_options, parse_expand
+from app.deps.classifieds import parse_fields, projection_options
+from app.deps.classifieds import writable_classifieds
+from app.deps.bulk import authorize, bulk_results, check_bulk_size, chunked
+from app.deps.bulk import existing_ids, insert_rows, unique_ids
+from app.deps.classifieds import headline_options
+from app.deps.classifieds import extension_installed, search_query
+from app.deps.classifieds import set_similarity_threshold
+from app.deps.db import get_async_read_db, get_db, get_read_db
+from app.deps.geo import bounding_box, haversine_km
+from app.deps.blobs import remove_files
+from app.deps.images import legacy_image_files, release_image_blobs
+from app.deps.imports import import_classifieds, read_rows, text_feed
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
-from app.models.classified import Classified
+from app.deps.request_params import paginate, parse_react_admin_filter
+from app.deps.request_params import paginate_async, parse_react_admin_params
+from app.models.classified import Classified, ClassifiedStatus
 from app.models.category import Category
+from app.models.city import City
+from app.models.image import Image
 from app.models.user import User
 from app.schemas.classified import Classified as ClassifiedSchema, ClassifiedDelete
-from app.schemas.classified import ClassifiedCreate, ClassifiedUpdate
+from app.schemas.classified import ClassifiedCreate, ClassifiedExpanded
+from app.schemas.classified import ClassifiedFacets, ClassifiedImport
+from app.schemas.classified import ClassifiedPartial
+from app.schemas.classified import ClassifiedNearby
+from app.schemas.classified import ClassifiedSearchResult
+from app.schemas.classified import ClassifiedUpdate, ClassifiedUpdateMany
+from app.schemas.bulk import BulkIds, BulkResult
 from app.schemas.request_params import RequestParams
+from app.core.cache import CachedRoute, cached, response_cache
+from app.core.config import settings
 from app.core.logger import logger
 
-router = APIRouter(prefix="/classifieds")
+router = APIRouter(prefix="/classifieds", route_class=CachedRoute)
 
 
-@router.get("", response_model=List[ClassifiedSchema])
-def get_classifieds(
+@router.get(
+    "", response_model=List[ClassifiedPartial], response_model_exclude_unset=True
+)
+@cached("classifieds")
+async def get_classifieds(
     response: Response,
-    db: Session = Depends(get_db),
-    request_params: RequestParams = Depends(parse_react_admin_params(Classified)),
+    db: AsyncSession = Depends(get_async_read_db),
+    request_params: RequestParams = Depends(
+        parse_react_admin_params(Classified, classified_filters)
+    ),
+    fields: List[str] = Depends(parse_fields),
+    expand: Set[str] = Depends(parse_expand),
 ) -> Any:
-    total = db.query(func.count(Classified.id)).scalar()
-    query_classifieds = db.query(Classified).order_by(request_params.order_by)
-    classifieds = (
-        query_classifieds.offset(request_params.skip).limit(request_params.limit).all()
+    query_classifieds = ORMQuery(Classified).options(
+        *projection_options(fields, request_params.sort_column),
+        *expand_options(expand),
     )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(classifieds)}/{total}"
+    classifieds = await paginate_async(response, db, query_classifieds, request_params)
 
     logger.info("Getting all classifieds")
-    return classifieds
+    return await expand_classifieds(db, classifieds, fields, expand)
 
 
-@router.get("/category/{category_id}", response_model=List[ClassifiedSchema])
-def get_category_classifieds(
+@router.get(
+    "/category/{category_id}",
+    response_model=List[ClassifiedPartial],
+    response_model_exclude_unset=True,
+)
+@cached("classifieds")
+async def get_category_classifieds(
     response: Response,
     category_id: int,
-    db: Session = Depends(get_db),
-    request_params: RequestParams = Depends(parse_react_admin_params(Classified)),
+    db: AsyncSession = Depends(get_async_read_db),
+    request_params: RequestParams = Depends(
+        parse_react_admin_params(Classified, classified_filters)
+    ),
+    fields: List[str] = Depends(parse_fields),
+    expand: Set[str] = Depends(parse_expand),
 ) -> Any:
-    category: Optional[Category] = db.get(Category, category_id)
+    category: Optional[Category] = await db.get(Category, category_id)
     if not category:
         raise HTTPException(404)
 
-    total = (
-        db.query(func.count(Classified.id))
+    query_classifieds = (
+        ORMQuery(Classified)
         .filter(Classified.category == category)
-        .scalar()
+        .options(
+            *projection_options(fields, request_params.sort_column),
+            *expand_options(expand),
+        )
     )
+    classifieds = await paginate_async(response, db, query_classifieds, request_params)
+
+    logger.info(f"Getting all classifieds for category {category.name}")
+    return await expand_classifieds(db, classifieds, fields, expand)
+
+
+@router.get(
+    "/search",
+    response_model=List[ClassifiedSearchResult],
+    response_model_exclude_unset=True,
+)
+def search_classifieds(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=256),
+    similarity: Optional[float] = Query(
+        None,
+        gt=0,
+        le=1,
+        description="Also match titles with a trigram word similarity of at least "
+        "this value, which tolerates typos",
+    ),
+    db: Session = Depends(get_read_db),
+    request_params: RequestParams = Depends(
+        parse_react_admin_params(Classified, classified_filters)
+    ),
+    fields: List[str] = Depends(parse_fields),
+) -> Any:
+    if request_params.keyset:
+        raise HTTPException(400, "Cursor pagination is not supported for search")
+
+    tsquery = search_query(q)
+    rank = func.ts_rank(Classified.search_vector, tsquery)
+    match = Classified.search_vector.op("@@")(tsquery)
+    if similarity is not None and not extension_installed(db, "pg_trgm"):
+        logger.warning(f"pg_trgm is not installed, searching without similarity")
+        similarity = None
+    if similarity is not None:
+        set_similarity_threshold(db, similarity)
+        match = or_(match, literal(q, String).op("<%")(Classified.title))
+        rank = rank + func.word_similarity(q, Classified.title)
+
     query_classifieds = (
         db.query(Classified)
-        .filter(Classified.category == category)
-        .order_by(request_params.order_by)
+        .options(*projection_options(fields, request_params.sort_column))
+        .filter(match)
+        .order_by(rank.desc())
+    )
+    classifieds = paginate(response, query_classifieds, request_params)
+
+    # Snippets are expensive to build, so only build them for the returned page
+    headline = func.ts_headline("polish", Classified.content, tsquery, headline_options)
+    query_highlights = db.query(
+        Classified.id, rank.label("rank"), headline.label("headline")
+    ).filter(Classified.id.in_([classified.id for classified in classifieds]))
+    highlights = {row.id: row for row in query_highlights}
+
+    logger.info(f"Searching classifieds for {q!r}")
+    return [
+        ClassifiedSearchResult(
+            **classified_values(classified, fields),
+            rank=highlights[classified.id].rank,
+            headline=highlights[classified.id].headline,
+        )
+        for classified in classifieds
+    ]
+
+
+@router.get(
+    "/nearby", response_model=List[ClassifiedNearby], response_model_exclude_unset=True
+)
+def get_nearby_classifieds(
+    response: Response,
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(..., gt=0, le=settings.nearby_max_radius_km),
+    db: Session = Depends(get_read_db),
+    request_params: RequestParams = Depends(
+        parse_react_admin_params(Classified, classified_filters)
+    ),
+    fields: List[str] = Depends(parse_fields),
+) -> Any:
+    if request_params.keyset:
+        raise HTTPException(400, "Cursor pagination is not supported for nearby")
+
+    # The indexed bounding box prunes cities before exact distances are computed
+    (min_lat, max_lat), (min_lon, max_lon) = bounding_box(lat, lon, radius_km)
+    distance = haversine_km(lat, lon, City.latitude, City.longitude)
+    nearby_cities = (
+        db.query(City.id, distance.label("distance"))
+        .filter(
+            City.latitude.between(min_lat, max_lat),
+            City.longitude.between(min_lon, max_lon),
+        )
+        .subquery()
     )
-    classifieds = (
-        query_classifieds.offset(request_params.skip).limit(request_params.limit).all()
+
+    query_classifieds = (
+        db.query(Classified, nearby_cities.c.distance)
+        .options(*projection_options(fields, request_params.sort_column))
+        .join(nearby_cities, Classified.city_id == nearby_cities.c.id)
+        .filter(nearby_cities.c.distance <= radius_km)
+        .order_by(nearby_cities.c.distance)
     )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(classifieds)}/{total}"
+    classifieds = paginate(response, query_classifieds, request_params)
 
-    logger.info(f"Getting all classifieds for category {category.name}")
-    return classifieds
+    logger.info(f"Getting classifieds within {radius_km} km of ({lat}, {lon})")
+    return [
+        ClassifiedNearby(
+            **classified_values(classified, fields), distance_km=distance_km
+        )
+        for classified, distance_km in classifieds
+    ]
+
+
+@router.get("/facets", response_model=ClassifiedFacets)
+def get_classified_facets(
+    filter_: Optional[str] = Query(
+        None,
+        alias="filter",
+        description='Format: `{"field_name": value, "field_name_gte": value}`',
+        example="{}",
+    ),
+    db: Session = Depends(get_read_db),
+) -> Any:
+    filters = parse_react_admin_filter(classified_filters, filter_)
+    facets = count_facets(db, filters)
+
+    logger.info(f"Getting classified facets")
+    return facets
+
+
+@router.get("/suggest", response_model=List[str])
+def suggest_classified_titles(
+    response: Response,
+    prefix: str = Query(..., min_length=1, max_length=32),
+    limit: int = Query(10, ge=1, le=25),
+    db: Session = Depends(get_read_db),
+) -> Any:
+    """The most common active titles starting with the prefix, case-insensitively"""
+    title_lower = func.lower(Classified.title)
+    query_titles = (
+        db.query(func.min(Classified.title))
+        .filter(
+            Classified.status == ClassifiedStatus.active,
+            title_lower.like(f"{escape_like(prefix.lower())}%"),
+        )
+        .group_by(title_lower)
+        .order_by(func.count().desc(), title_lower)
+        .limit(limit)
+    )
+    response.headers["Cache-Control"] = f"public, max-age={settings.suggest_max_age}"
+
+    logger.info(f"Suggesting classified titles for {prefix!r}")
+    return [title for title, in query_titles]
 
 
 @router.post("", response_model=ClassifiedSchema, status_code=201)
@@ -82,11 +271,155 @@ def create_classified(
     classified.user_id = user.id
     db.add(classified)
     db.commit()
+    response_cache.invalidate("classifieds")
 
     logger.info(f"{user} creating classified {classified.title} (ID {classified.id})")
     return classified
 
 
+@router.post("/bulk", response_model=List[BulkResult])
+def create_classifieds(
+    classifieds_in: List[ClassifiedCreate],
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["classifieds_create"]),
+) -> Any:
+    """A JSON array of classifieds, created in one transaction. Those of a
+    category or a city which doesn't exist are refused."""
+    check_bulk_size(len(classifieds_in))
+    category_ids = existing_ids(
+        db, Category.id, [c.category_id for c in classifieds_in]
+    )
+    city_ids = existing_ids(db, City.id, [c.city_id for c in classifieds_in])
+
+    results: List[Optional[BulkResult]] = []
+    rows = []
+    for classified_in in classifieds_in:
+        if classified_in.category_id not in category_ids:
+            detail = f"Category {classified_in.category_id} not found"
+            results.append(BulkResult(status=422, detail=detail))
+        elif classified_in.city_id not in city_ids:
+            detail = f"City {classified_in.city_id} not found"
+            results.append(BulkResult(status=422, detail=detail))
+        else:
+            results.append(None)
+            rows.append({**classified_in.dict(), "user_id": user.id})
+    created = iter(insert_rows(db, Classified, rows))
+    db.commit()
+    if rows:
+        response_cache.invalidate("classifieds")
+
+    logger.info(f"{user} creating {len(rows)} classifieds")
+    return [result or BulkResult(id=next(created), status=201) for result in results]
+
+
+@router.put("/bulk", response_model=List[BulkResult])
+def update_classifieds(
+    update_in: ClassifiedUpdateMany,
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["classifieds_update"]),
+) -> Any:
+    ids = unique_ids(update_in.ids)
+    values = update_in.data.dict(exclude_none=True)
+    if not values:
+        raise HTTPException(422, "No data to update")
+    if "category_id" in values and not existing_ids(
+        db, Category.id, [values["category_id"]]
+    ):
+        raise HTTPException(422, f"Category {values['category_id']} not found")
+    if "city_id" in values and not existing_ids(db, City.id, [values["city_id"]]):
+        raise HTTPException(422, f"City {values['city_id']} not found")
+
+    writable, refused = authorize(ids, writable_classifieds(db, ids, user))
+    for chunk in chunked(writable):
+        db.execute(
+            update(Classified)
+            .where(Classified.id.in_(chunk))
+            .values(values)
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+    if writable:
+        response_cache.invalidate(
+            "classifieds", *[f"classified:{id}" for id in writable]
+        )
+
+    logger.info(f"{user} updating {len(writable)} classifieds")
+    return bulk_results(ids, refused)
+
+
+@router.delete("/bulk", response_model=List[BulkResult])
+def delete_classifieds(
+    delete_in: BulkIds,
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["classifieds_delete"]),
+) -> Any:
+    ids = unique_ids(delete_in.ids)
+    writable, refused = authorize(ids, writable_classifieds(db, ids, user))
+    images = db.query(Image).filter(Image.classified_id.in_(writable)).all()
+    for chunk in chunked(writable):
+        # The images, which the ORM would have cascaded to, then the classifieds
+        db.execute(
+            delete(Image)
+            .where(Image.classified_id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(
+            delete(Classified)
+            .where(Classified.id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+    release_image_blobs(db, images)
+    files = legacy_image_files(images)
+    db.commit()
+    remove_files(files)
+    if writable:
+        response_cache.invalidate(
+            "classifieds",
+            *[f"classified:{id}" for id in writable],
+            *[f"classified:{id}:images" for id in writable],
+        )
+
+    logger.info(f"{user} deleting {len(writable)} classifieds")
+    return bulk_results(ids, refused)
+
+
+@router.post("/import", response_model=ClassifiedImport)
+async def import_classifieds_feed(
+    request: Request,
+    format: Literal["csv", "ndjson"] = Query(...),
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["classifieds_create"]),
+) -> Any:
+    """Imports a CSV or NDJSON feed as app.commands.import_classifieds does,
+    for superusers. Invalid rows are kept in a rejects file."""
+    if not user.is_superuser:
+        raise HTTPException(401)
+
+    os.makedirs(settings.imports_rejects_path, exist_ok=True)
+    rejects_path = f"{settings.imports_rejects_path}{uuid.uuid4()}.ndjson"
+    # Spooled to disk, so no connection is held while the feed is received
+    async with anyio.wrap_file(tempfile.TemporaryFile()) as spool:
+        async for chunk in request.stream():
+            await spool.write(chunk)
+        await spool.seek(0)
+        source = text_feed(spool.wrapped)
+        with open(rejects_path, "w", encoding="utf-8") as rejects:
+            imported, rejected = await run_in_threadpool(
+                import_classifieds, db, read_rows(source, format), user.id, rejects
+            )
+    if not rejected:
+        os.remove(rejects_path)
+    if imported:
+        await response_cache.invalidate_async("classifieds")
+
+    logger.info(f"{user} importing {imported} classifieds, {rejected} rejected")
+    return ClassifiedImport(
+        imported=imported,
+        rejected=rejected,
+        rejects_file=rejects_path if rejected else None,
+    )
+
+
 @router.put("/{classified_id}", response_model=ClassifiedSchema)
 def update_classified(
     classified_id: int,
@@ -104,22 +437,34 @@ def update_classified(
         setattr(classified, field, value)
     db.add(classified)
     db.commit()
+    response_cache.invalidate("classifieds", f"classified:{classified.id}")
 
     logger.info(f"{user} updating classified (ID {classified.id})")
     return classified
 
 
-@router.get("/{classified_id}", response_model=ClassifiedSchema)
-def get_classified(
+@router.get(
+    "/{classified_id}",
+    response_model=ClassifiedExpanded,
+    response_model_exclude_unset=True,
+)
+@cached("classified:{classified_id}")
+async def get_classified(
     classified_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
+    expand: Set[str] = Depends(parse_expand),
 ) -> Any:
-    classified: Optional[Classified] = db.get(Classified, classified_id)
+    classified: Optional[Classified] = await db.get(
+        Classified, classified_id, options=expand_options(expand)
+    )
     if not classified:
         raise HTTPException(404)
 
     logger.info(f"Getting classified (ID {classified.id})")
-    return classified
+    [expanded] = await expand_classifieds(
+        db, [classified], list(classified_fields), expand
+    )
+    return expanded
 
 
 @router.delete("/{classified_id}", response_model=ClassifiedDelete)
@@ -133,8 +478,15 @@ def delete_classified(
         raise HTTPException(404)
     if classified.user_id != user.id and not user.is_superuser:
         raise HTTPException(401)
+    files = legacy_image_files(classified.images)
     db.delete(classified)
     db.commit()
+    remove_files(files)
+    response_cache.invalidate(
+        "classifieds",
+        f"classified:{classified.id}",
+        f"classified:{classified.id}:images",
+    )
 
     logger.info(f"{user} deleting classified (ID {classified.id})")
     return classified
@@ -2,13 +2,12 @@ from typing import Any, List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
 from app.deps.db import get_db
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.conversation import Conversation
 from app.models.user import User
 from app.schemas.conversation import (
@@ -29,18 +28,8 @@ def get_conversations(
     user: User = Security(manager, scopes=["conversations"]),
     request_params: RequestParams = Depends(parse_react_admin_params(Conversation)),
 ) -> Any:
-    total = db.query(func.count(Conversation.id)).scalar()
-    query_conversations = db.query(Conversation).order_by(request_params.order_by)
-    conversations = (
-        query_conversations.offset(request_params.skip)
-        .limit(request_params.limit)
-        .all()
-    )
-
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(conversations)}/{total}"
+    query_conversations = db.query(Conversation)
+    conversations = paginate(response, query_conversations, request_params)
 
     logger.info(f"{user} getting all conversations")
     return conversations
@@ -65,26 +54,10 @@ def get_user_conversations(
         user_conversation.conversation_id for user_conversation in user_conversations
     ]
 
-    total = (
-        db.query(func.count(Conversation.id))
-        .filter(Conversation.id.in_(conversations_ids))
-        .scalar()
-    )
-    query_conversations = (
-        db.query(Conversation)
-        .filter(Conversation.id.in_(conversations_ids))
-        .order_by(request_params.order_by)
+    query_conversations = db.query(Conversation).filter(
+        Conversation.id.in_(conversations_ids)
     )
-    conversations = (
-        query_conversations.offset(request_params.skip)
-        .limit(request_params.limit)
-        .all()
-    )
-
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(conversations)}/{total}"
+    conversations = paginate(response, query_conversations, request_params)
 
     logger.info(f"{user} getting conversations for {user_queried}")
     return conversations
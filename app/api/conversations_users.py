@@ -8,7 +8,7 @@ from starlette.responses import Response
 
 from app.deps.db import get_db
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.conversation_user import ConversationUser
 from app.models.conversation import Conversation
 from app.models.user import User
@@ -30,19 +30,8 @@ def get_conversations_users(
     user: User = Security(manager, scopes=["conversations_users"]),
     request_params: RequestParams = Depends(parse_react_admin_params(ConversationUser)),
 ) -> Any:
-    total = db.query(func.count(ConversationUser.conversation_id)).scalar()
-    query_conversations_users = db.query(ConversationUser).order_by(
-        request_params.order_by
-    )
-    conversations_users = (
-        query_conversations_users.offset(request_params.skip)
-        .limit(request_params.limit)
-        .all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(conversations_users)}/{total}"
+    query_conversations_users = db.query(ConversationUser)
+    conversations_users = paginate(response, query_conversations_users, request_params)
 
     logger.info(f"{user} getting all conversations_users")
     return conversations_users
@@ -110,25 +99,10 @@ def get_conversation_users(
     if not is_user_in_conversation and not user.is_superuser:
         raise HTTPException(401)
 
-    total = (
-        db.query(func.count(ConversationUser.conversation_id))
-        .filter(ConversationUser.conversation_id == conversation.id)
-        .scalar()
-    )
-    query_conversations_users = (
-        db.query(ConversationUser)
-        .filter(ConversationUser.conversation_id == conversation.id)
-        .order_by(request_params.order_by)
+    query_conversations_users = db.query(ConversationUser).filter(
+        ConversationUser.conversation_id == conversation.id
     )
-    conversations_users = (
-        query_conversations_users.offset(request_params.skip)
-        .limit(request_params.limit)
-        .all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(conversations_users)}/{total}"
+    conversations_users = paginate(response, query_conversations_users, request_params)
 
     logger.info(
         f"{user} getting all conversations_users for conversation ID {conversation.id}"
@@ -151,25 +125,10 @@ def get_conversations_users_for_user(
     if user.id != user_queried.id and not user.is_superuser:
         raise HTTPException(401)
 
-    total = (
-        db.query(func.count(ConversationUser.user_id))
-        .filter(ConversationUser.user_id == user_queried.id)
-        .scalar()
-    )
-    query_conversations_users = (
-        db.query(ConversationUser)
-        .filter(ConversationUser.user_id == user_queried.id)
-        .order_by(request_params.order_by)
-    )
-    conversations_users = (
-        query_conversations_users.offset(request_params.skip)
-        .limit(request_params.limit)
-        .all()
+    query_conversations_users = db.query(ConversationUser).filter(
+        ConversationUser.user_id == user_queried.id
     )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(conversations_users)}/{total}"
+    conversations_users = paginate(response, query_conversations_users, request_params)
 
     logger.info(f"{user} getting conversations_users for user ID {user_queried.id}")
     return conversations_users
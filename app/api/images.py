@@ -1,80 +1,152 @@
-import base64
-from typing import Any, List, Optional
+import json
+from typing import Any, AsyncIterator, List, Optional
 
 from fastapi import (
-    Header,
     APIRouter,
     Depends,
     HTTPException,
-    File,
-    UploadFile,
+    Query,
+    Request,
     Security,
-    Form,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
-from sqlalchemy import func
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.query import Query as ORMQuery
 from sqlalchemy.orm.session import Session
-from starlette.responses import Response
+from starlette.responses import Response, StreamingResponse
 from pathlib import Path
 
-from app.deps.db import get_db
+from app.deps.blobs import acquire_blob, incoming_path, remove_files, store_blob
+from app.deps.bulk import authorize, bulk_results, chunked, unique_ids
+from app.deps.db import get_async_db, get_async_read_db, get_db, get_read_db
+from app.deps.images import (
+    EXTENSION_TYPES,
+    VARIANT_FORMATS,
+    choose_variant,
+    image_cache_control,
+    image_etag,
+    image_path,
+    legacy_image_files,
+    release_image_blobs,
+    variant_path,
+)
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.request_params import paginate_async, parse_react_admin_params
+from app.deps.uploads import StreamingUpload
 from app.models.classified import Classified
 from app.models.image import Image
 from app.models.user import User
+from app.schemas.bulk import BulkIds, BulkResult
 from app.schemas.image import Image as ImageSchema, ImageDelete
 from app.schemas.request_params import RequestParams
+from app.core.cache import CachedRoute, cached, response_cache
 from app.core.logger import logger
 from app.core.config import settings
+from app.core.files import encode_base64, send_file
+from app.core.scheduler import job_queue
 
-import os
-import shutil
+import anyio
 import uuid
 
-
-async def valid_content_length(
-    content_length: int = Header(..., lt=settings.images_max_size)
-):
-    return content_length
-
-
-def save_upload_file(upload_file: UploadFile, destination: Path) -> None:
-    try:
-        upload_file.file.seek(0)
-        with destination.open("wb") as buffer:
-            shutil.copyfileobj(upload_file.file, buffer)
-    finally:
-        upload_file.file.close()
-
-
-router = APIRouter(prefix="/images")
+# The body is read by StreamingUpload, documented here as FastAPI can't infer it
+IMAGE_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["classified_id", "file"],
+                    "properties": {
+                        "classified_id": {"type": "integer"},
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                }
+            }
+        },
+    }
+}
+
+
+router = APIRouter(prefix="/images", route_class=CachedRoute)
 
 
 @router.get("", response_model=List[ImageSchema])
-def get_images(
+async def get_images(
     response: Response,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     request_params: RequestParams = Depends(parse_react_admin_params(Image)),
 ) -> Any:
-    total = db.query(func.count(Image.id)).scalar()
-    query_images = db.query(Image).order_by(request_params.order_by)
-    images = query_images.offset(request_params.skip).limit(request_params.limit).all()
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(images)}/{total}"
+    query_images = ORMQuery(Image)
+    images = await paginate_async(response, db, query_images, request_params)
 
     logger.info("Getting all images")
     return images
 
 
+def not_found_line(image_id: int) -> bytes:
+    return json.dumps({"id": image_id, "detail": "Not Found"}).encode() + b"\n"
+
+
+@router.get("/base64")
+async def get_images_base64(
+    request: Request,
+    ids: str = Query(..., regex=r"^\d+(,\d+)*$", description="Comma separated"),
+    w: Optional[int] = Query(None, gt=0, description="Width the images are shown at"),
+    db: AsyncSession = Depends(get_async_read_db),
+) -> Any:
+    """Images as NDJSON, a line per id in the order given:
+    {"id", "content_type", "base64"}, or {"id", "detail"} when not found"""
+    image_ids = list(dict.fromkeys(int(image_id) for image_id in ids.split(",")))
+    if len(image_ids) > settings.images_base64_batch_max:
+        raise HTTPException(
+            400, f"At most {settings.images_base64_batch_max} images per request"
+        )
+    result = await db.execute(select(Image).where(Image.id.in_(image_ids)))
+    images = {image.id: image for image in result.scalars()}
+    accept = request.headers.get("accept", "")
+
+    async def lines() -> AsyncIterator[bytes]:
+        for image_id in image_ids:
+            image = images.get(image_id)
+            if image is None:
+                yield not_found_line(image_id)
+                continue
+
+            variant = choose_variant(image, w, accept)
+            if variant:
+                file_path = variant_path(image, variant)
+                media_type = VARIANT_FORMATS[variant["format"]][2]
+            else:
+                file_path = image_path(image)
+                media_type = EXTENSION_TYPES.get(image.extension)
+            try:
+                file = await anyio.open_file(file_path, "rb")
+            except FileNotFoundError:
+                logger.error(f"File {file_path} not found (image ID {image.id})")
+                yield not_found_line(image_id)
+                continue
+
+            async with file:
+                # The line is written around the encoded chunks
+                head = json.dumps({"id": image_id, "content_type": media_type})
+                yield head[:-1].encode() + b', "base64": "'
+                async for chunk in encode_base64(file):
+                    yield chunk
+                yield b'"}\n'
+
+    logger.info(f"Getting images {image_ids} as base64 strings")
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.get("/{image_id}", response_model=ImageSchema)
-def get_image(
+async def get_image(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ) -> Any:
-    image: Optional[Image] = db.get(Image, image_id)
+    image: Optional[Image] = await db.get(Image, image_id)
     if not image:
         raise HTTPException(404)
 
@@ -83,31 +155,19 @@ def get_image(
 
 
 @router.get("/classified/{classified_id}", response_model=List[ImageSchema])
-def get_classified_images(
+@cached("classified:{classified_id}:images")
+async def get_classified_images(
     response: Response,
     classified_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
     request_params: RequestParams = Depends(parse_react_admin_params(Image)),
 ) -> Any:
-    classified: Optional[Image] = db.get(Classified, classified_id)
+    classified: Optional[Image] = await db.get(Classified, classified_id)
     if not classified:
         raise HTTPException(404)
 
-    total = (
-        db.query(func.count(Image.id))
-        .filter(Image.classified_id == classified.id)
-        .scalar()
-    )
-    query_images = (
-        db.query(Image)
-        .filter(Image.classified_id == classified.id)
-        .order_by(request_params.order_by)
-    )
-    images = query_images.offset(request_params.skip).limit(request_params.limit).all()
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(images)}/{total}"
+    query_images = ORMQuery(Image).filter(Image.classified_id == classified.id)
+    images = await paginate_async(response, db, query_images, request_params)
 
     logger.info(f"Getting images for classified {classified_id}")
     return images
@@ -115,79 +175,173 @@ def get_classified_images(
 
 @router.post(
     "",
-    dependencies=[Depends(valid_content_length)],
     response_model=ImageSchema,
     status_code=201,
+    openapi_extra=IMAGE_UPLOAD_BODY,
 )
-def create_image(
-    classified_id: int = Form(...),
-    file: UploadFile = File(...),
-    db: Session = Depends(get_db),
+async def create_image(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
     user: User = Security(manager, scopes=["images_create"]),
 ) -> Any:
-    classified: Optional[Classified] = db.get(Classified, classified_id)
-    if not classified:
-        raise HTTPException(404)
-    if classified.user_id != user.id:
-        logger.error(
-            f"{user} tried to create image in other's user classified (ID {classified.id})"
-        )
-        raise HTTPException(401)
-
-    if file.content_type not in settings.images_content_types:
-        logger.error(f"{user} tried to create image of type {file.content_type}")
-        raise HTTPException(
-            status_code=400,
-            detail=f"File type of {file.content_type} is not supported",
-        )
+    # Loading the user may have checked out a connection, not held while streaming
+    await db.commit()
 
     filename = uuid.uuid4()
-    extension = Path(file.filename).suffix
-    destination = f"{settings.images_upload_path}{filename}{extension}"
-    save_upload_file(file, Path(destination))
+    upload = StreamingUpload(
+        request,
+        Path(incoming_path()),
+        str(filename),
+        settings.images_max_size,
+        settings.images_content_types,
+    )
+    fields, file = await upload.receive()
+    try:
+        try:
+            classified_id = int(fields["classified_id"])
+        except (KeyError, ValueError):
+            raise HTTPException(422, "Field classified_id must be an integer")
+
+        classified: Optional[Classified] = await db.get(Classified, classified_id)
+        if not classified:
+            raise HTTPException(404)
+        if classified.user_id != user.id:
+            logger.error(
+                f"{user} tried to create image in other's user classified (ID {classified.id})"
+            )
+            raise HTTPException(401)
+
+        result = await db.execute(acquire_blob(file.checksum, file.extension))
+        # Stored before the commit, other uploads of the same bytes wait for it
+        await run_in_threadpool(
+            store_blob, str(file.path), file.checksum, file.extension, result.scalar()
+        )
 
-    image = Image(filename=filename, extension=extension)
-    image.classified_id = classified.id
-    db.add(image)
-    db.commit()
+        image = Image(
+            filename=filename,
+            extension=file.extension,
+            checksum=file.checksum,
+            blob_checksum=file.checksum,
+        )
+        image.classified_id = classified.id
+        db.add(image)
+        await db.commit()
+    except BaseException:
+        await upload.discard()
+        raise
+    # Its first image, when expanded, may have changed
+    await response_cache.invalidate_async(
+        f"classified:{classified.id}", f"classified:{classified.id}:images"
+    )
+    await job_queue.enqueue(
+        "process_image", image.id, _job_id=f"process_image:{image.id}"
+    )
 
     logger.info(
-        f"{user} creating image (ID {image.id}) at {destination} for classified (ID {classified.id})"
+        f"{user} creating image (ID {image.id}) of {file.size} bytes in blob {file.checksum} for classified (ID {classified.id})"
     )
     return image
 
 
 @router.get("/file/{image_id}", response_class=FileResponse)
 def get_image_file(
+    request: Request,
     image_id: int,
-    db: Session = Depends(get_db),
+    w: Optional[int] = Query(None, gt=0, description="Width the image is shown at"),
+    db: Session = Depends(get_read_db),
 ) -> Any:
     image: Optional[Image] = db.get(Image, image_id)
     if not image:
         raise HTTPException(404)
 
-    file_path = f"{settings.images_upload_path}{image.filename}{image.extension}"
+    variant = choose_variant(image, w, request.headers.get("accept", ""))
+    if variant:
+        file_path = variant_path(image, variant)
+        media_type = VARIANT_FORMATS[variant["format"]][2]
+    else:
+        file_path = image_path(image)
+        media_type = EXTENSION_TYPES.get(image.extension, "application/octet-stream")
 
     logger.info(f"Getting image {file_path} (ID {image.id})")
-    return file_path
+    return send_file(
+        request,
+        file_path,
+        media_type,
+        image_etag(image, variant),
+        image_cache_control(image),
+        # The variant served depends on the formats the client accepts
+        headers={"Vary": "Accept"},
+    )
 
 
 @router.get("/base64/{image_id}")
-def get_image_base64(
+async def get_image_base64(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_read_db),
 ) -> Any:
-    image: Optional[Image] = db.get(Image, image_id)
+    image: Optional[Image] = await db.get(Image, image_id)
     if not image:
         raise HTTPException(404)
 
-    file_path = f"{settings.images_upload_path}{image.filename}{image.extension}"
+    file_path = image_path(image)
+    try:
+        # In a worker thread, like every read of the file
+        file = await anyio.open_file(file_path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(404)
 
-    with open(file_path, "rb") as f:
-        base64image = base64.b64encode(f.read())
+    async def content() -> AsyncIterator[bytes]:
+        # A JSON string, as the endpoint has always returned
+        async with file:
+            yield b'"'
+            async for chunk in encode_base64(file):
+                yield chunk
+            yield b'"'
 
     logger.info(f"Getting image {file_path} (ID {image.id}) as base64 string")
-    return base64image
+    return StreamingResponse(content(), media_type="application/json")
+
+
+@router.delete("/bulk", response_model=List[BulkResult])
+def delete_images(
+    delete_in: BulkIds,
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["images_delete"]),
+) -> Any:
+    ids = unique_ids(delete_in.ids)
+    rows = (
+        db.query(Image, Classified.user_id)
+        .join(Image.classified)
+        .filter(Image.id.in_(ids))
+        .with_for_update(of=Image)
+        .all()
+    )
+    writable, refused = authorize(
+        ids,
+        {image.id: user_id == user.id or user.is_superuser for image, user_id in rows},
+    )
+    images = {image.id: image for image, _ in rows}
+    deleted = [images[id] for id in writable]
+
+    for chunk in chunked(writable):
+        db.execute(
+            delete(Image)
+            .where(Image.id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+    release_image_blobs(db, deleted)
+    files = legacy_image_files(deleted)
+    classified_ids = {image.classified_id for image in deleted}
+    db.commit()
+    remove_files(files)
+    if classified_ids:
+        response_cache.invalidate(
+            *[f"classified:{id}" for id in classified_ids],
+            *[f"classified:{id}:images" for id in classified_ids],
+        )
+
+    logger.info(f"{user} deleting {len(deleted)} images")
+    return bulk_results(ids, refused)
 
 
 @router.delete("/{image_id}", response_model=ImageDelete)
@@ -199,17 +353,17 @@ def delete_image(
     image: Optional[Image] = db.get(Image, image_id)
     if not image:
         raise HTTPException(404)
-    if image.user_id != user.id and not user.is_superuser:
+    if image.classified.user_id != user.id and not user.is_superuser:
         raise HTTPException(401)
 
-    try:
-        file_path = f"{settings.images_upload_path}{image.filename}{image.extension}"
-        os.remove(file_path)
-    except FileNotFoundError:
-        logger.error(f"File not found when deleting image (ID {image.id})")
-
+    files = legacy_image_files([image])
+    # Blobs are released by the flush, see app.deps.images.release_blobs
     db.delete(image)
     db.commit()
+    remove_files(files)
+    response_cache.invalidate(
+        f"classified:{image.classified_id}", f"classified:{image.classified_id}:images"
+    )
 
     logger.info(f"{user} deleting image (ID {image.id})")
     return image
@@ -2,19 +2,25 @@ from typing import Any, List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func, and_
+from sqlalchemy import delete, func, and_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.query import Query as ORMQuery
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
-from app.deps.db import get_db
+from app.deps.bulk import authorize, bulk_results, check_bulk_size, chunked
+from app.deps.bulk import existing_ids, insert_rows, unique_ids
+from app.deps.db import get_async_db, get_db
 from app.deps.users import manager
+from app.deps.request_params import paginate, paginate_async
 from app.deps.request_params import parse_react_admin_params
 from app.models.conversation import Conversation
 from app.models.conversation_user import ConversationUser
 from app.models.message import Message
 from app.models.user import User
 from app.schemas.message import Message as MessageSchema, MessageDelete, MessageUpdate
-from app.schemas.message import MessageCreate
+from app.schemas.bulk import BulkIds, BulkResult
+from app.schemas.message import MessageCreate, MessageUpdateMany
 from app.schemas.request_params import RequestParams
 from app.core.logger import logger
 
@@ -28,15 +34,8 @@ def get_messages(
     user: User = Security(manager, scopes=["messages"]),
     request_params: RequestParams = Depends(parse_react_admin_params(Message)),
 ) -> Any:
-    total = db.query(func.count(Message.conversation_id)).scalar()
-    query_messages = db.query(Message).order_by(request_params.order_by)
-    messages = (
-        query_messages.offset(request_params.skip).limit(request_params.limit).all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(messages)}/{total}"
+    query_messages = db.query(Message)
+    messages = paginate(response, query_messages, request_params)
 
     logger.info(f"{user} getting all messages")
     return messages
@@ -74,47 +73,32 @@ def get_message(
 
 
 @router.get("/conversation/{conversation_id}", response_model=List[MessageSchema])
-def get_conversation_messages(
+async def get_conversation_messages(
     response: Response,
     conversation_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     user: User = Security(manager),
     request_params: RequestParams = Depends(parse_react_admin_params(Message)),
 ) -> Any:
-    conversation: Optional[Conversation] = db.get(Conversation, conversation_id)
+    conversation: Optional[Conversation] = await db.get(Conversation, conversation_id)
     if not conversation:
         raise HTTPException(404)
 
-    is_user_in_conversation = (
-        db.query(func.count(ConversationUser.conversation_id))
-        .filter(
+    is_user_in_conversation = await db.scalar(
+        select(func.count(ConversationUser.conversation_id)).filter(
             and_(
                 ConversationUser.conversation_id == conversation.id,
                 ConversationUser.user_id == user.id,
             )
         )
-        .scalar()
     )
     if not is_user_in_conversation and not user.is_superuser:
         raise HTTPException(401)
 
-    total = (
-        db.query(func.count(Message.conversation_id))
-        .filter(Message.conversation_id == conversation.id)
-        .scalar()
-    )
-    query_messages = (
-        db.query(Message)
-        .filter(Message.conversation_id == conversation.id)
-        .order_by(request_params.order_by)
-    )
-    messages = (
-        query_messages.offset(request_params.skip).limit(request_params.limit).all()
+    query_messages = ORMQuery(Message).filter(
+        Message.conversation_id == conversation.id
     )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(messages)}/{total}"
+    messages = await paginate_async(response, db, query_messages, request_params)
 
     logger.info(f"{user} getting all messages of conversation {conversation.id}")
     return messages
@@ -135,23 +119,8 @@ def get_user_messages(
     if user.id != user_queried.id and not user.is_superuser:
         raise HTTPException(401)
 
-    total = (
-        db.query(func.count(Message.conversation_id))
-        .filter(Message.author_id == user_queried.id)
-        .scalar()
-    )
-    query_messages = (
-        db.query(Message)
-        .filter(Message.author_id == user_queried.id)
-        .order_by(request_params.order_by)
-    )
-    messages = (
-        query_messages.offset(request_params.skip).limit(request_params.limit).all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(messages)}/{total}"
+    query_messages = db.query(Message).filter(Message.author_id == user_queried.id)
+    messages = paginate(response, query_messages, request_params)
 
     logger.info(f"{user} getting all messages of {user_queried}")
     return messages
@@ -193,6 +162,107 @@ def create_message(
     return message
 
 
+@router.post("/bulk", response_model=List[BulkResult])
+def create_messages(
+    messages_in: List[MessageCreate],
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["messages_create"]),
+) -> Any:
+    """A JSON array of messages, created in one transaction"""
+    check_bulk_size(len(messages_in))
+    conversation_ids = {message_in.conversation_id for message_in in messages_in}
+    existing = existing_ids(db, Conversation.id, conversation_ids)
+    joined = set(
+        db.execute(
+            select(ConversationUser.conversation_id).where(
+                ConversationUser.user_id == user.id,
+                ConversationUser.conversation_id.in_(conversation_ids),
+            )
+        ).scalars()
+    )
+
+    results: List[Optional[BulkResult]] = []
+    rows = []
+    for message_in in messages_in:
+        if message_in.conversation_id not in existing:
+            results.append(BulkResult(status=404, detail="Not Found"))
+        elif message_in.conversation_id not in joined and not user.is_superuser:
+            results.append(BulkResult(status=401, detail="Unauthorized"))
+        else:
+            results.append(None)
+            rows.append({**message_in.dict(), "author_id": user.id})
+    created = iter(insert_rows(db, Message, rows))
+    db.commit()
+
+    logger.info(f"{user} creating {len(rows)} messages")
+    return [result or BulkResult(id=next(created), status=201) for result in results]
+
+
+@router.put("/bulk", response_model=List[BulkResult])
+def update_messages(
+    update_in: MessageUpdateMany,
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["messages_update"]),
+) -> Any:
+    """Messages of the conversations the user takes part in"""
+    ids = unique_ids(update_in.ids)
+    rows = db.execute(
+        select(Message.id, ConversationUser.id.isnot(None))
+        .outerjoin(
+            ConversationUser,
+            and_(
+                ConversationUser.conversation_id == Message.conversation_id,
+                ConversationUser.user_id == user.id,
+            ),
+        )
+        .where(Message.id.in_(ids))
+        .with_for_update(of=Message)
+    )
+    writable, refused = authorize(
+        ids, {id: joined or user.is_superuser for id, joined in rows}
+    )
+    for chunk in chunked(writable):
+        db.execute(
+            update(Message)
+            .where(Message.id.in_(chunk))
+            .values(update_in.data.dict())
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+    logger.info(f"{user} updating {len(writable)} messages")
+    return bulk_results(ids, refused)
+
+
+@router.delete("/bulk", response_model=List[BulkResult])
+def delete_messages(
+    delete_in: BulkIds,
+    db: Session = Depends(get_db),
+    user: User = Security(manager, scopes=["messages_delete"]),
+) -> Any:
+    """Messages the user wrote"""
+    ids = unique_ids(delete_in.ids)
+    rows = db.execute(
+        select(Message.id, Message.author_id)
+        .where(Message.id.in_(ids))
+        .with_for_update()
+    )
+    writable, refused = authorize(
+        ids,
+        {id: author_id == user.id or user.is_superuser for id, author_id in rows},
+    )
+    for chunk in chunked(writable):
+        db.execute(
+            delete(Message)
+            .where(Message.id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+    db.commit()
+
+    logger.info(f"{user} deleting {len(writable)} messages")
+    return bulk_results(ids, refused)
+
+
 @router.put("/{message_id}", response_model=MessageSchema)
 def update_message(
     message_id: int,
@@ -2,14 +2,13 @@ from typing import Any, List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
 from app.deps.db import get_db
-from app.deps.scopes import query_scope_names_for_user
+from app.deps.scopes import query_scope_names_for_user, scope_catalog
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.scope import Scope
 from app.models.user import User
 from app.schemas.scope import Scope as ScopeSchema
@@ -27,13 +26,8 @@ def get_scopes(
     user: User = Security(manager, scopes=["scopes"]),
     request_params: RequestParams = Depends(parse_react_admin_params(Scope)),
 ) -> Any:
-    total = db.query(func.count(Scope.scope_name)).scalar()
-    query_scopes = db.query(Scope).order_by(request_params.order_by)
-    scopes = query_scopes.offset(request_params.skip).limit(request_params.limit).all()
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(scopes)}/{total}"
+    query_scopes = db.query(Scope)
+    scopes = paginate(response, query_scopes, request_params)
 
     logger.info(f"{user} getting all scopes")
     return scopes
@@ -53,21 +47,8 @@ def get_user_scopes(
 
     scope_names = query_scope_names_for_user(user_queried, db)
 
-    total = (
-        db.query(func.count(Scope.scope_name))
-        .filter(Scope.scope_name.in_(scope_names))
-        .scalar()
-    )
-    query_scopes = (
-        db.query(Scope)
-        .filter(Scope.scope_name.in_(scope_names))
-        .order_by(request_params.order_by)
-    )
-    scopes = query_scopes.offset(request_params.skip).limit(request_params.limit).all()
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(scopes)}/{total}"
+    query_scopes = db.query(Scope).filter(Scope.scope_name.in_(scope_names))
+    scopes = paginate(response, query_scopes, request_params)
 
     logger.info(f"{user} getting scopes for {user_queried}")
     return scopes
@@ -82,6 +63,7 @@ def create_scope(
     scope = Scope(**scope_in.dict())
     db.add(scope)
     db.commit()
+    scope_catalog.invalidate()
 
     logger.info(f"{user} creating scope {scope.scope_name}")
     return scope
@@ -102,6 +84,7 @@ def update_scope(
         setattr(scope, field, value)
     db.add(scope)
     db.commit()
+    scope_catalog.invalidate()
 
     logger.info(f"{user} updating scope {scope.scope_name}")
     return scope
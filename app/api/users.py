@@ -1,22 +1,26 @@
+from datetime import datetime
 from typing import Any, List, Optional
 from uuid import UUID
-from fastapi import HTTPException, Security
+from fastapi import BackgroundTasks, HTTPException, Security
 from fastapi.params import Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.routing import APIRouter
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 from fastapi_login.exceptions import InvalidCredentialsException
 
-from app.deps.db import get_db
-from app.deps.request_params import parse_react_admin_params
-from app.deps.scopes import query_default_scopes_names, query_scope_names_for_user
+from app.core.passwords import password_pool
+from app.deps.db import get_async_db, get_db
+from app.deps.request_params import paginate, parse_react_admin_params
+from app.deps.scopes import (
+    query_default_scopes_names,
+    query_scope_names_for_user_async,
+)
 from app.deps.users import (
     manager,
-    verify_password,
     validate_password,
-    get_password_hash,
+    rehash_password,
     query_user_by_username,
     query_user_by_email,
 )
@@ -31,33 +35,53 @@ router = APIRouter()
 
 
 @router.post("/login", status_code=200)
-def login(db: Session = Depends(get_db), data: OAuth2PasswordRequestForm = Depends()):
+async def login(
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_async_db),
+    data: OAuth2PasswordRequestForm = Depends(),
+):
     username = data.username
     password = data.password
 
-    user = query_user_by_username(username, db)
-    if not user or not verify_password(password, user.hashed_password):
+    password_pool.check_capacity()
+    user = await db.run_sync(lambda session: query_user_by_username(username, session))
+    if not user:
         raise InvalidCredentialsException
-    scope_names = query_scope_names_for_user(user, db)
+    # Returns the connection to the pool while bcrypt runs
+    await db.commit()
+    verified, outdated = await password_pool.verify(password, user.hashed_password)
+    if not verified:
+        raise InvalidCredentialsException
+    if outdated:
+        background_tasks.add_task(
+            rehash_password, user.id, user.hashed_password, password
+        )
+    scope_names = await query_scope_names_for_user_async(user, db)
 
     access_token = manager.create_access_token(
-        data={"sub": str(user.id)}, scopes=scope_names
+        data={"sub": str(user.id), "iat": datetime.utcnow(), "ver": user.token_version},
+        scopes=scope_names,
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @router.post("/register", response_model=UserSchema, status_code=201)
-def register(
+async def register(
     user_in: UserCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    existing_user = query_user_by_username(user_in.username, db)
+    password_pool.check_capacity()
+    existing_user = await db.run_sync(
+        lambda session: query_user_by_username(user_in.username, session)
+    )
     if existing_user is not None:
         raise HTTPException(
             status_code=400,
             detail=f"User with the username provided already exists",
         )
-    existing_user = query_user_by_email(user_in.email, db)
+    existing_user = await db.run_sync(
+        lambda session: query_user_by_email(user_in.email, session)
+    )
     if existing_user is not None:
         raise HTTPException(
             status_code=400,
@@ -65,21 +89,22 @@ def register(
         )
 
     validate_password(**user_in.dict())
-    hashed_password = get_password_hash(user_in.password)
+    await db.commit()
+    hashed_password = await password_pool.hash(user_in.password)
 
     user = User(
         username=user_in.username, email=user_in.email, hashed_password=hashed_password
     )
     db.add(user)
-    db.commit()
+    await db.commit()
     logger.info(f"{user} has registered.")
 
-    default_scopes = query_default_scopes_names(db)
+    default_scopes = await db.run_sync(query_default_scopes_names)
     for scope_name in default_scopes:
         user_scope = UserScope(user_id=user.id, scope_name=scope_name)
         db.add(user_scope)
 
-    db.commit()
+    await db.commit()
     logger.info(f"User default scopes for {user} has been added.")
 
     return user
@@ -92,13 +117,8 @@ def get_users(
     user: User = Security(manager, scopes=["users"]),
     request_params: request_params = Depends(parse_react_admin_params(User)),
 ) -> Any:
-    total = db.query(func.count(User.id)).scalar()
-    query_users = db.query(User).order_by(request_params.order_by)
-    users = query_users.offset(request_params.skip).limit(request_params.limit).all()
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(users)}/{total}"
+    query_users = db.query(User)
+    users = paginate(response, query_users, request_params)
 
     logger.info(f"{user} getting all users")
     return users
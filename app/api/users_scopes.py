@@ -2,13 +2,12 @@ from typing import Any, List, Optional
 from uuid import UUID
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
 from app.deps.db import get_db
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.user_scope import UserScope
 from app.models.user import User
 from app.schemas.user_scope import UserScope as UserScopeSchema, UserScopeDelete
@@ -26,15 +25,8 @@ def get_users_scopes(
     user: User = Security(manager, scopes=["users_scopes"]),
     request_params: RequestParams = Depends(parse_react_admin_params(UserScope)),
 ) -> Any:
-    total = db.query(func.count(UserScope.scope_name)).scalar()
-    query_users_scopes = db.query(UserScope).order_by(request_params.order_by)
-    users_scopes = (
-        query_users_scopes.offset(request_params.skip).limit(request_params.limit).all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(users_scopes)}/{total}"
+    query_users_scopes = db.query(UserScope)
+    users_scopes = paginate(response, query_users_scopes, request_params)
 
     logger.info(f"{user} getting all users_scopes")
     return users_scopes
@@ -52,23 +44,10 @@ def get_users_scopes_for_user(
     if not user_queried:
         raise HTTPException(404)
 
-    total = (
-        db.query(func.count(UserScope.user_id))
-        .filter(UserScope.user_id == user_queried.id)
-        .scalar()
-    )
-    query_users_scopes = (
-        db.query(UserScope)
-        .filter(UserScope.user_id == user_queried.id)
-        .order_by(request_params.order_by)
-    )
-    users_scopes = (
-        query_users_scopes.offset(request_params.skip).limit(request_params.limit).all()
+    query_users_scopes = db.query(UserScope).filter(
+        UserScope.user_id == user_queried.id
     )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(users_scopes)}/{total}"
+    users_scopes = paginate(response, query_users_scopes, request_params)
 
     logger.info(f"{user} getting users_scopes for user ID {user_queried.id}")
     return users_scopes
@@ -1,7 +1,11 @@
-from typing import Any
+from typing import Any, Dict, Union
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Security
 
+from app.core.cache import response_cache
+from app.db import pool_stats
+from app.deps.users import manager
+from app.models.user import User
 from app.schemas.msg import Msg
 
 router = APIRouter()
@@ -15,3 +19,24 @@ router = APIRouter()
 )
 def test_hello_world() -> Any:
     return {"msg": "Hello world!"}
+
+
+@router.get("/cache/stats", response_model=Dict[str, int], status_code=200)
+def get_cache_stats(
+    user: User = Security(manager),
+) -> Any:
+    """Response cache hits and misses per route"""
+    if not user.is_superuser:
+        raise HTTPException(401)
+    return response_cache.stats()
+
+
+@router.get("/db/pool-stats", response_model=Dict[str, Union[int, float]])
+def get_pool_stats(
+    user: User = Security(manager),
+) -> Any:
+    """Connection pool checkouts, time spent waiting for them and checkouts per
+    request"""
+    if not user.is_superuser:
+        raise HTTPException(401)
+    return pool_stats.as_dict()
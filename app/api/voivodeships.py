@@ -1,13 +1,13 @@
 from typing import Any, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Security
-from sqlalchemy import func
 from sqlalchemy.orm.session import Session
 from starlette.responses import Response
 
-from app.deps.db import get_db
+from app.deps.db import get_db, get_read_db
 from app.deps.users import manager
-from app.deps.request_params import parse_react_admin_params
+from app.deps.reference_data import reference_data
+from app.deps.request_params import paginate, parse_react_admin_params
 from app.models.voivodeship import Voivodeship
 from app.models.user import User
 from app.schemas.voivodeship import Voivodeship as VoivodeshipSchema, VoivodeshipDelete
@@ -21,20 +21,15 @@ router = APIRouter(prefix="/voivodeships")
 @router.get("", response_model=List[VoivodeshipSchema])
 def get_voivodeships(
     response: Response,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     request_params: RequestParams = Depends(parse_react_admin_params(Voivodeship)),
 ) -> Any:
-    total = db.query(func.count(Voivodeship.id)).scalar()
-    query_voivodeships = db.query(Voivodeship).order_by(request_params.order_by)
-    voivodeships = (
-        query_voivodeships.offset(request_params.skip).limit(request_params.limit).all()
-    )
-    response.headers["Access-Control-Expose-Headers"] = "Content-Range"
-    response.headers[
-        "Content-Range"
-    ] = f"{request_params.skip}-{request_params.skip + len(voivodeships)}/{total}"
-
     logger.info(f"Getting all voivodeships")
+    if not request_params.keyset:
+        return reference_data.paginate("voivodeships", request_params)
+
+    query_voivodeships = db.query(Voivodeship)
+    voivodeships = paginate(response, query_voivodeships, request_params)
     return voivodeships
 
 
@@ -47,6 +42,7 @@ def create_voivodeship(
     voivodeship = Voivodeship(**voivodeship_in.dict())
     db.add(voivodeship)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} creating voivodeship {voivodeship.name} (ID {voivodeship.id})")
     return voivodeship
@@ -67,6 +63,7 @@ def update_voivodeship(
         setattr(voivodeship, field, value)
     db.add(voivodeship)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} updating voivodeship ID {voivodeship.id}")
     return voivodeship
@@ -75,13 +72,12 @@ def update_voivodeship(
 @router.get("/{voivodeship_id}", response_model=VoivodeshipSchema)
 def get_voivodeship(
     voivodeship_id: int,
-    db: Session = Depends(get_db),
 ) -> Any:
-    voivodeship: Optional[Voivodeship] = db.get(Voivodeship, voivodeship_id)
-    if not voivodeship:
+    voivodeship = reference_data.get("voivodeships", voivodeship_id)
+    if voivodeship is None:
         raise HTTPException(404)
 
-    logger.info(f"Getting voivodeship ID {voivodeship.id}")
+    logger.info(f"Getting voivodeship ID {voivodeship_id}")
     return voivodeship
 
 
@@ -96,6 +92,7 @@ def delete_voivodeship(
         raise HTTPException(404)
     db.delete(voivodeship)
     db.commit()
+    reference_data.invalidate()
 
     logger.info(f"{user} deleting voivodeship ID {voivodeship.id}")
     return voivodeship
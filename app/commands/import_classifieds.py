@@ -0,0 +1,60 @@
+"""Imports classifieds from a CSV or NDJSON feed.
+
+Rows need title, content and price, and either category_id or a category
+name, and city_id or a city name, with a voivodeship name when the city's
+isn't unique. They are created for the given user, all of them in one
+transaction. Invalid rows are written to the rejects file as NDJSON.
+
+    python -m app.commands.import_classifieds feed.csv --user admin
+"""
+import argparse
+import os
+import sys
+import time
+
+from app.core.cache import response_cache
+from app.core.logger import logger
+from app.deps.db import DBSessionManager
+from app.deps.imports import IMPORT_FORMATS, import_classifieds, read_rows
+from app.deps.imports import text_feed
+from app.models.user import User
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="CSV or NDJSON file, - for stdin")
+    parser.add_argument("--user", required=True, help="Username of the seller")
+    parser.add_argument(
+        "--format", choices=IMPORT_FORMATS, help="By default from the file extension"
+    )
+    parser.add_argument("--rejects", default="rejects.ndjson", help="Rejects file")
+    args = parser.parse_args()
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+
+    with DBSessionManager() as db:
+        user = db.query(User).filter(User.username == args.user).first()
+        if not user:
+            raise SystemExit(f"User {args.user} not found")
+
+        source = text_feed(
+            sys.stdin.buffer if args.path == "-" else open(args.path, "rb")
+        )
+        started = time.monotonic()
+        with source, open(args.rejects, "w", encoding="utf-8") as rejects:
+            rows = read_rows(source, format)
+            imported, rejected = import_classifieds(db, rows, user.id, rejects)
+        elapsed = time.monotonic() - started
+    if not rejected:
+        os.remove(args.rejects)
+    if imported:
+        response_cache.invalidate("classifieds")
+
+    rate = f"{imported / elapsed:.0f} rows/s" if elapsed > 0 else "no time measured"
+    logger.info(
+        f"Imported {imported} classifieds from {args.path} in {elapsed:.1f} s "
+        f"({rate}), {rejected} rejected"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Bulk loads city coordinates from a CSV file.
+
+The file needs a header with voivodeship, name, latitude and longitude columns.
+Cities are matched by voivodeship and city name, existing ones get their
+coordinates updated and missing ones (and their voivodeships) are created.
+
+    python -m app.commands.load_cities cities.csv
+"""
+import argparse
+import csv
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm.session import Session
+
+from app.core.logger import logger
+from app.deps.db import DBSessionManager
+from app.deps.reference_data import reference_data
+from app.models.city import City
+from app.models.voivodeship import Voivodeship
+
+
+def parse_coordinates(latitude: str, longitude: str) -> Optional[Dict[str, float]]:
+    try:
+        coordinates = {"latitude": float(latitude), "longitude": float(longitude)}
+    except (TypeError, ValueError):
+        return None
+    # Also rules out NaN
+    if not (
+        -90 <= coordinates["latitude"] <= 90 and -180 <= coordinates["longitude"] <= 180
+    ):
+        return None
+    return coordinates
+
+
+def load_cities(db: Session, rows: Iterable[Dict[str, str]]) -> Tuple[int, int]:
+    """Upserts cities from CSV rows, returns the created and updated counts"""
+    voivodeships = {v.name: v for v in db.query(Voivodeship)}
+    cities = {
+        (voivodeship_name, name): id
+        for id, name, voivodeship_name in db.query(
+            City.id, City.name, Voivodeship.name
+        ).join(City.voivodeship)
+    }
+
+    # Keyed by city, so a city listed twice in the file is only written once
+    created, updated = {}, {}
+    for row in rows:
+        voivodeship_name, name = row["voivodeship"].strip(), row["name"].strip()
+        key = (voivodeship_name, name)
+        coordinates = parse_coordinates(row["latitude"], row["longitude"])
+        if coordinates is None:
+            logger.warning(
+                f"Skipping city {name} ({voivodeship_name}), invalid coordinates "
+                f"{row['latitude']!r}, {row['longitude']!r}"
+            )
+            continue
+
+        city_id = cities.get(key)
+        if city_id:
+            updated[key] = {"id": city_id, **coordinates}
+            continue
+
+        voivodeship = voivodeships.get(voivodeship_name)
+        if not voivodeship:
+            voivodeship = Voivodeship(name=voivodeship_name)
+            db.add(voivodeship)
+            db.flush()
+            voivodeships[voivodeship_name] = voivodeship
+        created[key] = {"name": name, "voivodeship_id": voivodeship.id, **coordinates}
+
+    db.bulk_insert_mappings(City, list(created.values()))
+    db.bulk_update_mappings(City, list(updated.values()))
+    db.commit()
+    reference_data.invalidate()
+    return len(created), len(updated)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="CSV file with the city coordinates")
+    args = parser.parse_args()
+
+    with open(args.path, newline="", encoding="utf-8") as f, DBSessionManager() as db:
+        created, updated = load_cities(db, csv.DictReader(f))
+
+    logger.info(f"Loaded cities from {args.path}: {created} created, {updated} updated")
+
+
+if __name__ == "__main__":
+    main()
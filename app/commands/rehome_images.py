@@ -0,0 +1,105 @@
+"""Moves images stored flat in the upload directory into content-addressed blobs.
+
+Runs while the service is up. Images are moved one per transaction: their
+files are linked into the blob, which serves them as soon as the image row
+points at it, then the old files are removed. Images with the same bytes end
+up sharing a blob.
+
+    python -m app.commands.rehome_images --limit 1000
+"""
+import argparse
+import hashlib
+import os
+import shutil
+from typing import Optional, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm.session import Session
+
+from app.core.logger import logger
+from app.deps.blobs import acquire_blob, blobs, remove_files
+from app.deps.db import DBSessionManager
+from app.deps.images import image_files
+from app.models.image import Image
+
+
+def hash_file(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def link_file(source: str, destination: str) -> None:
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        # Another filesystem
+        shutil.copyfile(source, destination)
+
+
+def rehome_image(db: Session, image: Image) -> bool:
+    """Moves the image into its blob, returns whether the blob was created"""
+    old_files = image_files(image)
+    checksum = hash_file(old_files[0])
+    created = db.execute(acquire_blob(checksum, image.extension)).scalar()
+    image.blob_checksum = checksum
+    for old_file, new_file in zip(old_files, image_files(image)):
+        if not os.path.exists(new_file):
+            link_file(old_file, new_file)
+    if image.size is not None:
+        # The blob's variants are the image's
+        db.execute(
+            update(blobs).where(blobs.c.checksum == checksum).values(processed=True)
+        )
+    db.commit()
+
+    remove_files(old_files)
+    return created
+
+
+def rehome_images(db: Session, limit: Optional[int] = None) -> Tuple[int, int]:
+    """Returns the counts of images moved and of blobs created for them"""
+    query_ids = (
+        db.query(Image.id).filter(Image.blob_checksum.is_(None)).order_by(Image.id)
+    )
+    image_ids = [image_id for image_id, in query_ids.limit(limit)]
+    db.rollback()
+
+    rehomed, created = 0, 0
+    for image_id in image_ids:
+        # Locked, an image deleted meanwhile is skipped
+        image = (
+            db.query(Image)
+            .filter(Image.id == image_id, Image.blob_checksum.is_(None))
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if not image:
+            db.rollback()
+            continue
+        try:
+            created += rehome_image(db, image)
+        except FileNotFoundError as e:
+            logger.error(f"Image (ID {image_id}) not rehomed ({e})")
+            db.rollback()
+            continue
+        rehomed += 1
+    return rehomed, created
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, help="Images moved at most")
+    args = parser.parse_args()
+
+    with DBSessionManager() as db:
+        rehomed, created = rehome_images(db, args.limit)
+
+    logger.info(f"Rehomed {rehomed} images into {created} new blobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import hashlib
+import json
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlencode
+
+from fastapi.routing import APIRoute
+from redis.exceptions import RedisError
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.redis import async_redis_client, redis_client
+
+# Varied by the client rather than by the cached body
+UNCACHED_HEADERS = {"content-length", "set-cookie"}
+
+
+def normalize_query(query_string: str) -> str:
+    """Sorts the query parameters and re-serializes JSON values (react-admin's
+    sort, range and filter), so equivalent queries share a cache entry"""
+    params = []
+    for name, value in parse_qsl(query_string, keep_blank_values=True):
+        try:
+            value = json.dumps(json.loads(value), sort_keys=True, separators=(",", ":"))
+        except ValueError:
+            pass
+        params.append((name, value))
+    return urlencode(sorted(params))
+
+
+class ResponseCache:
+    """Serialized responses in Redis, invalidated by tag.
+
+    Every entry is added to a set per tag, invalidating a tag deletes the
+    entries in its set. Entries expire after `response_cache_ttl` anyway."""
+
+    prefix = "response_cache"
+
+    def key(self, request: Request) -> str:
+        query = normalize_query(request.url.query)
+        digest = hashlib.sha1(f"{request.url.path}?{query}".encode()).hexdigest()
+        return f"{self.prefix}:{digest}"
+
+    def tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    async def get(self, route: str, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            cached = await async_redis_client.get(key)
+            await async_redis_client.hincrby(
+                f"{self.prefix}:stats", f"{route}:{'hits' if cached else 'misses'}"
+            )
+        except RedisError as e:
+            logger.warning(f"Response cache unavailable ({e})")
+            return None
+        return json.loads(cached) if cached else None
+
+    async def set(self, key: str, response: Response, tags: List[str]) -> None:
+        headers = [
+            (name, value)
+            for name, value in response.headers.items()
+            if name not in UNCACHED_HEADERS
+        ]
+        value = json.dumps({"body": response.body.decode(), "headers": headers})
+        try:
+            async with async_redis_client.pipeline(transaction=False) as pipe:
+                pipe.set(key, value, ex=settings.response_cache_ttl)
+                for tag in tags:
+                    pipe.sadd(self.tag_key(tag), key)
+                    pipe.expire(self.tag_key(tag), settings.response_cache_ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"Response cache unavailable ({e})")
+
+    def invalidate(self, *tags: str) -> None:
+        try:
+            tag_keys = [self.tag_key(tag) for tag in tags]
+            with redis_client.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                keys = set().union(*pipe.execute())
+            redis_client.delete(*keys, *tag_keys)
+        except RedisError as e:
+            logger.warning(f"Response cache unavailable, not invalidated {tags} ({e})")
+
+    async def invalidate_async(self, *tags: str) -> None:
+        """invalidate for async endpoints, without blocking the event loop"""
+        try:
+            tag_keys = [self.tag_key(tag) for tag in tags]
+            async with async_redis_client.pipeline(transaction=False) as pipe:
+                for tag_key in tag_keys:
+                    pipe.smembers(tag_key)
+                keys = set().union(*await pipe.execute())
+            await async_redis_client.delete(*keys, *tag_keys)
+        except RedisError as e:
+            logger.warning(f"Response cache unavailable, not invalidated {tags} ({e})")
+
+    def stats(self) -> Dict[str, int]:
+        stats = redis_client.hgetall(f"{self.prefix}:stats")
+        return {name.decode(): int(count) for name, count in stats.items()}
+
+    def clear(self) -> None:
+        keys = list(redis_client.scan_iter(f"{self.prefix}:*"))
+        if keys:
+            redis_client.delete(*keys)
+
+
+response_cache = ResponseCache()
+
+
+def cached(*tags: str) -> Callable:
+    """Caches the responses of an endpoint of a CachedRoute router, tags are
+    formatted with the path parameters ("classified:{classified_id}")"""
+
+    def decorator(endpoint: Callable) -> Callable:
+        endpoint.cache_tags = tags
+        return endpoint
+
+    return decorator
+
+
+class CachedRoute(APIRoute):
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        tags = getattr(self.endpoint, "cache_tags", None)
+        if tags is None:
+            return handler
+
+        async def cached_handler(request: Request) -> Response:
+            # Clients which just wrote read their writes from the database
+            if request.cookies.get(settings.read_primary_cookie):
+                return await handler(request)
+
+            key = response_cache.key(request)
+            cached_response = await response_cache.get(self.path, key)
+            if cached_response:
+                response = Response(cached_response["body"])
+                response.raw_headers = [
+                    (name.encode("latin-1"), value.encode("latin-1"))
+                    for name, value in cached_response["headers"]
+                ]
+                response.headers["Content-Length"] = str(len(response.body))
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response = await handler(request)
+            if response.status_code == 200:
+                tag_values = [tag.format(**request.path_params) for tag in tags]
+                await response_cache.set(key, response, tag_values)
+            response.headers["X-Cache"] = "MISS"
+            return response
+
+        return cached_handler
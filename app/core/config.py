@@ -1,6 +1,6 @@
 import logging
 import sys
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseSettings, PostgresDsn, RedisDsn, validator
 from pydantic.networks import AnyHttpUrl
@@ -10,10 +10,27 @@ class Settings(BaseSettings):
     # Authorization
     access_token_expire_minutes: int = 7 * 24 * 60  # 7 days
 
+    # Password hashing, in a pool of processes
+    password_bcrypt_rounds: int = 12  # older hashes are rehashed on login
+    password_workers: int = 2
+    password_workers_niceness: int = 10
+    password_max_pending: int = 32  # more concurrent logins are refused (503)
+
     # Images upload
     images_max_size: int = 5_000_000  # 5 MB
     images_content_types: List[str] = ["image/png", "image/jpeg"]
     images_upload_path: str = "uploads/"
+    # Resized copies served by /images/file/{id}?w=, wider ones than the original are skipped
+    images_variant_widths: List[int] = [160, 320, 640, 1280]
+    images_variant_formats: List[Literal["webp", "jpeg"]] = ["webp", "jpeg"]
+    images_variant_quality: int = 80
+    images_base64_batch_max: int = 50  # images per /images/base64 request
+    images_cache_max_age: int = 365 * 24 * 60 * 60  # seconds, file names never change
+
+    # Who sends file bytes: this process, or nginx (X-Accel-Redirect, resolved
+    # under files_accel_redirect_prefix) or Apache/lighttpd (X-Sendfile)
+    files_sender: Literal["python", "x-accel-redirect", "x-sendfile"] = "python"
+    files_accel_redirect_prefix: str = "/protected/uploads/"
 
     # Logging config
     logging_path: str = "logs/{time}.log"
@@ -25,10 +42,52 @@ class Settings(BaseSettings):
         "request id: {extra[request_id]} - <cyan>{name}</cyan>:<cyan>{function}</cyan> - <level>{message}</level>"
     )
 
+    # Bulk create, update and delete endpoints, in one transaction
+    bulk_max_items: int = 10_000  # items per request
+    bulk_chunk_size: int = 1000  # rows per INSERT, UPDATE or DELETE statement
+
+    # Classified imports, see app.deps.imports
+    imports_batch_size: int = 10_000  # rows validated and copied at a time
+    imports_rejects_path: str = "imports/rejects/"
+
+    # Lists filtered on a list of ids (react-admin getMany)
+    filter_max_ids: int = 1000  # ids per request
+
+    # List counts (Content-Range totals)
+    count_strategy: Literal["exact", "estimated", "cached"] = "exact"
+    count_estimate_threshold: int = 1000  # smaller estimates are counted exactly
+    count_cache_ttl: int = 60  # seconds
+
+    # Response cache of public endpoints
+    response_cache_ttl: int = 60  # seconds
+
+    # In-process cache of categories, voivodeships and cities
+    reference_data_max_age: int = 600  # seconds, in case an invalidation is missed
+
+    # Users loaded for authentication, cached per process and in Redis
+    user_cache_ttl: int = 60  # seconds
+    user_cache_size: int = 10_000
+    user_cache_redis: bool = True
+
+    # Search
+    suggest_max_age: int = 60  # seconds clients may cache title suggestions
+    nearby_max_radius_km: float = 200
+    facets_refresh_minutes: int = 5  # how often unfiltered facet counts refresh
+
     # Databases
     test_database_url: Optional[PostgresDsn]
     database_url: PostgresDsn
     redis_url: RedisDsn = "redis://@localhost:6379/"
+    redis_socket_timeout: float = 0.5
+    redis_reconnect_seconds: float = 5  # pub/sub listeners
+
+    # Read replicas, read-only handlers are spread over the healthy ones
+    database_replica_urls: List[PostgresDsn] = []
+    replica_health_check_interval: float = 5  # seconds
+    replica_health_check_timeout: float = 2  # seconds
+    # Reads go to the primary for this long after a user's own write
+    read_primary_cookie: str = "read_primary"
+    read_primary_seconds: int = 10
 
     @validator("database_url", pre=True)
     def build_test_database_url(cls, v: Optional[str], values: Dict[str, Any]):
@@ -0,0 +1,131 @@
+import base64
+import os
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+
+from app.core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+# A multiple of 3, the encodings of successive chunks concatenate
+BASE64_CHUNK_SIZE = 48 * 1024
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match comparison, weak as the RFC asks for"""
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in [
+        tag[2:] if tag.startswith("W/") else tag for tag in tags
+    ]
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """The first and last byte of a single `bytes=` range. None when the header
+    isn't one, the whole file is sent then. Raises ValueError when the range
+    starts past the end of the file."""
+    unit, _, ranges = header.partition("=")
+    first, _, last = ranges.strip().partition("-")
+    if (
+        unit.strip() != "bytes"
+        or not (first or last)
+        or (first and not first.isdigit())
+        or (last and not last.isdigit())
+    ):
+        return None
+
+    if not first:
+        # The last `last` bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+async def read_file(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        while length > 0:
+            chunk = await f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+async def encode_base64(file: anyio.AsyncFile) -> AsyncIterator[bytes]:
+    """The rest of the file base64 encoded, without holding more than a chunk"""
+    rest = b""
+    while True:
+        chunk = await file.read(BASE64_CHUNK_SIZE)
+        if not chunk:
+            break
+        if rest:
+            chunk = rest + chunk
+        aligned = len(chunk) - len(chunk) % 3
+        rest = chunk[aligned:]
+        yield base64.b64encode(chunk[:aligned])
+    if rest:
+        yield base64.b64encode(rest)
+
+
+def send_file(
+    request: Request,
+    path: str,
+    media_type: str,
+    etag: str,
+    cache_control: str,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """A file with validators and caching headers, honouring If-None-Match and
+    Range. Unless `files_sender` is python, the web server in front sends the
+    bytes, told where by an X-Accel-Redirect (nginx) or X-Sendfile header."""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        **(headers or {}),
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=headers)
+
+    if settings.files_sender == "x-accel-redirect":
+        # Relative to the upload directory, keeping the blob shard directories
+        location = os.path.relpath(path, settings.images_upload_path)
+        headers[
+            "X-Accel-Redirect"
+        ] = f"{settings.files_accel_redirect_prefix}{location}"
+        return Response(media_type=media_type, headers=headers)
+    if settings.files_sender == "x-sendfile":
+        headers["X-Sendfile"] = os.path.abspath(path)
+        return Response(media_type=media_type, headers=headers)
+
+    try:
+        size = os.stat(path).st_size
+    except FileNotFoundError:
+        raise HTTPException(404)
+    byte_range = None
+    if "range" in request.headers and request.headers.get("if-range", etag) == etag:
+        try:
+            byte_range = parse_range(request.headers["range"], size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return StreamingResponse(
+        read_file(path, start, end - start + 1),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=headers,
+    )
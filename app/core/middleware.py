@@ -0,0 +1,76 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.db import PrimarySessions, pool_stats, request_sessions
+
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class ReadYourWritesMiddleware:
+    """Sets a short-lived cookie after a successful write, requests carrying it
+    read from the primary, so clients see their own writes despite replica lag"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    "Set-Cookie",
+                    f"{settings.read_primary_cookie}=1; "
+                    f"Max-Age={settings.read_primary_seconds}; Path=/; "
+                    "HttpOnly; SameSite=Lax",
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+class PoolCheckoutMiddleware:
+    """Counts the pooled connections each request checks out"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        counter = pool_stats.start_request()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool_stats.finish_request(counter)
+            if counter[0] > 1:
+                logger.debug(
+                    f"{scope['method']} {scope['path']} checked out {counter[0]} connections"
+                )
+
+
+class PrimarySessionsMiddleware:
+    """Gives each request its PrimarySessions, closed once the response is sent"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        sessions = PrimarySessions()
+        token = request_sessions.set(sessions)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            await sessions.close()
+            request_sessions.reset(token)
@@ -0,0 +1,105 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from app.core.config import settings
+from app.core.logger import logger
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=settings.password_bcrypt_rounds,
+)
+
+
+# Run in the pool's processes
+def lower_priority() -> None:
+    # Request handling wins over hashing when CPUs are scarce
+    os.nice(settings.password_workers_niceness)
+
+
+def hash_password(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+class PasswordPool:
+    """bcrypt in a few worker processes, so hashing neither holds threadpool
+    threads nor the GIL of the API process.
+
+    At most `password_max_pending` calls are queued or running, more are
+    refused right away with a 503 instead of piling up behind a login burst."""
+
+    def __init__(self):
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                # Spawned, forking a process running threads and an event loop
+                # could copy locks held by another thread
+                self.executor = ProcessPoolExecutor(
+                    settings.password_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=lower_priority,
+                )
+            return self.executor
+
+    def check_capacity(self) -> None:
+        """Raises the 503 before a handler does any work for a call that
+        would be refused anyway"""
+        if self.pending >= settings.password_max_pending:
+            logger.warning(f"Password pool overloaded ({self.pending} pending)")
+            raise HTTPException(
+                503, "Too many login attempts, retry later", {"Retry-After": "1"}
+            )
+
+    async def run(self, function: Callable, *args: Any) -> Any:
+        with self.lock:
+            self.check_capacity()
+            self.pending += 1
+        try:
+            future = self.get_executor().submit(function, *args)
+            return await asyncio.wrap_future(future)
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, password: str, hashed_password: str) -> Tuple[bool, bool]:
+        """Whether the password matches, and whether the hash should be
+        recomputed with the current cost factor"""
+        verified = await self.run(verify_password, password, hashed_password)
+        return verified, verified and pwd_context.needs_update(hashed_password)
+
+    async def start(self) -> None:
+        """Spawns the processes, which import the app, before logins arrive"""
+        executor = self.get_executor()
+        await asyncio.gather(
+            *[
+                asyncio.wrap_future(executor.submit(os.getpid))
+                for _ in range(settings.password_workers)
+            ]
+        )
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+
+password_pool = PasswordPool()
@@ -0,0 +1,37 @@
+import asyncio
+from typing import Callable, Optional
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from redis.exceptions import RedisError
+
+from app.core.config import settings
+from app.core.logger import logger
+
+redis_client = Redis.from_url(
+    settings.redis_url,
+    socket_timeout=settings.redis_socket_timeout,
+    socket_connect_timeout=settings.redis_socket_timeout,
+)
+
+async_redis_client = AsyncRedis.from_url(
+    settings.redis_url,
+    socket_timeout=settings.redis_socket_timeout,
+    socket_connect_timeout=settings.redis_socket_timeout,
+)
+
+
+async def listen(channel: str, handle: Callable[[Optional[bytes]], None]) -> None:
+    """Calls `handle` with the data of every message published on the channel,
+    and with None after (re)connecting since messages may have been missed"""
+    while True:
+        try:
+            async with async_redis_client.pubsub() as pubsub:
+                await pubsub.subscribe(channel)
+                handle(None)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        handle(message["data"])
+        except RedisError as e:
+            logger.warning(f"Listener of {channel} disconnected ({e})")
+            await asyncio.sleep(settings.redis_reconnect_seconds)
@@ -1,12 +1,16 @@
 import asyncio
+from typing import Any, Optional
 
+from aioredis.errors import RedisError
 from aioredis.util import parse_url
 from arq.worker import create_worker
-from arq.connections import RedisSettings
+from arq.connections import ArqRedis, RedisSettings, create_pool
 from arq import cron
 
 from app.core.config import settings
-from app.deps.classifieds import hide_expired_classifieds
+from app.core.logger import logger
+from app.deps.classifieds import hide_expired_classifieds, refresh_classified_facets
+from app.deps.images import process_image
 
 
 def redis_settings_from_uri(uri: str) -> RedisSettings:
@@ -18,8 +22,15 @@ def redis_settings_from_uri(uri: str) -> RedisSettings:
 
 
 class WorkerSettings:
-    functions = [hide_expired_classifieds]
-    cron_jobs = [cron(hide_expired_classifieds, hour=3, minute=30, unique=True)]
+    functions = [hide_expired_classifieds, refresh_classified_facets, process_image]
+    cron_jobs = [
+        cron(hide_expired_classifieds, hour=3, minute=30, unique=True),
+        cron(
+            refresh_classified_facets,
+            minute=set(range(0, 60, settings.facets_refresh_minutes)),
+            unique=True,
+        ),
+    ]
     redis_settings = redis_settings_from_uri(uri=settings.redis_url)
 
 
@@ -37,3 +48,27 @@ class Worker:
 
 
 arq_worker = Worker()
+
+
+class JobQueue:
+    """Enqueues jobs for the worker, connecting to Redis on first use"""
+
+    def __init__(self):
+        self.pool: Optional[ArqRedis] = None
+
+    async def enqueue(self, function: str, *args: Any, **kwargs: Any) -> None:
+        try:
+            if self.pool is None:
+                self.pool = await create_pool(WorkerSettings.redis_settings)
+            await self.pool.enqueue_job(function, *args, **kwargs)
+        except (OSError, RedisError) as e:
+            logger.warning(f"Job {function} not enqueued ({e})")
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+
+job_queue = JobQueue()
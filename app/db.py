@@ -1,14 +1,221 @@
-import databases
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import DeclarativeMeta, declarative_base
-from sqlalchemy.orm import registry, sessionmaker
+from sqlalchemy.orm import Session, registry, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from app.core.config import settings
+from app.core.logger import logger
+
+
+def async_url(url: str) -> URL:
+    return make_url(url).set(drivername="postgresql+asyncpg")
+
+
+class PoolStats:
+    """Connection checkouts of all pools, the time spent waiting for them and
+    how many connections requests checked out"""
+
+    def __init__(self):
+        self.request_checkouts: ContextVar[Optional[List[int]]] = ContextVar(
+            "request_checkouts", default=None
+        )
+        self.reset()
+
+    def reset(self) -> None:
+        self.checkouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.checkouts_per_request: Dict[int, int] = {}
+
+    def record_checkout(self, wait_seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds += wait_seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, wait_seconds)
+        counter = self.request_checkouts.get()
+        if counter is not None:
+            counter[0] += 1
+
+    def start_request(self) -> List[int]:
+        # A list, so checkouts in threadpool copies of the context are counted
+        counter = [0]
+        self.request_checkouts.set(counter)
+        return counter
+
+    def finish_request(self, counter: List[int]) -> None:
+        count = counter[0]
+        self.checkouts_per_request[count] = self.checkouts_per_request.get(count, 0) + 1
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "checkouts": self.checkouts,
+            "wait_seconds": self.wait_seconds,
+            "max_wait_seconds": self.max_wait_seconds,
+            "mean_wait_seconds": self.wait_seconds / self.checkouts
+            if self.checkouts
+            else 0.0,
+            **{
+                f"requests_with_{count}_checkouts": requests
+                for count, requests in sorted(self.checkouts_per_request.items())
+            },
+        }
+
 
-engine = create_engine(settings.database_url, future=True, pool_size=15, max_overflow=5)
+pool_stats = PoolStats()
+
+
+class TimedPoolMixin:
+    # _do_get blocks until a connection is free (or the pool timeout expires)
+    def _do_get(self):
+        start = time.perf_counter()
+        connection = super()._do_get()
+        pool_stats.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+engine = create_engine(
+    settings.database_url,
+    future=True,
+    pool_size=15,
+    max_overflow=5,
+    poolclass=TimedQueuePool,
+)
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False)
 
+async_engine = create_async_engine(
+    async_url(settings.database_url),
+    pool_size=15,
+    max_overflow=5,
+    poolclass=TimedAsyncAdaptedQueuePool,
+)
+# Objects stay usable after commit, lazy loads would need an await
+AsyncSessionLocal = sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autocommit=False,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+class PrimarySessions:
+    """The request's sessions on the primary, opened on first use. The handler's
+    get_db or get_async_db and the user loader share them, whichever runs first,
+    and PrimarySessionsMiddleware closes them at the end of the request."""
+
+    def __init__(self):
+        self.session: Optional[Session] = None
+        self.async_session: Optional[AsyncSession] = None
+
+    def get(self) -> Session:
+        if self.session is None:
+            self.session = SessionLocal(future=True)
+        return self.session
+
+    def get_async(self) -> AsyncSession:
+        if self.async_session is None:
+            self.async_session = AsyncSessionLocal()
+        return self.async_session
+
+    async def close(self) -> None:
+        if self.session is not None:
+            self.session.close()
+        if self.async_session is not None:
+            await self.async_session.close()
+
+
+request_sessions: ContextVar[Optional[PrimarySessions]] = ContextVar(
+    "request_sessions", default=None
+)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = make_url(url)
+        self.engine = create_engine(
+            url, future=True, pool_size=15, max_overflow=5, poolclass=TimedQueuePool
+        )
+        self.async_engine = create_async_engine(
+            async_url(url),
+            pool_size=15,
+            max_overflow=5,
+            poolclass=TimedAsyncAdaptedQueuePool,
+        )
+        self.healthy = True
+
+    def __repr__(self):
+        return f"Replica({self.url.render_as_string(hide_password=True)})"
+
+    async def check(self) -> None:
+        try:
+            async with self.async_engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+            healthy = True
+        except (SQLAlchemyError, OSError) as e:
+            logger.warning(f"{self} health check failed ({e})")
+            healthy = False
+
+        if healthy != self.healthy:
+            logger.warning(f"{self} is {'up' if healthy else 'down'}")
+        self.healthy = healthy
+
+
+class ReplicaSet:
+    """Round-robin over the read replicas that passed their last health check"""
+
+    def __init__(self, urls: List[str]):
+        self.replicas = [Replica(url) for url in urls]
+        self.counter = itertools.count()
+
+    def __bool__(self):
+        return bool(self.replicas)
+
+    def choose(self) -> Optional[Replica]:
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self.counter) % len(healthy)]
+
+    async def check(self) -> None:
+        async def check_replica(replica: Replica):
+            try:
+                await asyncio.wait_for(
+                    replica.check(), settings.replica_health_check_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(f"{replica} health check timed out")
+                replica.healthy = False
+
+        await asyncio.gather(*[check_replica(replica) for replica in self.replicas])
+
+    async def monitor(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(settings.replica_health_check_interval)
+
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            replica.engine.dispose()
+            await replica.async_engine.dispose()
+
+
+replicas = ReplicaSet(settings.database_replica_urls)
+
 mapper_registry = registry()
 Base: DeclarativeMeta = declarative_base()
-
-database = databases.Database(settings.database_url)
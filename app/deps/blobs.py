@@ -0,0 +1,63 @@
+import os
+from typing import List
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql.expression import Insert
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.models.image_blob import ImageBlob
+
+blobs = ImageBlob.__table__
+
+
+def blob_path(checksum: str, extension: str, suffix: str = "") -> str:
+    """Two levels of directories by hash prefix, 65536 in all, so none of them
+    grows past a few hundred files per million blobs"""
+    return (
+        f"{settings.images_upload_path}{checksum[:2]}/{checksum[2:4]}/"
+        f"{checksum}{suffix}{extension}"
+    )
+
+
+def incoming_path() -> str:
+    """Where uploads are written before their checksum is known"""
+    path = f"{settings.images_upload_path}incoming/"
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def acquire_blob(checksum: str, extension: str) -> Insert:
+    """Statement referencing the blob, created if needed. It returns whether it
+    was created, the caller then stores the file. Until the transaction ends,
+    the blob can't be released by anyone else."""
+    # xmax is 0 for rows inserted by this statement, and set for updated ones
+    return (
+        insert(blobs)
+        .values(checksum=checksum, extension=extension, refcount=1, processed=False)
+        .on_conflict_do_update(
+            index_elements=[blobs.c.checksum],
+            set_={"refcount": blobs.c.refcount + 1},
+        )
+        .returning(literal_column("xmax = 0"))
+    )
+
+
+def store_blob(path: str, checksum: str, extension: str, created: bool) -> None:
+    """Moves an uploaded file to its blob, or drops it when the blob already
+    has a file"""
+    destination = blob_path(checksum, extension)
+    if created or not os.path.exists(destination):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(path, destination)
+    else:
+        os.remove(path)
+
+
+def remove_files(paths: List[str]) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            logger.error(f"File {path} not found when deleting it")
@@ -0,0 +1,72 @@
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, insert, select
+from sqlalchemy.ext.declarative import DeclarativeMeta
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.schema import Column
+
+from app.core.config import settings
+from app.schemas.bulk import BulkResult
+
+
+def check_bulk_size(count: int) -> None:
+    if count > settings.bulk_max_items:
+        raise HTTPException(400, f"At most {settings.bulk_max_items} items per request")
+
+
+def unique_ids(ids: List[int]) -> List[int]:
+    check_bulk_size(len(ids))
+    return list(dict.fromkeys(ids))
+
+
+def chunked(items: Sequence[Any]) -> Iterator[Sequence[Any]]:
+    """Items in chunks of `bulk_chunk_size`, a statement each"""
+    for start in range(0, len(items), settings.bulk_chunk_size):
+        yield items[start : start + settings.bulk_chunk_size]
+
+
+def existing_ids(db: Session, column: Column, ids: Iterable[Any]) -> Set[Any]:
+    return set(db.execute(select(column).where(column.in_(set(ids)))).scalars())
+
+
+def insert_rows(db: Session, model: DeclarativeMeta, rows: List[Dict]) -> List[int]:
+    """Inserts the rows, a multi-row INSERT per chunk, returns their ids"""
+    if not rows:
+        return []
+    # Taken from the sequence beforehand, the order of RETURNING rows isn't
+    # guaranteed to be the one of the VALUES list
+    table = model.__table__
+    sequence = func.pg_get_serial_sequence(table.name, table.c.id.name)
+    ids = list(
+        db.execute(
+            select(func.nextval(sequence)).select_from(
+                func.generate_series(1, len(rows))
+            )
+        ).scalars()
+    )
+    for chunk in chunked([{**row, "id": id} for row, id in zip(rows, ids)]):
+        db.execute(insert(model).values(list(chunk)))
+    return ids
+
+
+def authorize(
+    ids: List[int], allowed: Dict[int, bool]
+) -> Tuple[List[int], Dict[int, BulkResult]]:
+    """Splits the ids into the ones the user may write, given for those found,
+    and the results of the others"""
+    writable, refused = [], {}
+    for id in ids:
+        if id not in allowed:
+            refused[id] = BulkResult(id=id, status=404, detail="Not Found")
+        elif not allowed[id]:
+            refused[id] = BulkResult(id=id, status=401, detail="Unauthorized")
+        else:
+            writable.append(id)
+    return writable, refused
+
+
+def bulk_results(
+    ids: List[int], refused: Dict[int, BulkResult], status: int = 200
+) -> List[BulkResult]:
+    return [refused.get(id) or BulkResult(id=id, status=status) for id in ids]
@@ -1,12 +1,243 @@
+from collections import defaultdict
 from datetime import timedelta
+from typing import Any, Dict, List, Optional, Set
 
+from fastapi import HTTPException, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, load_only
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.expression import Select, select, text, true
+from sqlalchemy.sql.functions import func
+
+from app.models.city import City
 from app.models.classified import Classified, ClassifiedStatus
+from app.models.classified_facet import PRICE_BUCKETS, classified_facets
+from app.models.classified_facet import classified_facets_query
+from app.models.image import Image
+from app.models.user import User
+from app.schemas.classified import Classified as ClassifiedSchema
+from app.schemas.classified import ClassifiedPartial
+from app.core.cache import response_cache
 from app.core.config import settings
 from app.core.logger import logger
 from app.deps.db import DBSessionManager
+from app.deps.filters import FilterField, FilterSpec
 
 expire_time = timedelta(days=settings.classified_expire_time_days)
 
+range_operators = ("gt", "gte", "lt", "lte")
+
+classified_filters = FilterSpec(
+    Classified.__table__,
+    fields={
+        "price": FilterField(Classified.price, range_operators),
+        "category_id": FilterField(Classified.category_id, ("eq", "in")),
+        "city_id": FilterField(Classified.city_id, ("eq", "in")),
+        "voivodeship_id": FilterField(
+            City.voivodeship_id, ("eq", "in"), through=(Classified.city_id, City.id)
+        ),
+        "status": FilterField(Classified.status),
+        "user_id": FilterField(Classified.user_id),
+        "created": FilterField(Classified.created, range_operators),
+        "updated": FilterField(Classified.updated, range_operators),
+    },
+    sortable=["id", "created", "updated", "price"],
+)
+
+expansions = ("city", "voivodeship", "category", "user", "first_image")
+
+classified_fields = tuple(ClassifiedSchema.__fields__)
+# What listings return by default, content can be up to 8 KB
+summary_fields = tuple(field for field in classified_fields if field != "content")
+
+headline_options = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=24"
+
+installed_extensions: Dict[str, bool] = {}
+
+
+def search_query(q: str):
+    """Parses a web search string against both the Polish and simple configs"""
+    return func.websearch_to_tsquery("polish", q).op("||")(
+        func.websearch_to_tsquery("simple", q)
+    )
+
+
+def extension_installed(db: Session, name: str) -> bool:
+    """Whether a Postgres extension is installed, checked once per process"""
+    if name not in installed_extensions:
+        installed_extensions[name] = (
+            db.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = :name"), {"name": name}
+            ).first()
+            is not None
+        )
+    return installed_extensions[name]
+
+
+def set_similarity_threshold(db: Session, similarity: float):
+    """Sets the pg_trgm word similarity threshold for the current transaction"""
+    db.execute(
+        select(
+            func.set_config("pg_trgm.word_similarity_threshold", str(similarity), True)
+        )
+    )
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def count_facets(db: Session, filters: List[Any]) -> Dict[str, List[Dict]]:
+    """Facet counts for the filters, unfiltered ones come from the materialized
+    view instead of a scan of all active classifieds"""
+    if filters:
+        rows = db.execute(classified_facets_query(*filters))
+    else:
+        rows = db.execute(select(classified_facets))
+
+    facets = defaultdict(list)
+    for facet, value, count in rows:
+        if facet == "price":
+            facets[facet].append(
+                {
+                    "min": PRICE_BUCKETS[value - 1] if value > 0 else None,
+                    "max": PRICE_BUCKETS[value] if value < len(PRICE_BUCKETS) else None,
+                    "count": count,
+                    "value": value,
+                }
+            )
+        else:
+            facets[facet].append({"value": value, "count": count})
+
+    for facet, counts in facets.items():
+        if facet == "price":
+            counts.sort(key=lambda c: c["value"])
+        else:
+            counts.sort(key=lambda c: (-c["count"], c["value"]))
+    return facets
+
+
+def parse_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Comma separated fields to return, `*` for all of them. "
+        f"By default {', '.join(summary_fields)}",
+    )
+) -> List[str]:
+    if not fields:
+        return list(summary_fields)
+    if fields.strip() == "*":
+        return list(classified_fields)
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unsupported = names.difference(classified_fields)
+    if unsupported:
+        raise HTTPException(400, f"Unsupported fields {', '.join(sorted(unsupported))}")
+    # The id is always returned
+    return [field for field in classified_fields if field in names or field == "id"]
+
+
+def projection_options(fields: List[str], sort_column: str) -> List[Any]:
+    """Loads only the fields' columns, and the one sorted on, which cursors are
+    made of"""
+    columns = dict.fromkeys([*fields, sort_column])
+    return [load_only(*[getattr(Classified, column) for column in columns])]
+
+
+def classified_values(classified: Classified, fields: List[str]) -> Dict[str, Any]:
+    # Deferred columns aren't touched, they'd be loaded one query per row
+    return {field: getattr(classified, field) for field in fields}
+
+
+def parse_expand(
+    expand: Optional[str] = Query(
+        None,
+        description=f"Comma separated relations to include: {', '.join(expansions)}",
+    )
+) -> Set[str]:
+    names = {name.strip() for name in (expand or "").split(",") if name.strip()}
+    unsupported = names.difference(expansions)
+    if unsupported:
+        raise HTTPException(400, f"Unsupported expand {', '.join(sorted(unsupported))}")
+    return names
+
+
+def expand_options(expand: Set[str]) -> List[Any]:
+    """Loader options joining the expanded relations into the classifieds' query.
+    All are many-to-one, so the page's LIMIT still applies to classifieds, and
+    their foreign keys are NOT NULL, so inner joins."""
+    options = []
+    if "voivodeship" in expand:
+        options.append(
+            joinedload(Classified.city, innerjoin=True).joinedload(
+                City.voivodeship, innerjoin=True
+            )
+        )
+    elif "city" in expand:
+        options.append(joinedload(Classified.city, innerjoin=True))
+    if "category" in expand:
+        options.append(joinedload(Classified.category, innerjoin=True))
+    if "user" in expand:
+        options.append(joinedload(Classified.user, innerjoin=True))
+    return options
+
+
+def first_images_query(classified_ids: List[int]) -> Select:
+    """Ids of the classifieds' first images, an index probe per classified
+    (ix_images_classified_id_id) rather than reading all of their images"""
+    first_image = (
+        select(Image.id)
+        .where(Image.classified_id == Classified.id)
+        .order_by(Image.id)
+        .limit(1)
+        .lateral()
+    )
+    return (
+        select(Classified.id, first_image.c.id)
+        .join(first_image, true())
+        .where(Classified.id.in_(classified_ids))
+    )
+
+
+async def expand_classifieds(
+    db: AsyncSession,
+    classifieds: List[Classified],
+    fields: List[str],
+    expand: Set[str],
+) -> List[ClassifiedPartial]:
+    """Classifieds loaded with projection_options and expand_options, their
+    first images are fetched with a single query"""
+    first_images = {}
+    if "first_image" in expand and classifieds:
+        result = await db.execute(first_images_query([c.id for c in classifieds]))
+        first_images = dict(result.all())
+
+    expanded = []
+    for classified in classifieds:
+        values = classified_values(classified, fields)
+        if "city" in expand:
+            values["city"] = classified.city
+        if "voivodeship" in expand:
+            values["voivodeship"] = classified.city.voivodeship
+        if "category" in expand:
+            values["category"] = classified.category
+        if "user" in expand:
+            values["user"] = classified.user
+        if "first_image" in expand:
+            values["first_image_id"] = first_images.get(classified.id)
+        expanded.append(ClassifiedPartial(**values))
+    return expanded
+
+
+def writable_classifieds(db: Session, ids: List[int], user: User) -> Dict[int, bool]:
+    """Whether the user may write each classified found, locked until the
+    transaction ends"""
+    rows = db.execute(
+        select(Classified.id, Classified.user_id)
+        .where(Classified.id.in_(ids))
+        .with_for_update()
+    )
+    return {id: user_id == user.id or user.is_superuser for id, user_id in rows}
+
 
 async def hide_expired_classifieds(ctx):
     job_id = ctx["job_id"]
@@ -19,4 +250,19 @@ async def hide_expired_classifieds(ctx):
             classified.status = ClassifiedStatus.hidden
             db.add(classified)
         db.commit()
+        await response_cache.invalidate_async(
+            "classifieds", *[f"classified:{c.id}" for c in classifieds]
+        )
         logger.info(f"Job ID {job_id} hiding expired classifieds")
+
+
+async def refresh_classified_facets(ctx):
+    job_id = ctx["job_id"]
+
+    with DBSessionManager() as db:
+        # Concurrently, so facet reads aren't blocked while the view is rebuilt
+        db.execute(
+            text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {classified_facets.name}")
+        )
+        db.commit()
+        logger.info(f"Job ID {job_id} refreshing classified facets")
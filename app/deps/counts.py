@@ -0,0 +1,130 @@
+import hashlib
+from typing import Optional, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm.query import Query as ORMQuery
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.sql.schema import Table
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.redis import async_redis_client, redis_client
+
+
+class explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(explain, "postgresql")
+def compile_explain(element, compiler, **kwargs):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kwargs)
+
+
+def exact_count(query: ORMQuery) -> int:
+    return query.count()
+
+
+def estimated_count(query: ORMQuery) -> int:
+    """Reads the row count estimate from planner statistics"""
+    froms = query.statement.get_final_froms()
+    if query.whereclause is None and len(froms) == 1 and isinstance(froms[0], Table):
+        reltuples = query.session.execute(
+            text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": froms[0].fullname},
+        ).scalar()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if reltuples is not None and reltuples >= 0:
+            return int(reltuples)
+
+    plan = query.session.execute(explain(query.statement)).scalar()
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_cache_key(statement: ClauseElement, dialect) -> str:
+    compiled = statement.compile(dialect=dialect)
+    digest = hashlib.sha1(
+        f"{compiled}{sorted(compiled.params.items())}".encode()
+    ).hexdigest()
+    return f"count:{digest}"
+
+
+def cached_count(query: ORMQuery) -> Optional[int]:
+    key = count_cache_key(query.statement, query.session.get_bind().dialect)
+
+    try:
+        cached = redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"Count cache unavailable ({e})")
+        return None
+    if cached is not None:
+        return int(cached)
+
+    total = exact_count(query)
+    try:
+        redis_client.set(key, total, ex=settings.count_cache_ttl)
+    except RedisError as e:
+        logger.warning(f"Count cache unavailable ({e})")
+    return total
+
+
+def count_total(query: ORMQuery, strategy: Optional[str] = None) -> Tuple[int, str]:
+    """Counts the rows of a list query, returns the total and the strategy used"""
+    strategy = strategy or settings.count_strategy
+    query = query.order_by(None)
+
+    if strategy == "estimated":
+        estimate = estimated_count(query)
+        if estimate >= settings.count_estimate_threshold:
+            return estimate, "estimated"
+    elif strategy == "cached":
+        total = cached_count(query)
+        if total is not None:
+            return total, "cached"
+
+    return exact_count(query), "exact"
+
+
+class CountCache:
+    """The cached strategy for async sessions. Redis is read before and written
+    after the count, which runs in run_sync on the event loop thread, so that
+    the loop never waits on Redis."""
+
+    def __init__(self, query: ORMQuery, dialect):
+        self.key = count_cache_key(query.order_by(None).statement, dialect)
+        self.available = True
+        self.cached: Optional[int] = None
+        self.counted: Optional[int] = None
+
+    async def load(self) -> None:
+        try:
+            cached = await async_redis_client.get(self.key)
+        except RedisError as e:
+            logger.warning(f"Count cache unavailable ({e})")
+            self.available = False
+            return
+        if cached is not None:
+            self.cached = int(cached)
+
+    def count(self, query: ORMQuery) -> Tuple[int, str]:
+        """count_total, with the count loaded beforehand"""
+        if not self.available:
+            return exact_count(query.order_by(None)), "exact"
+        if self.cached is None:
+            self.counted = exact_count(query.order_by(None))
+            return self.counted, "cached"
+        return self.cached, "cached"
+
+    async def store(self) -> None:
+        if self.counted is None:
+            return
+        try:
+            await async_redis_client.set(
+                self.key, self.counted, ex=settings.count_cache_ttl
+            )
+        except RedisError as e:
+            logger.warning(f"Count cache unavailable ({e})")
@@ -1,9 +1,18 @@
-from app.db import SessionLocal
+from typing import Optional
+
+from sqlalchemy.engine import Engine
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.db import AsyncSessionLocal, SessionLocal, replicas, request_sessions
 
 
 class DBSessionManager:
-    def __init__(self):
-        self.db = SessionLocal(future=True)
+    def __init__(self, bind: Optional[Engine] = None):
+        if bind:
+            self.db = SessionLocal(bind=bind, future=True)
+        else:
+            self.db = SessionLocal(future=True)
 
     def __enter__(self):
         return self.db
@@ -13,5 +22,42 @@ class DBSessionManager:
 
 
 async def get_db():
-    with DBSessionManager() as db:
+    sessions = request_sessions.get()
+    if sessions is None:
+        with DBSessionManager() as db:
+            yield db
+    else:
+        yield sessions.get()
+
+
+async def get_async_db():
+    sessions = request_sessions.get()
+    if sessions is None:
+        async with AsyncSessionLocal() as db:
+            yield db
+    else:
+        yield sessions.get_async()
+
+
+def choose_replica(request: Request):
+    """A replica for a read-only handler, None when the primary has to serve it:
+    no healthy replica or the client wrote something moments ago"""
+    if not replicas or request.cookies.get(settings.read_primary_cookie):
+        return None
+    return replicas.choose()
+
+
+async def get_read_db(request: Request):
+    replica = choose_replica(request)
+    with DBSessionManager(replica.engine if replica else None) as db:
+        yield db
+
+
+async def get_async_read_db(request: Request):
+    replica = choose_replica(request)
+    if replica:
+        session = AsyncSessionLocal(bind=replica.async_engine)
+    else:
+        session = AsyncSessionLocal()
+    async with session as db:
         yield db
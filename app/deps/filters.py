@@ -0,0 +1,139 @@
+import operator
+from datetime import date, datetime
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from fastapi import HTTPException
+from loguru import logger
+from pydantic import ValidationError, parse_obj_as
+from sqlalchemy import select
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.schema import Column, Table
+
+OPERATORS = {
+    "eq": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def encode_column_value(value: Any) -> Any:
+    """Converts a column value into something JSON serializable"""
+    if isinstance(value, Enum):
+        return value.name
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def decode_column_value(column: Column, value: Any) -> Any:
+    """Converts a JSON value back into the python type of the column"""
+    python_type = column.type.python_type
+    if issubclass(python_type, Enum):
+        return python_type[value]
+    return parse_obj_as(python_type, value)
+
+
+def indexed_columns(table: Table) -> Set[Column]:
+    """Columns which can drive an index scan: leading index columns and
+    columns used in the predicate of a partial index"""
+    columns = {list(table.primary_key.columns)[0]}
+    for index in table.indexes:
+        columns.add(list(index.columns)[0])
+        where = index.dialect_options["postgresql"]["where"]
+        if where is not None:
+            columns.update(
+                element
+                for element in visitors.iterate(where)
+                if isinstance(element, Column)
+            )
+    return columns
+
+
+class FilterField:
+    """A react-admin filter compiled into a SQL predicate on an indexed column.
+
+    `through` joins the filter to a related table with a semi-join, given as a
+    (foreign key, referenced key) pair."""
+
+    def __init__(
+        self,
+        column: Column,
+        operators: Sequence[str] = ("eq",),
+        through: Optional[Tuple[Column, Column]] = None,
+    ):
+        # Accept mapped attributes as well as table columns
+        column = getattr(column, "expression", column)
+        if column not in indexed_columns(column.table):
+            raise ValueError(f"Column {column} is not backed by an index")
+        self.column = column
+        self.operators = operators
+        self.through = through
+
+    def compile(self, operator_name: str, value: Any) -> Any:
+        if isinstance(value, list):
+            if operator_name != "eq" or "in" not in self.operators:
+                raise ValueError("List values are not supported")
+            values = [decode_column_value(self.column, item) for item in value]
+            predicate = self.column.in_(values)
+        else:
+            value = decode_column_value(self.column, value)
+            predicate = OPERATORS[operator_name](self.column, value)
+
+        if self.through:
+            foreign_key, referenced_key = self.through
+            predicate = foreign_key.in_(select(referenced_key).where(predicate))
+        return predicate
+
+
+class FilterSpec:
+    """The filters and sort columns a list endpoint accepts.
+
+    Only columns backed by an index are accepted, so a request can never turn
+    into a sequential scan of a large table."""
+
+    def __init__(
+        self,
+        table: Table,
+        fields: Optional[Dict[str, FilterField]] = None,
+        sortable: Optional[Iterable[str]] = None,
+    ):
+        self.table = table
+        self.fields = dict(fields or {})
+        primary_key = list(table.primary_key.columns)
+        if len(primary_key) == 1 and primary_key[0].key not in self.fields:
+            # react-admin's getMany and getManyReference ask for records by ids
+            self.fields[primary_key[0].key] = FilterField(primary_key[0], ("eq", "in"))
+        self.sortable = set(sortable) if sortable is not None else None
+        if self.sortable is not None:
+            unindexed = self.sortable - {c.key for c in indexed_columns(table)}
+            if unindexed:
+                raise ValueError(f"Sort columns {unindexed} are not backed by an index")
+
+    def is_sortable(self, column_name: str) -> bool:
+        return self.sortable is None or column_name in self.sortable
+
+    def split_key(self, key: str) -> Tuple[str, str]:
+        name, _, suffix = key.rpartition("_")
+        if suffix in OPERATORS and name in self.fields:
+            return name, suffix
+        return key, "eq"
+
+    def compile(self, filters: Dict[str, Any]) -> List[Any]:
+        predicates = []
+        for key, value in filters.items():
+            name, operator_name = self.split_key(key)
+            field = self.fields.get(name)
+            if not field or operator_name not in field.operators:
+                logger.error(f"Unsupported filter ({key})")
+                raise HTTPException(400, f"Unsupported filter ({key})")
+            try:
+                predicates.append(field.compile(operator_name, value))
+            except (KeyError, TypeError, ValueError, ValidationError):
+                logger.error(f"Invalid value for filter ({key}): {value}")
+                raise HTTPException(400, f"Invalid value for filter ({key})")
+        return predicates
@@ -0,0 +1,42 @@
+import math
+from typing import Any, Tuple
+
+from sqlalchemy.sql.functions import func
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def bounding_box(
+    latitude: float, longitude: float, radius_km: float
+) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    """The latitude and longitude ranges enclosing a circle around a point"""
+    delta_latitude = radius_km / KM_PER_DEGREE
+    min_latitude = max(latitude - delta_latitude, -90.0)
+    max_latitude = min(latitude + delta_latitude, 90.0)
+
+    # Meridians converge towards the poles, widen the box at its widest latitude
+    widest = max(abs(min_latitude), abs(max_latitude))
+    if widest >= 90.0:
+        return (min_latitude, max_latitude), (-180.0, 180.0)
+    delta_longitude = delta_latitude / math.cos(math.radians(widest))
+    if abs(longitude) + delta_longitude > 180.0:
+        # Crosses the antimeridian, where the range would wrap around
+        return (min_latitude, max_latitude), (-180.0, 180.0)
+    return (min_latitude, max_latitude), (
+        longitude - delta_longitude,
+        longitude + delta_longitude,
+    )
+
+
+def haversine_km(
+    latitude: float, longitude: float, latitude_column, longitude_column
+) -> Any:
+    """SQL expression for the great-circle distance between a point and columns"""
+    sin_latitude = func.sin(func.radians(latitude_column - latitude) / 2)
+    sin_longitude = func.sin(func.radians(longitude_column - longitude) / 2)
+    cos_latitudes = math.cos(math.radians(latitude)) * func.cos(
+        func.radians(latitude_column)
+    )
+    a = func.power(sin_latitude, 2) + cos_latitudes * func.power(sin_longitude, 2)
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(func.sqrt(a), 1.0))
@@ -0,0 +1,292 @@
+import hashlib
+import os
+from collections import Counter
+from io import BytesIO
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image as PILImage, ImageOps
+from sqlalchemy import delete, event, update
+from sqlalchemy.orm import Session
+
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.core.logger import logger
+from app.deps.blobs import blob_path, blobs, remove_files
+from app.deps.db import DBSessionManager
+from app.models.image import Image
+from app.models.image_blob import ImageBlob
+
+VARIANT_FORMATS = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+}
+# Of originals, which keep the extension they were uploaded with
+EXTENSION_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+}
+EXIF_ORIENTATION = 0x0112
+
+
+def legacy_image_path(image: Image, suffix: str = "", extension: str = None) -> str:
+    """Where images were stored before blobs, see app.commands.rehome_images"""
+    return (
+        f"{settings.images_upload_path}{image.filename}{suffix}"
+        f"{extension or image.extension}"
+    )
+
+
+def image_path(image: Image) -> str:
+    if image.blob_checksum:
+        return blob_path(image.blob_checksum, image.extension)
+    return legacy_image_path(image)
+
+
+def variant_path(image: Image, variant: Dict[str, Any]) -> str:
+    suffix, extension = f"_{variant['width']}", VARIANT_FORMATS[variant["format"]][1]
+    if image.blob_checksum:
+        return blob_path(image.blob_checksum, extension, suffix)
+    return legacy_image_path(image, suffix, extension)
+
+
+def image_files(image: Image) -> List[str]:
+    return [image_path(image)] + [
+        variant_path(image, variant) for variant in image.variants or []
+    ]
+
+
+def legacy_image_files(images: List[Image]) -> List[str]:
+    """Files of the images stored before blobs, removed once their deletion
+    has been committed"""
+    return [
+        path
+        for image in images
+        if not image.blob_checksum
+        for path in image_files(image)
+    ]
+
+
+def choose_variant(
+    image: Image, width: Optional[int], accept: str
+) -> Optional[Dict[str, Any]]:
+    """The smallest variant at least `width` wide, in WebP if the client takes
+    it. None when the original is the closest match."""
+    if not width or not image.variants:
+        return None
+    formats = ["webp", "jpeg"] if "image/webp" in accept else ["jpeg"]
+    for format in formats:
+        variants = [
+            variant
+            for variant in image.variants
+            if variant["format"] == format and variant["width"] >= width
+        ]
+        if variants:
+            return min(variants, key=lambda variant: variant["width"])
+    return None
+
+
+def image_etag(image: Image, variant: Optional[Dict[str, Any]] = None) -> str:
+    if variant:
+        return f'"{variant["checksum"]}"'
+    # Images uploaded before checksums were recorded are never rewritten
+    return f'"{image.checksum or image.filename.hex}"'
+
+
+def image_cache_control(image: Image) -> str:
+    """Files are immutable, apart from originals awaiting process_image, which
+    still carry their metadata"""
+    if image.checksum and image.size is None:
+        return "public, no-cache"
+    return f"public, max-age={settings.images_cache_max_age}, immutable"
+
+
+def write_file(path: str, content: bytes) -> None:
+    # Readers never see a partially written file
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(content)
+    os.replace(f"{path}.tmp", path)
+
+
+def encode(image: PILImage.Image, format: str, **options) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format, **options)
+    return buffer.getvalue()
+
+
+def render_image(image: Image) -> Dict[str, Any]:
+    """Decodes the original once, rewrites it without metadata and writes the
+    resized variants. Returns the values to record on the image."""
+    path = image_path(image)
+    with PILImage.open(path) as original:
+        original.load()
+        rotated = original.getexif().get(EXIF_ORIENTATION, 1) != 1
+        decoded = ImageOps.exif_transpose(original)
+
+        # Metadata isn't copied by save() unless asked for
+        if original.format == "PNG":
+            content = encode(decoded, "PNG", optimize=True)
+        elif rotated:
+            # The pixels moved, the original's quantization no longer applies
+            content = encode(
+                decoded, "JPEG", quality=settings.images_variant_quality, optimize=True
+            )
+        else:
+            content = encode(
+                original, "JPEG", quality="keep", subsampling="keep", optimize=True
+            )
+    write_file(path, content)
+
+    if decoded.mode not in ("RGB", "RGBA"):
+        decoded = decoded.convert("RGBA" if "transparency" in decoded.info else "RGB")
+    variants: List[Dict[str, Any]] = []
+    for width in sorted(settings.images_variant_widths, reverse=True):
+        if width >= decoded.width:
+            continue
+        height = max(1, round(decoded.height * width / decoded.width))
+        resized = decoded.resize((width, height), PILImage.LANCZOS, reducing_gap=3.0)
+        for format in settings.images_variant_formats:
+            pil_format = VARIANT_FORMATS[format][0]
+            frame = resized
+            if pil_format == "JPEG" and frame.mode == "RGBA":
+                frame = frame.convert("RGB")
+            variant_content = encode(
+                frame, pil_format, quality=settings.images_variant_quality
+            )
+            variant = {
+                "width": width,
+                "height": height,
+                "format": format,
+                "size": len(variant_content),
+                "checksum": hashlib.sha256(variant_content).hexdigest(),
+            }
+            write_file(variant_path(image, variant), variant_content)
+            variants.append(variant)
+
+    return {
+        "width": decoded.width,
+        "height": decoded.height,
+        "size": len(content),
+        "checksum": hashlib.sha256(content).hexdigest(),
+        "variants": variants,
+    }
+
+
+async def process_image(ctx, image_id: int):
+    """Processes the image's blob, once for all the images sharing it"""
+    job_id = ctx["job_id"]
+
+    with DBSessionManager() as db:
+        image = db.get(Image, image_id)
+        if not image:
+            logger.info(f"Job ID {job_id} skipping deleted image (ID {image_id})")
+            return
+        db.expunge(image)
+        blob = db.get(ImageBlob, image.blob_checksum) if image.blob_checksum else None
+        processed = db.query(Image).filter(
+            Image.blob_checksum == image.blob_checksum, Image.size.isnot(None)
+        )
+        sibling = processed.first() if blob and blob.processed else None
+
+    if sibling:
+        values = {
+            key: getattr(sibling, key)
+            for key in ("width", "height", "size", "checksum", "variants")
+        }
+    else:
+        # Pillow releases the GIL while decoding, resizing and encoding
+        try:
+            values = await run_in_threadpool(render_image, image)
+        except FileNotFoundError:
+            logger.info(f"Job ID {job_id} skipping deleted image (ID {image_id})")
+            return
+    image.variants = values["variants"]
+
+    with DBSessionManager() as db:
+        images = db.query(Image)
+        if image.blob_checksum:
+            # The images sharing the blob which haven't been processed yet
+            images = images.filter(
+                Image.blob_checksum == image.blob_checksum, Image.size.is_(None)
+            )
+            blob_updated = db.execute(
+                update(blobs)
+                .where(blobs.c.checksum == image.blob_checksum)
+                .values(processed=True)
+            ).rowcount
+        else:
+            images = images.filter(Image.id == image_id)
+            blob_updated = True
+        classified_ids = [
+            classified_id
+            for classified_id, in images.with_entities(Image.classified_id)
+        ]
+        images.update(values, synchronize_session=False)
+        db.commit()
+    if not blob_updated or (not image.blob_checksum and not classified_ids):
+        # Deleted while the variants were being written
+        remove_files(image_files(image))
+        return
+    if classified_ids:
+        await response_cache.invalidate_async(
+            *{f"classified:{classified_id}:images" for classified_id in classified_ids}
+        )
+
+    logger.info(
+        f"Job ID {job_id} processing image (ID {image_id}), {len(values['variants'])} variants"
+    )
+
+
+def release_image_blobs(session: Session, images: List[Image]) -> None:
+    """Dereferences the blobs of deleted images. Unreferenced blobs are deleted,
+    their files are removed on commit."""
+    released: Dict[str, int] = Counter()
+    files: Dict[str, List[str]] = {}
+    for image in images:
+        if image.blob_checksum:
+            released[image.blob_checksum] += 1
+            files[image.blob_checksum] = image_files(image)
+    if not released:
+        return
+
+    # Not through the session, which may be flushing
+    connection = session.connection()
+    for checksum, count in released.items():
+        refcount = connection.execute(
+            update(blobs)
+            .where(blobs.c.checksum == checksum)
+            .values(refcount=blobs.c.refcount - count)
+            .returning(blobs.c.refcount)
+        ).scalar()
+        if refcount is not None and refcount <= 0:
+            connection.execute(delete(blobs).where(blobs.c.checksum == checksum))
+            session.info.setdefault("removed_blob_files", []).extend(files[checksum])
+
+
+@event.listens_for(Session, "after_flush")
+def release_blobs(session: Session, flush_context) -> None:
+    """Releases the blobs of images deleted through the session, however they
+    were deleted, through classified cascades too. Bulk deletes call
+    release_image_blobs themselves."""
+    release_image_blobs(
+        session,
+        [instance for instance in session.deleted if isinstance(instance, Image)],
+    )
+
+
+@event.listens_for(Session, "before_commit")
+def remove_blob_files(session: Session) -> None:
+    if any(isinstance(instance, Image) for instance in session.deleted):
+        # Released by the flush the commit would do
+        session.flush()
+    paths = session.info.pop("removed_blob_files", None)
+    if paths:
+        # Before the commit, while the blob rows are locked, so that an upload of
+        # the same bytes waits, then finds no blob and stores its file again
+        remove_files(paths)
+
+
+@event.listens_for(Session, "after_rollback")
+def keep_blob_files(session: Session) -> None:
+    session.info.pop("removed_blob_files", None)
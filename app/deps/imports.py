@@ -0,0 +1,239 @@
+import csv
+import io
+import json
+from decimal import Decimal
+from itertools import islice
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    TextIO,
+    Tuple,
+)
+from uuid import UUID
+
+from pydantic import ValidationError
+from sqlalchemy import Column, MetaData, Table, cast, insert, select
+from sqlalchemy.orm.session import Session
+from sqlalchemy.sql.sqltypes import Integer, Numeric, String
+
+from app.core.config import settings
+from app.deps.reference_data import reference_data
+from app.models.classified import Classified, ClassifiedStatus
+from app.schemas.classified import ClassifiedCreate
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# Filled with COPY, then merged into classifieds by a single INSERT ... SELECT
+staging = Table(
+    "classifieds_import",
+    MetaData(),
+    Column("title", String),
+    Column("content", String),
+    Column("price", Numeric),
+    Column("category_id", Integer),
+    Column("city_id", Integer),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+STAGING_COPY = (
+    f"COPY {staging.name} ({', '.join(staging.c.keys())}) FROM STDIN WITH (FORMAT csv)"
+)
+
+
+PRICE_TYPE = Classified.__table__.c.price.type
+PRICE_LIMIT = Decimal(10) ** (PRICE_TYPE.precision - PRICE_TYPE.scale)
+
+
+class InvalidRow(NamedTuple):
+    """A row which couldn't be parsed, passed on to be rejected"""
+
+    data: Any
+    error: str
+
+
+def text_feed(file: BinaryIO) -> TextIO:
+    """The feed decoded as UTF-8. Bytes which aren't are kept as surrogates, the
+    rows holding them are rejected rather than failing the whole import."""
+    return io.TextIOWrapper(
+        file, encoding="utf-8", errors="surrogateescape", newline=""
+    )
+
+
+def read_rows(lines: Iterable[str], format: str) -> Iterator[Any]:
+    """Rows of a CSV file with a header, or of NDJSON, one object per line"""
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        while True:
+            try:
+                yield next(reader)
+            except StopIteration:
+                return
+            except csv.Error as e:
+                # The reader carries on with the next line
+                yield InvalidRow(None, f"Invalid CSV ({e})")
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRow(line.rstrip("\n"), f"Invalid JSON ({e})")
+
+
+class NameLookup:
+    """Category and city ids by name, from the reference data snapshot. Cities
+    sharing a name are told apart by voivodeship."""
+
+    def __init__(self):
+        voivodeships = {
+            record.id: record.name
+            for record in reference_data.table("voivodeships").records.values()
+        }
+        self.categories = {
+            record.name.casefold(): record.id
+            for record in reference_data.table("categories").records.values()
+        }
+        self.category_ids = set(reference_data.table("categories").records)
+        self.city_ids = set(reference_data.table("cities").records)
+        self.cities: Dict[str, Dict[str, int]] = {}
+        for record in reference_data.table("cities").records.values():
+            self.cities.setdefault(record.name.casefold(), {})[
+                voivodeships.get(record.voivodeship_id, "").casefold()
+            ] = record.id
+
+    def category_id(self, name: str) -> Optional[int]:
+        return self.categories.get(name.strip().casefold())
+
+    def city_id(self, name: str, voivodeship: Optional[str]) -> Optional[int]:
+        cities = self.cities.get(name.strip().casefold(), {})
+        if voivodeship:
+            return cities.get(voivodeship.strip().casefold())
+        if len(cities) == 1:
+            return next(iter(cities.values()))
+        return None
+
+
+def resolve(row: Dict[str, Any], names: NameLookup) -> Dict[str, Any]:
+    """Replaces category and city names with their ids, raises ValueError when
+    one isn't known"""
+    row = dict(row)
+    if not row.get("category_id") and row.get("category"):
+        row["category_id"] = names.category_id(row["category"])
+        if row["category_id"] is None:
+            raise ValueError(f"Unknown category {row['category']}")
+    if not row.get("city_id") and row.get("city"):
+        row["city_id"] = names.city_id(row["city"], row.get("voivodeship"))
+        if row["city_id"] is None:
+            raise ValueError(f"Unknown or ambiguous city {row['city']}")
+    return row
+
+
+def check_classified(classified: ClassifiedCreate, names: NameLookup) -> None:
+    """Raises ValueError for what COPY or the merge would fail the whole import
+    on: unknown ids, text PostgreSQL can't store and prices out of range"""
+    if classified.category_id not in names.category_ids:
+        raise ValueError(f"Unknown category {classified.category_id}")
+    if classified.city_id not in names.city_ids:
+        raise ValueError(f"Unknown city {classified.city_id}")
+    for field in ("title", "content"):
+        value = getattr(classified, field)
+        if "\x00" in value:
+            raise ValueError(f"NUL character in {field}")
+        try:
+            value.encode("utf-8")
+        except UnicodeEncodeError:
+            raise ValueError(f"Invalid UTF-8 in {field}")
+    if (
+        not classified.price.is_finite()
+        or abs(round(classified.price, PRICE_TYPE.scale)) >= PRICE_LIMIT
+    ):
+        raise ValueError(f"Price {classified.price} out of range")
+
+
+def validate_batch(
+    batch: List[Tuple[int, Any]], names: NameLookup, rejects: TextIO
+) -> List[ClassifiedCreate]:
+    valid = []
+    for number, row in batch:
+        if isinstance(row, InvalidRow):
+            write_reject(rejects, number, row.data, [row.error])
+            continue
+        if not isinstance(row, dict):
+            write_reject(rejects, number, row, ["Not a JSON object"])
+            continue
+        try:
+            classified = ClassifiedCreate(**resolve(row, names))
+            check_classified(classified, names)
+            valid.append(classified)
+        except ValidationError as e:
+            write_reject(rejects, number, row, [error["msg"] for error in e.errors()])
+        except (TypeError, ValueError) as e:
+            write_reject(rejects, number, row, [str(e)])
+    return valid
+
+
+def write_reject(rejects: TextIO, number: int, row: Any, errors: List[str]) -> None:
+    rejects.write(
+        json.dumps({"row": number, "data": row, "errors": errors}, default=str) + "\n"
+    )
+
+
+def copy_batch(db: Session, classifieds: List[ClassifiedCreate]) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for classified in classifieds:
+        writer.writerow(
+            (
+                classified.title,
+                classified.content,
+                classified.price,
+                classified.category_id,
+                classified.city_id,
+            )
+        )
+    buffer.seek(0)
+    # COPY isn't exposed by SQLAlchemy, psycopg2's cursor does it
+    with db.connection().connection.cursor() as cursor:
+        cursor.copy_expert(STAGING_COPY, buffer)
+
+
+def import_classifieds(
+    db: Session, rows: Iterable[Any], user_id: UUID, rejects: TextIO
+) -> Tuple[int, int]:
+    """Loads classifieds of the user in one transaction: rows are validated in
+    batches and copied to a staging table, then merged into classifieds by a
+    single statement. Invalid rows are written to `rejects` as NDJSON. Returns
+    the imported and rejected counts."""
+    names = NameLookup()
+    staging.create(db.connection())
+
+    imported, rejected = 0, 0
+    numbered = enumerate(rows, 1)
+    while True:
+        batch = list(islice(numbered, settings.imports_batch_size))
+        if not batch:
+            break
+        valid = validate_batch(batch, names, rejects)
+        copy_batch(db, valid)
+        imported += len(valid)
+        rejected += len(batch) - len(valid)
+
+    columns = [*staging.c.keys(), "user_id", "status"]
+    db.execute(
+        insert(Classified).from_select(
+            columns,
+            select(
+                *staging.c,
+                cast(user_id, Classified.user_id.type),
+                cast(ClassifiedStatus.active, Classified.status.type),
+            ),
+        )
+    )
+    db.commit()
+    return imported, rejected
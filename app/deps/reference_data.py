@@ -0,0 +1,187 @@
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+from sqlalchemy import func, select
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.redis import listen, redis_client
+from app.deps.db import DBSessionManager
+from app.deps.request_params import set_range_headers
+from app.models.category import Category
+from app.models.city import City
+from app.models.voivodeship import Voivodeship
+from app.schemas.category import Category as CategorySchema
+from app.schemas.city import City as CitySchema
+from app.schemas.request_params import RequestParams
+from app.schemas.voivodeship import Voivodeship as VoivodeshipSchema
+
+
+class CategoryRecord(NamedTuple):
+    id: int
+    name: str
+    description: Optional[str]
+
+
+class VoivodeshipRecord(NamedTuple):
+    id: int
+    name: str
+
+
+class CityRecord(NamedTuple):
+    id: int
+    voivodeship_id: int
+    name: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+
+class ReferenceTable:
+    """Snapshot of a small table: records by id, their serialized JSON and
+    their rank by each column"""
+
+    __slots__ = ("records", "json", "ranks", "orders")
+
+    def __init__(
+        self,
+        schema: Type[BaseModel],
+        records: List[NamedTuple],
+        ranks: Dict[str, Dict[int, int]],
+    ):
+        self.records = {record.id: record for record in records}
+        self.json = {
+            record.id: schema.from_orm(record).json().encode() for record in records
+        }
+        self.ranks = ranks
+        self.orders: Dict[Tuple[str, str], List[NamedTuple]] = {}
+
+    def ordered(self, column: str, order: str) -> List[NamedTuple]:
+        """Records sorted as the database sorted them, by its collation, NULLs
+        last ascending and first descending, ties broken by id"""
+        if (column, order) not in self.orders:
+            ranks = self.ranks[column]
+            self.orders[column, order] = sorted(
+                self.records.values(),
+                key=lambda record: ranks[record.id],
+                reverse=order == "desc",
+            )
+        return self.orders[column, order]
+
+
+class ReferenceData:
+    """Per-process cache of the rarely changing tables every listing needs.
+
+    Writes bump a version in Redis and publish it, every worker listens and
+    drops its snapshot, which is reloaded from the primary on next use.
+    Snapshots older than `reference_data_max_age` are reloaded as well, in case
+    a notification was missed."""
+
+    channel = "reference_data"
+    version_key = "reference_data:version"
+
+    sources = {
+        "categories": (Category, CategoryRecord, CategorySchema),
+        "voivodeships": (Voivodeship, VoivodeshipRecord, VoivodeshipSchema),
+        "cities": (City, CityRecord, CitySchema),
+    }
+
+    def __init__(self):
+        self.snapshot: Optional[Dict[str, ReferenceTable]] = None
+        self.loaded_at = 0.0
+        self.generation = 0
+        self.version: Optional[int] = None
+
+    def load(self) -> Dict[str, ReferenceTable]:
+        generation = self.generation
+        snapshot = {}
+        with DBSessionManager() as db:
+            for name, (model, record, schema) in self.sources.items():
+                columns = [model.__table__.c[field] for field in record._fields]
+                # Ranked in the same statement, so they match the records
+                ranks = [
+                    func.row_number().over(order_by=(column, model.id))
+                    for column in columns
+                ]
+                rows = db.execute(select(*columns, *ranks).order_by(model.id)).all()
+                records = [record(*row[: len(columns)]) for row in rows]
+                snapshot[name] = ReferenceTable(
+                    schema,
+                    records,
+                    {
+                        column.key: {
+                            record.id: row[len(columns) + i]
+                            for record, row in zip(records, rows)
+                        }
+                        for i, column in enumerate(columns)
+                    },
+                )
+
+        # An invalidation arrived during the load, the snapshot may be stale
+        if generation == self.generation:
+            self.snapshot, self.loaded_at = snapshot, time.monotonic()
+        return snapshot
+
+    def table(self, name: str) -> ReferenceTable:
+        snapshot = self.snapshot
+        if (
+            snapshot is None
+            or time.monotonic() - self.loaded_at > settings.reference_data_max_age
+        ):
+            snapshot = self.load()
+        return snapshot[name]
+
+    def expire(self) -> None:
+        self.generation += 1
+        self.snapshot = None
+
+    def invalidate(self) -> None:
+        """Called after a write to one of the tables has been committed"""
+        self.expire()
+        try:
+            version = redis_client.incr(self.version_key)
+            redis_client.publish(self.channel, version)
+        except RedisError as e:
+            logger.warning(f"Reference data invalidation not published ({e})")
+
+    def notify(self, version: Optional[bytes]) -> None:
+        if version is not None:
+            self.version = int(version)
+        self.expire()
+
+    async def listen(self) -> None:
+        await listen(self.channel, self.notify)
+
+    def paginate(self, name: str, request_params: RequestParams) -> Response:
+        """paginate for a cached table, the page is joined from serialized
+        records. Filters other than a list of ids and cursors are not
+        supported."""
+        table = self.table(name)
+        if request_params.ids is not None:
+            page = records = [
+                table.records[id] for id in request_params.ids if id in table.records
+            ]
+        else:
+            records = table.ordered(
+                request_params.sort_column, request_params.sort_order
+            )
+            page = records[
+                request_params.skip : request_params.skip + request_params.limit
+            ]
+        response = Response(
+            b"[" + b",".join(table.json[record.id] for record in page) + b"]",
+            media_type="application/json",
+        )
+        set_range_headers(response, request_params, len(page), len(records), "exact")
+        return response
+
+    def get(self, name: str, id: int) -> Optional[Response]:
+        json = self.table(name).json.get(id)
+        if json is None:
+            return None
+        return Response(json, media_type="application/json")
+
+
+reference_data = ReferenceData()
@@ -1,16 +1,59 @@
+import base64
 import json
-from typing import Optional
+import operator
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 from fastapi import HTTPException, Query
 from loguru import logger
-from sqlalchemy import asc, desc
+from pydantic import ValidationError
+from sqlalchemy import asc, case, desc, inspect, literal, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.ext.declarative import DeclarativeMeta
+from sqlalchemy.orm.query import Query as ORMQuery
+from starlette.responses import Response
 
+from app.core.config import settings
+from app.deps.counts import CountCache, count_total
+from app.deps.filters import FilterSpec, decode_column_value, encode_column_value
 from app.schemas.request_params import RequestParams
 
 
-def parse_react_admin_params(model: DeclarativeMeta) -> RequestParams:
-    """Parses sort and range parameters coming from a react-admin request"""
+def encode_cursor(values: List[Any]) -> str:
+    payload = json.dumps([encode_column_value(value) for value in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    padding = "=" * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(cursor + padding))
+
+
+def load_react_admin_filter(filter_: Optional[str]) -> Dict[str, Any]:
+    if not filter_:
+        return {}
+    try:
+        filters = json.loads(filter_)
+    except ValueError:
+        filters = None
+    if not isinstance(filters, dict):
+        logger.error(f"Invalid filter ({filter_})")
+        raise HTTPException(400, f"Invalid filter ({filter_})")
+    return filters
+
+
+def parse_react_admin_filter(
+    filter_spec: FilterSpec, filter_: Optional[str]
+) -> List[Any]:
+    return filter_spec.compile(load_react_admin_filter(filter_))
+
+
+def parse_react_admin_params(
+    model: DeclarativeMeta, filter_spec: Optional[FilterSpec] = None
+) -> RequestParams:
+    """Parses sort, range, filter and cursor parameters coming from a react-admin
+    request. Filters are only accepted when declared in the filter spec."""
+    if filter_spec is None:
+        filter_spec = FilterSpec(model.__table__)
 
     def inner(
         sort_: Optional[str] = Query(
@@ -25,33 +68,220 @@ def parse_react_admin_params(model: DeclarativeMeta) -> RequestParams:
             description="Format: `[start, end]`",
             example="[0, 10]",
         ),
+        filter_: Optional[str] = Query(
+            None,
+            alias="filter",
+            description='Format: `{"field_name": value, "field_name_gte": value}`',
+            example="{}",
+        ),
+        cursor_: Optional[str] = Query(
+            None,
+            alias="cursor",
+            description=(
+                "Enables keyset pagination. Use `*` for the first page, then pass "
+                "the value of the `X-Next-Cursor` response header. Only the first "
+                "page is counted, later pages report a `*` total"
+            ),
+            example="*",
+        ),
     ):
         skip, limit = 0, 10
         if range_:
             start, end = json.loads(range_)
             skip, limit = start, (end - start + 1)
 
+        primary_key = inspect(model).primary_key[0]
+        sort_column, sort_order = primary_key.key, "desc"
         if sort_:
             sort_column, sort_order = json.loads(sort_)
-            if sort_order.lower() == "asc":
-                direction = asc
-            elif sort_order.lower() == "desc":
-                direction = desc
-            else:
-                logger.error(f"Invalid sort direction ({sort_order})")
-                raise HTTPException(400, f"Invalid sort direction ({sort_order})")
-            try:
-                order_by = direction(model.__table__.c[sort_column])
-            except KeyError:
-                logger.error(f"Invalid sort column ({sort_column}) for {model}")
-                raise HTTPException(400, f"Invalid sort column ({sort_column})")
+        if sort_order.lower() == "asc":
+            direction = asc
+        elif sort_order.lower() == "desc":
+            direction = desc
         else:
+            logger.error(f"Invalid sort direction ({sort_order})")
+            raise HTTPException(400, f"Invalid sort direction ({sort_order})")
+        try:
+            column = model.__table__.c[sort_column]
+        except KeyError:
+            logger.error(f"Invalid sort column ({sort_column}) for {model}")
+            raise HTTPException(400, f"Invalid sort column ({sort_column})")
+        if not filter_spec.is_sortable(column.key):
+            logger.error(f"Unsupported sort column ({sort_column}) for {model}")
+            raise HTTPException(400, f"Unsupported sort column ({sort_column})")
+
+        filter_values = load_react_admin_filter(filter_)
+        filters = filter_spec.compile(filter_values)
+
+        # The primary key makes the order total, so rows never move between pages
+        order_by = [direction(column)]
+        if column is not primary_key:
+            order_by.append(direction(primary_key))
+
+        keyset = cursor_ is not None
+        ids = None
+        if primary_key.key in filter_values:
+            if keyset:
+                raise HTTPException(
+                    400, "Cursor pagination is not supported when filtering on ids"
+                )
+            ids = filter_values[primary_key.key]
+            # Validated by the filter spec, duplicates are looked up once
+            ids = list(
+                dict.fromkeys(
+                    decode_column_value(primary_key, id)
+                    for id in (ids if isinstance(ids, list) else [ids])
+                )
+            )
+            if len(ids) > settings.filter_max_ids:
+                logger.error(f"Too many ids ({len(ids)}) in filter")
+                raise HTTPException(
+                    400, f"At most {settings.filter_max_ids} ids can be filtered on"
+                )
+            # The page is all of the rows asked for, in the order asked for
+            skip, limit = 0, len(ids)
+            if ids:
+                order_by = [
+                    case(
+                        {id: position for position, id in enumerate(ids)},
+                        value=primary_key,
+                    )
+                ]
+        if keyset and column.nullable:
+            logger.error(f"Cursor pagination on nullable column ({sort_column})")
+            raise HTTPException(
+                400, f"Cursor pagination is not supported for column ({sort_column})"
+            )
+
+        after = None
+        if cursor_ not in (None, "", "*"):
             try:
-                order_by = desc(model.id)
-            except AttributeError:
-                logger.error(f"Invalid sort column (id) for {model}")
-                raise HTTPException(400, f"Invalid sort column (id)")
+                cursor_column, cursor_order, value, last_id = decode_cursor(cursor_)
+                value = decode_column_value(column, value)
+                last_id = decode_column_value(primary_key, last_id)
+            except (KeyError, TypeError, ValueError, ValidationError):
+                logger.error(f"Invalid cursor ({cursor_})")
+                raise HTTPException(400, "Invalid cursor")
+            if cursor_column != column.key or cursor_order != sort_order.lower():
+                logger.error(f"Cursor ({cursor_}) does not match sort ({sort_})")
+                raise HTTPException(400, "Cursor does not match the sort parameter")
+
+            compare = operator.gt if direction is asc else operator.lt
+            if column is primary_key:
+                after = compare(primary_key, literal(last_id, primary_key.type))
+            else:
+                after = compare(
+                    tuple_(column, primary_key),
+                    tuple_(
+                        literal(value, column.type), literal(last_id, primary_key.type)
+                    ),
+                )
 
-        return RequestParams(skip=skip, limit=limit, order_by=order_by)
+        return RequestParams(
+            skip=skip,
+            limit=limit,
+            order_by=order_by,
+            filters=filters,
+            sort_column=column.key,
+            sort_order=sort_order.lower(),
+            tie_breaker=primary_key.key,
+            keyset=keyset,
+            after=after,
+            ids=ids,
+        )
 
     return inner
+
+
+def paginate(
+    response: Response,
+    query: ORMQuery,
+    request_params: RequestParams,
+    count: Callable[[ORMQuery], Tuple[int, str]] = count_total,
+) -> List[Any]:
+    """Fetches a single page of the query and sets the react-admin headers"""
+    query = query.filter(*request_params.filters)
+    if request_params.ids is not None:
+        # All the rows asked for make up the page, no need to count them
+        items = (
+            query.order_by(*request_params.order_by).all() if request_params.ids else []
+        )
+        set_range_headers(response, request_params, len(items), len(items), "exact")
+        return items
+
+    if needs_count(request_params):
+        total, count_mode = count(query)
+    else:
+        # Later keyset pages reuse the total of the first one
+        total, count_mode = "*", "none"
+    query = query.order_by(*request_params.order_by)
+
+    if request_params.keyset:
+        if request_params.after is not None:
+            query = query.filter(request_params.after)
+        items = query.limit(request_params.limit + 1).all()
+        if len(items) > request_params.limit:
+            items = items[: request_params.limit]
+            last = items[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(
+                [
+                    request_params.sort_column,
+                    request_params.sort_order,
+                    getattr(last, request_params.sort_column),
+                    getattr(last, request_params.tie_breaker),
+                ]
+            )
+    else:
+        items = query.offset(request_params.skip).limit(request_params.limit).all()
+
+    set_range_headers(response, request_params, len(items), total, count_mode)
+    return items
+
+
+def needs_count(request_params: RequestParams) -> bool:
+    return request_params.ids is None and request_params.after is None
+
+
+def set_range_headers(
+    response: Response,
+    request_params: RequestParams,
+    count: int,
+    total: Union[int, str],
+    count_mode: str,
+) -> None:
+    response.headers[
+        "Access-Control-Expose-Headers"
+    ] = "Content-Range, X-Next-Cursor, X-Total-Count-Mode"
+    response.headers[
+        "Content-Range"
+    ] = f"{request_params.skip}-{request_params.skip + count}/{total}"
+    response.headers["X-Total-Count-Mode"] = count_mode
+
+
+async def paginate_async(
+    response: Response,
+    db: AsyncSession,
+    query: ORMQuery,
+    request_params: RequestParams,
+) -> List[Any]:
+    """paginate for an AsyncSession, the query is built without a session
+    (`Query(Model)`) and bound to the sync facade of the async session"""
+    if settings.count_strategy != "cached" or not needs_count(request_params):
+        return await db.run_sync(
+            lambda session: paginate(
+                response, query.with_session(session), request_params
+            )
+        )
+
+    # Redis is used outside of run_sync, with the async client
+    count_cache = CountCache(
+        query.filter(*request_params.filters), db.sync_session.get_bind().dialect
+    )
+    await count_cache.load()
+    items = await db.run_sync(
+        lambda session: paginate(
+            response, query.with_session(session), request_params, count_cache.count
+        )
+    )
+    await count_cache.store()
+    return items
@@ -1,27 +1,77 @@
-from typing import List
+import json
+from typing import Dict, List, NamedTuple, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
-from app.deps.db import DBSessionManager
 
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.redis import async_redis_client, listen, redis_client
+from app.deps.db import DBSessionManager
 from app.models.user import User
 from app.models.user_scope import UserScope
 from app.models.scope import Scope
 
 
+class ScopeRecord(NamedTuple):
+    scope_name: str
+    description: str
+    default: bool
+
+
+class ScopeCatalog:
+    """The scopes table, loaded once per process. Writes to it publish on the
+    scope_catalog channel and every worker reloads on next use."""
+
+    channel = "scope_catalog"
+
+    def __init__(self):
+        self.scopes: Optional[List[ScopeRecord]] = None
+
+    def load(self, db_session: Session = None) -> List[ScopeRecord]:
+        if not db_session:
+            with DBSessionManager() as db_session:
+                return self.load(db_session)
+        columns = [Scope.__table__.c[field] for field in ScopeRecord._fields]
+        rows = db_session.execute(select(*columns).order_by(Scope.scope_name))
+        self.scopes = [ScopeRecord(*row) for row in rows]
+        return self.scopes
+
+    def all(self, db_session: Session = None) -> List[ScopeRecord]:
+        scopes = self.scopes
+        if scopes is None:
+            scopes = self.load(db_session)
+        return scopes
+
+    def invalidate(self) -> None:
+        """Called after a write to the scopes table has been committed"""
+        self.scopes = None
+        try:
+            redis_client.publish(self.channel, "")
+        except RedisError as e:
+            logger.warning(f"Scope catalog invalidation not published ({e})")
+
+    def notify(self, message: Optional[bytes]) -> None:
+        self.scopes = None
+
+    async def listen(self) -> None:
+        await listen(self.channel, self.notify)
+
+
+scope_catalog = ScopeCatalog()
+
+
+def user_scopes_key(user_id) -> str:
+    return f"user_scopes:{user_id}"
+
+
 def query_scopes(db_session: Session = None):
-    if not db_session:
-        with DBSessionManager() as db_session:
-            query_scopes = db_session.query(Scope)
-            scopes = query_scopes.all()
-            return scopes
-    try:
-        query_scopes = db_session.query(Scope)
-        scopes = query_scopes.all()
-    except:
-        return None
-    return scopes
+    return scope_catalog.all(db_session)
 
 
-def query_scopes_dict(db_session: Session = None):
+def query_scopes_dict(db_session: Session = None) -> Dict[str, str]:
     scopes = query_scopes(db_session)
     scopes_dict = {}
     for scope in scopes:
@@ -39,13 +89,58 @@ def query_default_scopes_names(db_session: Session = None):
     return scopes_names
 
 
-def query_scope_names_for_user(user: User, db_session: Session) -> List[str]:
+def query_user_scope_names(user: User, db_session: Session) -> List[str]:
+    """Scope names of the user, from the database"""
     if user.is_superuser:
         scopes = query_scopes(db_session)
-        names = [scope.scope_name for scope in scopes]
-        return names
+        return [scope.scope_name for scope in scopes]
 
     query_user_scopes = db_session.query(UserScope).filter(UserScope.user_id == user.id)
     user_scopes = query_user_scopes.all()
-    names = [user_scope.scope_name for user_scope in user_scopes]
+    return [user_scope.scope_name for user_scope in user_scopes]
+
+
+def query_scope_names_for_user(user: User, db_session: Session) -> List[str]:
+    """Scope names of the user, cached in Redis until the user's scopes change
+    (see app.deps.user_cache)"""
+    if user.is_superuser:
+        return query_user_scope_names(user, db_session)
+
+    key = user_scopes_key(user.id)
+    try:
+        cached = redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"User scopes cache unavailable ({e})")
+        cached = None
+    if cached is not None:
+        return json.loads(cached)
+
+    names = query_user_scope_names(user, db_session)
+    try:
+        redis_client.set(key, json.dumps(names), ex=settings.user_cache_ttl)
+    except RedisError as e:
+        logger.warning(f"User scopes cache unavailable ({e})")
+    return names
+
+
+async def query_scope_names_for_user_async(user: User, db: AsyncSession) -> List[str]:
+    """query_scope_names_for_user for an AsyncSession, only the database query
+    runs in run_sync"""
+    if user.is_superuser:
+        return await db.run_sync(lambda session: query_user_scope_names(user, session))
+
+    key = user_scopes_key(user.id)
+    try:
+        cached = await async_redis_client.get(key)
+    except RedisError as e:
+        logger.warning(f"User scopes cache unavailable ({e})")
+        cached = None
+    if cached is not None:
+        return json.loads(cached)
+
+    names = await db.run_sync(lambda session: query_user_scope_names(user, session))
+    try:
+        await async_redis_client.set(key, json.dumps(names), ex=settings.user_cache_ttl)
+    except RedisError as e:
+        logger.warning(f"User scopes cache unavailable ({e})")
     return names
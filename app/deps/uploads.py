@@ -0,0 +1,214 @@
+import hashlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, Request
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+# Leading bytes of the supported image formats
+SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "image/png",
+    b"\xff\xd8\xff": "image/jpeg",
+}
+SNIFF_SIZE = max(len(signature) for signature in SIGNATURES)
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg"}
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    for signature, content_type in SIGNATURES.items():
+        if head.startswith(signature):
+            return content_type
+    return None
+
+
+class UploadedFile(NamedTuple):
+    path: Path
+    extension: str
+    content_type: str
+    size: int
+    checksum: str
+
+
+class Part:
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.name = ""
+        self.filename: Optional[str] = None
+        self.data = b""
+
+
+class StreamingUpload:
+    """A multipart body with a single file, read as it arrives.
+
+    The file part is written straight to `directory`/`name` with the extension
+    of the content type sniffed from its first bytes, and hashed on the way.
+    The body is refused as soon as it exceeds `max_size`, whether or not the
+    client sent a Content-Length. Other parts are returned as form fields."""
+
+    def __init__(
+        self,
+        request: Request,
+        directory: Path,
+        name: str,
+        max_size: int,
+        content_types: List[str],
+        file_field: str = "file",
+    ):
+        self.request = request
+        self.directory = directory
+        self.name = name
+        self.max_size = max_size
+        self.content_types = content_types
+        self.file_field = file_field
+
+        self.fields: Dict[str, str] = {}
+        self.part = Part()
+        self.header_field = b""
+        self.header_value = b""
+        # Written after each chunk has been parsed, the callbacks can't await
+        self.file_data: List[bytes] = []
+        self.file_ended = False
+        self.complete = False
+
+        self.file: Optional[anyio.AsyncFile] = None
+        self.file_part: Optional[Part] = None
+        self.head = b""
+        self.path: Optional[Path] = None
+        self.content_type: Optional[str] = None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    async def receive(self) -> Tuple[Dict[str, str], UploadedFile]:
+        content_length = self.request.headers.get("content-length")
+        if content_length is not None and not (
+            content_length.isascii() and content_length.isdigit()
+        ):
+            raise HTTPException(400, "Invalid Content-Length header")
+        if content_length and int(content_length) > self.max_size:
+            raise HTTPException(413, f"Request body exceeds {self.max_size} bytes")
+
+        _, options = parse_options_header(self.request.headers.get("content-type"))
+        if b"boundary" not in options:
+            raise HTTPException(400, "Expected a multipart/form-data body")
+        parser = MultipartParser(
+            options[b"boundary"],
+            {
+                "on_part_begin": self.on_part_begin,
+                "on_part_data": self.on_part_data,
+                "on_part_end": self.on_part_end,
+                "on_header_field": self.on_header_field,
+                "on_header_value": self.on_header_value,
+                "on_header_end": self.on_header_end,
+                "on_headers_finished": self.on_headers_finished,
+            },
+        )
+
+        received = 0
+        try:
+            async for chunk in self.request.stream():
+                received += len(chunk)
+                if received > self.max_size:
+                    raise HTTPException(
+                        413, f"Request body exceeds {self.max_size} bytes"
+                    )
+                parser.write(chunk)
+                await self.write_file_data()
+            parser.finalize()
+        except MultipartParseError as e:
+            await self.discard()
+            raise HTTPException(400, f"Malformed multipart body ({e})")
+        except BaseException:
+            await self.discard()
+            raise
+
+        if not self.complete:
+            await self.discard()
+            raise HTTPException(422, f"Field {self.file_field} is required")
+        return self.fields, UploadedFile(
+            self.path,
+            self.path.suffix,
+            self.content_type,
+            self.size,
+            self.sha256.hexdigest(),
+        )
+
+    async def write_file_data(self) -> None:
+        for data in self.file_data:
+            if self.file is None:
+                self.head += data
+                if len(self.head) >= SNIFF_SIZE:
+                    await self.open_file()
+                continue
+            await self.file.write(data)
+            self.sha256.update(data)
+            self.size += len(data)
+        self.file_data.clear()
+
+        if self.file_ended and not self.complete:
+            if self.file is None:
+                await self.open_file()
+            await self.file.aclose()
+            self.complete = True
+
+    async def open_file(self) -> None:
+        self.content_type = sniff_content_type(self.head)
+        if self.content_type not in self.content_types:
+            raise HTTPException(
+                400,
+                f"File type of {self.content_type or 'unknown'} is not supported",
+            )
+        self.path = self.directory / f"{self.name}{EXTENSIONS[self.content_type]}"
+        self.file = await anyio.open_file(self.path, "wb")
+        head, self.head = self.head, b""
+        await self.file.write(head)
+        self.sha256.update(head)
+        self.size += len(head)
+
+    async def discard(self) -> None:
+        """Removes the file, also called when the caller refuses the upload"""
+        if self.file is not None:
+            await self.file.aclose()
+        if self.path is not None:
+            await anyio.Path(self.path).unlink(missing_ok=True)
+
+    def on_part_begin(self) -> None:
+        self.part = Part()
+
+    def on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self.header_value += data[start:end]
+
+    def on_header_end(self) -> None:
+        self.part.headers[self.header_field.lower()] = self.header_value
+        self.header_field, self.header_value = b"", b""
+
+    def on_headers_finished(self) -> None:
+        _, options = parse_options_header(
+            self.part.headers.get(b"content-disposition", b"")
+        )
+        if b"name" not in options:
+            raise HTTPException(400, "Multipart part without a name")
+        self.part.name = options[b"name"].decode("latin-1")
+        if b"filename" in options:
+            if self.part.name != self.file_field or self.file_part is not None:
+                raise HTTPException(
+                    400, f"Only one file is accepted, in field {self.file_field}"
+                )
+            self.part.filename = options[b"filename"].decode("latin-1")
+            self.file_part = self.part
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self.part is self.file_part:
+            self.file_data.append(data[start:end])
+        else:
+            self.part.data += data[start:end]
+
+    def on_part_end(self) -> None:
+        if self.part is self.file_part:
+            self.file_ended = True
+        else:
+            self.fields[self.part.name] = self.part.data.decode(errors="replace")
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from redis.exceptions import RedisError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.core.config import settings
+from app.core.logger import logger
+from app.core.redis import async_redis_client, listen, redis_client
+from app.deps.filters import decode_column_value, encode_column_value
+from app.deps.scopes import user_scopes_key
+from app.models.user import User
+from app.models.user_scope import UserScope
+
+# Changes to these columns change what a user is allowed to do
+AUTHORIZATION_COLUMNS = ("is_active", "is_superuser", "token_version")
+# Credentials stay out of Redis, password checks load the user from the database
+CACHED_COLUMNS = [
+    column for column in User.__table__.columns if column.key != "hashed_password"
+]
+
+
+class UserCache:
+    """Users loaded for authentication, keyed by user id and token `iat`.
+
+    A per-process LRU is checked first, then Redis. Committing a change to a
+    user's authorization columns or scopes deletes the user's entries in Redis,
+    along with their cached scope names, and publishes the user id, so every
+    worker evicts it from its LRU.
+
+    Every call returns a new detached user, without its hashed_password. The
+    LRU keeps serialized values, so requests never share an instance."""
+
+    prefix = "user_cache"
+    channel = "user_cache"
+
+    def __init__(self):
+        self.entries: "OrderedDict[Tuple[str, Any], Tuple[float, Dict[str, Any]]]" = (
+            OrderedDict()
+        )
+        self.lock = threading.Lock()
+        # Invalidations scheduled on the event loop, referenced until they're done
+        self.tasks: Set[asyncio.Task] = set()
+
+    def redis_key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    async def get(self, user_id: str, iat: Any) -> Optional[User]:
+        with self.lock:
+            entry = self.entries.get((user_id, iat))
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end((user_id, iat))
+                return self.deserialize(entry[1])
+
+        if not settings.user_cache_redis:
+            return None
+        try:
+            cached = await async_redis_client.hget(self.redis_key(user_id), str(iat))
+        except RedisError as e:
+            logger.warning(f"User cache unavailable ({e})")
+            return None
+        if cached is None:
+            return None
+        values = json.loads(cached)
+        self.remember(user_id, iat, values)
+        return self.deserialize(values)
+
+    async def set(self, user_id: str, iat: Any, user: User) -> None:
+        values = self.serialize(user)
+        self.remember(user_id, iat, values)
+        if not settings.user_cache_redis:
+            return
+        try:
+            async with async_redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(self.redis_key(user_id), str(iat), json.dumps(values))
+                pipe.expire(self.redis_key(user_id), settings.user_cache_ttl)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"User cache unavailable ({e})")
+
+    def remember(self, user_id: str, iat: Any, values: Dict[str, Any]) -> None:
+        with self.lock:
+            self.entries[user_id, iat] = (
+                time.monotonic() + settings.user_cache_ttl,
+                values,
+            )
+            self.entries.move_to_end((user_id, iat))
+            while len(self.entries) > settings.user_cache_size:
+                self.entries.popitem(last=False)
+
+    def evict(self, user_id: Optional[str]) -> None:
+        with self.lock:
+            if user_id is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[0] == user_id]:
+                del self.entries[key]
+
+    def invalidate(self, *user_ids: str) -> None:
+        for user_id in user_ids:
+            self.evict(user_id)
+        try:
+            with redis_client.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.delete(self.redis_key(user_id), user_scopes_key(user_id))
+                    pipe.publish(self.channel, user_id)
+                pipe.execute()
+        except RedisError as e:
+            logger.warning(f"User cache invalidation not published ({e})")
+
+    async def invalidate_async(self, *user_ids: str) -> None:
+        for user_id in user_ids:
+            self.evict(user_id)
+        try:
+            async with async_redis_client.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.delete(self.redis_key(user_id), user_scopes_key(user_id))
+                    pipe.publish(self.channel, user_id)
+                await pipe.execute()
+        except RedisError as e:
+            logger.warning(f"User cache invalidation not published ({e})")
+
+    def notify(self, user_id: Optional[bytes]) -> None:
+        # After a reconnect the whole LRU is dropped, messages may have been missed
+        self.evict(user_id.decode() if user_id is not None else None)
+
+    async def listen(self) -> None:
+        await listen(self.channel, self.notify)
+
+    @staticmethod
+    def serialize(user: User) -> Dict[str, Any]:
+        return {
+            column.key: encode_column_value(getattr(user, column.key))
+            for column in CACHED_COLUMNS
+        }
+
+    @staticmethod
+    def deserialize(values: Dict[str, Any]) -> User:
+        user = User(
+            **{
+                column.key: decode_column_value(column, values[column.key])
+                for column in CACHED_COLUMNS
+            }
+        )
+        # Behaves like a user loaded by a session which has since been closed,
+        # hashed_password raises DetachedInstanceError rather than being None
+        make_transient_to_detached(user)
+        return user
+
+
+user_cache = UserCache()
+
+
+@event.listens_for(Session, "after_flush")
+def collect_invalidated_users(session: Session, flush_context) -> None:
+    user_ids = session.info.setdefault("invalidated_users", set())
+    for instance in session.dirty | session.deleted:
+        if isinstance(instance, User):
+            state = inspect(instance)
+            if instance in session.deleted or any(
+                state.attrs[column].history.has_changes()
+                for column in AUTHORIZATION_COLUMNS
+            ):
+                user_ids.add(str(instance.id))
+    for instance in session.new | session.dirty | session.deleted:
+        if isinstance(instance, UserScope):
+            user_ids.add(str(instance.user_id))
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_users(session: Session) -> None:
+    user_ids = session.info.pop("invalidated_users", None)
+    if not user_ids:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        user_cache.invalidate(*user_ids)
+        return
+    # An AsyncSession commits on the event loop, which mustn't wait on Redis
+    for user_id in user_ids:
+        user_cache.evict(user_id)
+    task = loop.create_task(user_cache.invalidate_async(*user_ids))
+    user_cache.tasks.add(task)
+    task.add_done_callback(user_cache.tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_invalidated_users(session: Session) -> None:
+    session.info.pop("invalidated_users", None)
@@ -1,50 +1,154 @@
 from datetime import timedelta
+from functools import lru_cache
+from inspect import signature
+from typing import Callable, Dict, Union
 from uuid import UUID
 
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm.session import Session
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.params import Depends as DependsParam
+from fastapi.security import SecurityScopes
 from fastapi_login import LoginManager
 from pydantic import EmailStr
-from passlib.context import CryptContext
+from starlette.requests import Request
 
 from app.models.user import User
+from app.models.user_scope import UserScope
 from app.core.config import settings
-from app.deps.db import DBSessionManager
-from app.deps.scopes import query_scopes_dict
-
-manager = LoginManager(
+from app.core.passwords import password_pool
+from app.db import AsyncSessionLocal, request_sessions
+from app.deps.db import get_async_db
+from app.deps.user_cache import user_cache
+
+
+class CachedLoginManager(LoginManager):
+    """LoginManager which keeps loaded users in the user cache and only accepts
+    tokens issued for the user's current token version"""
+
+    async def __call__(self, request: Request, security_scopes: SecurityScopes = None):
+        """LoginManager.__call__, loading the user through the request's session
+        on the primary, the one the handler gets from get_db or get_async_db"""
+        token = await self._get_token(request)
+        if token is None:
+            raise self.not_authenticated_exception
+        if security_scopes is not None and security_scopes.scopes:
+            if not self.has_scopes(token, security_scopes):
+                raise self.not_authenticated_exception
+
+        db_session = None
+        sessions = request_sessions.get()
+        if sessions is not None:
+            endpoint = request.scope.get("endpoint")
+            if endpoint is not None and uses_async_session(endpoint):
+                db_session = sessions.get_async()
+            else:
+                db_session = sessions.get()
+        return await self.get_current_user(token, db_session)
+
+    async def get_current_user(
+        self, token: str, db_session: Union[AsyncSession, Session] = None
+    ):
+        payload = self._get_payload(token)
+        user_identifier = payload.get("sub")
+        if user_identifier is None:
+            raise self.not_authenticated_exception
+
+        iat = payload.get("iat")
+        user = await user_cache.get(user_identifier, iat)
+        if user is None:
+            user = await query_user(user_identifier, db_session)
+            if user is None:
+                raise self.not_authenticated_exception
+            await user_cache.set(user_identifier, iat, user)
+        if payload.get("ver", 0) != user.token_version:
+            raise self.not_authenticated_exception
+        return user
+
+    def set_scopes(self, scopes: Dict[str, str]) -> None:
+        """Scopes shown in the OpenAPI security scheme"""
+        self.model.flows.password.scopes.update(scopes)
+
+
+@lru_cache()
+def uses_async_session(endpoint: Callable) -> bool:
+    """Whether the handler declares the get_async_db session"""
+    return any(
+        isinstance(parameter.default, DependsParam)
+        and parameter.default.dependency is get_async_db
+        for parameter in signature(endpoint).parameters.values()
+    )
+
+
+manager = CachedLoginManager(
     secret=settings.secret_key,
     token_url="/login",
     default_expiry=timedelta(minutes=settings.access_token_expire_minutes),
-    scopes=query_scopes_dict(),
+    # Filled in from the scope catalog at startup
+    scopes={},
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def rehash_password(user_id: UUID, hashed_password: str, password: str):
+    """Replaces a hash made with an outdated cost factor, after a login has
+    verified the password. Skipped when the password changed meanwhile."""
+    try:
+        new_hashed_password = await password_pool.hash(password)
+    except HTTPException:
+        return  # the pool is busy, the next login retries
+    async with AsyncSessionLocal() as db_session:
+        await db_session.execute(
+            update(User)
+            .where(User.id == user_id, User.hashed_password == hashed_password)
+            .values(hashed_password=new_hashed_password)
+        )
+        await db_session.commit()
 
 
+# Runs on user cache misses, on the session of the request when it has one
 @manager.user_loader()
-def query_user(user_id: UUID, db_session: Session = None):
+async def query_user(user_id: UUID, db_session: Union[AsyncSession, Session] = None):
     if not db_session:
-        with DBSessionManager() as db_session:
-            query_user = db_session.query(User).filter(User.id == user_id)
-            user = query_user.first()
-            return user
+        async with AsyncSessionLocal() as db_session:
+            return await query_user(user_id, db_session)
+    statement = select(User).filter(User.id == user_id)
     try:
-        query_user = db_session.query(User).filter(User.id == user_id)
-        user = query_user.first()
+        if isinstance(db_session, AsyncSession):
+            user = await db_session.scalar(statement)
+        else:
+            user = await run_in_threadpool(db_session.scalar, statement)
     except:
         return None
     return user
 
 
+def is_revoked(user: User, column: str) -> bool:
+    history = inspect(user).attrs[column].history
+    return bool(history.deleted and history.deleted[0]) and not getattr(user, column)
+
+
+@event.listens_for(Session, "before_flush")
+def bump_token_versions(session: Session, flush_context, instances) -> None:
+    """Tokens carry the user's scopes, so revoking a scope, the superuser flag
+    or deactivating a user bumps the user's token version"""
+    user_ids = {
+        instance.user_id
+        for instance in session.deleted
+        if isinstance(instance, UserScope)
+    }
+    for instance in session.dirty:
+        if isinstance(instance, User) and (
+            is_revoked(instance, "is_superuser") or is_revoked(instance, "is_active")
+        ):
+            user_ids.add(instance.id)
+    for user_id in user_ids:
+        user = session.get(User, user_id)
+        if user:
+            user.token_version = User.token_version + 1
+
+
 def query_user_by_username(username: str, db_session: Session):
     query_user = db_session.query(User).filter(User.username == username)
     user = query_user.first()
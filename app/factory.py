@@ -1,9 +1,16 @@
+import asyncio
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.routing import APIRoute
+from sqlalchemy.exc import SQLAlchemyError
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api import api_router
 from app.core.config import settings
+from app.core.logger import logger
+from app.core.middleware import PoolCheckoutMiddleware, PrimarySessionsMiddleware
+from app.core.middleware import ReadYourWritesMiddleware
 
 
 def create_app():
@@ -15,6 +22,9 @@ def create_app():
     )
     setup_routers(app)
     init_db_hooks(app)
+    setup_replica_middleware(app)
+    app.add_middleware(PrimarySessionsMiddleware)
+    app.add_middleware(PoolCheckoutMiddleware)
     setup_cors_middleware(app)
     return app
 
@@ -32,11 +42,22 @@ def setup_cors_middleware(app):
             allow_origins=[str(origin) for origin in settings.backend_cors_origins],
             allow_credentials=True,
             allow_methods=["*"],
-            expose_headers=["Content-Range", "Range"],
+            expose_headers=[
+                "Content-Range",
+                "Range",
+                "X-Next-Cursor",
+                "X-Total-Count-Mode",
+                "X-Cache",
+            ],
             allow_headers=["Authorization", "Range", "Content-Range"],
         )
 
 
+def setup_replica_middleware(app: FastAPI) -> None:
+    if settings.database_replica_urls:
+        app.add_middleware(ReadYourWritesMiddleware)
+
+
 def use_route_names_as_operation_ids(app: FastAPI) -> None:
     """
     Simplify operation IDs so that generated API clients have simpler function
@@ -54,12 +75,41 @@ def use_route_names_as_operation_ids(app: FastAPI) -> None:
 
 
 def init_db_hooks(app: FastAPI) -> None:
-    from app.db import database
+    from app.core.passwords import password_pool
+    from app.core.redis import async_redis_client
+    from app.core.scheduler import job_queue
+    from app.db import async_engine, replicas
+    from app.deps.reference_data import reference_data
+    from app.deps.scopes import query_scopes_dict, scope_catalog
+    from app.deps.user_cache import user_cache
+    from app.deps.users import manager
+
+    monitor = None
+    listeners = []
 
     @app.on_event("startup")
     async def startup():
-        await database.connect()
+        nonlocal monitor
+        if replicas:
+            monitor = asyncio.create_task(replicas.monitor())
+        listeners.append(asyncio.create_task(reference_data.listen()))
+        listeners.append(asyncio.create_task(user_cache.listen()))
+        listeners.append(asyncio.create_task(scope_catalog.listen()))
+        await password_pool.start()
+        try:
+            await run_in_threadpool(reference_data.load)
+            manager.set_scopes(await run_in_threadpool(query_scopes_dict))
+        except SQLAlchemyError as e:
+            logger.warning(f"Caches not warmed at startup ({e})")
 
     @app.on_event("shutdown")
     async def shutdown():
-        await database.disconnect()
+        for listener in listeners:
+            listener.cancel()
+        if monitor:
+            monitor.cancel()
+            await replicas.dispose()
+        await async_engine.dispose()
+        await async_redis_client.connection_pool.disconnect()
+        await job_queue.close()
+        password_pool.shutdown()
@@ -1,6 +1,6 @@
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql.schema import Column, ForeignKey
-from sqlalchemy.sql.sqltypes import Integer, String
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
+from sqlalchemy.sql.sqltypes import Float, Integer, String
 
 from app.db import Base
 
@@ -9,10 +9,17 @@ class City(Base):
     __tablename__ = "cities"
 
     id = Column(Integer, primary_key=True)
-    voivodeship_id = Column(Integer, ForeignKey("voivodeships.id"), nullable=False)
+    voivodeship_id = Column(
+        Integer, ForeignKey("voivodeships.id"), nullable=False, index=True
+    )
     voivodeship = relationship("Voivodeship", back_populates="cities")
     name = Column(String(length=32), nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
 
     classifieds = relationship(
         "Classified", back_populates="city", cascade="all, delete"
     )
+
+    # Bounding box lookups of nearby cities
+    __table_args__ = (Index("ix_cities_latitude_longitude", latitude, longitude),)
@@ -1,9 +1,10 @@
 import enum
 
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, Computed, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import DateTime, Enum, Integer, Numeric, String
 
 from app.db import Base
@@ -14,6 +15,28 @@ class ClassifiedStatus(int, enum.Enum):
     hidden = enum.auto()
 
 
+# Stemmed Polish lexemes rank above the unstemmed ("simple") ones, which still
+# match words the Polish dictionary doesn't know (names, brands, model numbers)
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('polish', title), 'A') || "
+    "setweight(to_tsvector('polish', content), 'B') || "
+    "setweight(to_tsvector('simple', title), 'C') || "
+    "setweight(to_tsvector('simple', content), 'D')"
+)
+
+# PostgreSQL doesn't ship a Polish stemmer, fall back to a copy of "simple" until
+# a Polish dictionary is installed and the configuration altered to use it
+CREATE_POLISH_CONFIG = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'polish') THEN
+        CREATE TEXT SEARCH CONFIGURATION polish (COPY = simple);
+    END IF;
+END
+$$
+"""
+
+
 class Classified(Base):
     __tablename__ = "classifieds"
 
@@ -44,3 +67,47 @@ class Classified(Base):
     city = relationship("City", back_populates="classifieds")
 
     images = relationship("Image", back_populates="classified", cascade="all, delete")
+
+    search_vector = deferred(
+        Column(TSVECTOR, Computed(SEARCH_VECTOR, persisted=True), nullable=False)
+    )
+
+    # Indexes backing the filters and sort columns accepted by the list endpoints
+    __table_args__ = (
+        Index("ix_classifieds_created_id", created, id),
+        Index("ix_classifieds_updated_id", updated, id),
+        Index("ix_classifieds_price_id", price, id),
+        Index("ix_classifieds_category_id_created_id", category_id, created, id),
+        Index("ix_classifieds_category_id_price_id", category_id, price, id),
+        Index("ix_classifieds_city_id_created_id", city_id, created, id),
+        Index("ix_classifieds_user_id_created_id", user_id, created, id),
+        Index(
+            "ix_classifieds_active_created_id",
+            created,
+            id,
+            postgresql_where=status == ClassifiedStatus.active,
+        ),
+        Index(
+            "ix_classifieds_active_category_id_price_id",
+            category_id,
+            price,
+            id,
+            postgresql_where=status == ClassifiedStatus.active,
+        ),
+        Index("ix_classifieds_search_vector", "search_vector", postgresql_using="gin"),
+        # Title prefix lookups for suggestions; the trigram index used by fuzzy
+        # search needs the pg_trgm extension and is only created by migrations
+        Index(
+            "ix_classifieds_active_title_lower",
+            func.lower(title).label("title_lower"),
+            postgresql_ops={"title_lower": "text_pattern_ops"},
+            postgresql_where=status == ClassifiedStatus.active,
+        ),
+    )
+
+
+event.listen(
+    Classified.__table__,
+    "before_create",
+    DDL(CREATE_POLISH_CONFIG).execute_if(dialect="postgresql"),
+)
@@ -0,0 +1,72 @@
+from sqlalchemy import DDL, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.sql.expression import case, cast, select, tuple_
+from sqlalchemy.sql.functions import func
+from sqlalchemy.sql.schema import Column, MetaData, Table
+from sqlalchemy.sql.sqltypes import ARRAY, BigInteger, Integer, Numeric, String
+
+from app.db import Base
+from app.models.city import City
+from app.models.classified import Classified, ClassifiedStatus
+
+# Lower bounds of the price buckets; a bucket value of n counts prices in
+# [PRICE_BUCKETS[n - 1], PRICE_BUCKETS[n]), 0 those below the first bound
+PRICE_BUCKETS = [0, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000]
+
+
+def classified_facets_query(*filters):
+    """Counts active classifieds per category, voivodeship, city and price
+    bucket, in one pass over the rows matching the filters"""
+    classifieds, cities = Classified.__table__.c, City.__table__.c
+    bounds = cast(postgresql.array(PRICE_BUCKETS), ARRAY(Numeric))
+    facets = {
+        "category_id": classifieds.category_id,
+        "voivodeship_id": cities.voivodeship_id,
+        "city_id": classifieds.city_id,
+        "price": func.width_bucket(classifieds.price, bounds),
+    }
+    facet = case(
+        *[(func.grouping(column) == 0, name) for name, column in facets.items()]
+    )
+    return (
+        select(
+            facet.label("facet"),
+            func.coalesce(*facets.values()).label("value"),
+            func.count().label("count"),
+        )
+        .join_from(Classified.__table__, City.__table__)
+        .where(classifieds.status == ClassifiedStatus.active, *filters)
+        .group_by(func.grouping_sets(*[tuple_(column) for column in facets.values()]))
+    )
+
+
+# Kept out of Base.metadata, so create_all and autogenerate don't treat the
+# materialized view as a table
+classified_facets = Table(
+    "classified_facets",
+    MetaData(),
+    Column("facet", String, primary_key=True),
+    Column("value", Integer, primary_key=True),
+    Column("count", BigInteger, nullable=False),
+)
+
+create_classified_facets = classified_facets_query().compile(
+    dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+)
+
+event.listen(
+    Base.metadata,
+    "after_create",
+    DDL(
+        f"CREATE MATERIALIZED VIEW classified_facets AS {create_classified_facets};"
+        "CREATE UNIQUE INDEX ix_classified_facets_facet_value "
+        "ON classified_facets (facet, value)"
+    ).execute_if(dialect="postgresql"),
+)
+event.listen(
+    Base.metadata,
+    "before_drop",
+    DDL("DROP MATERIALIZED VIEW IF EXISTS classified_facets").execute_if(
+        dialect="postgresql"
+    ),
+)
@@ -1,6 +1,6 @@
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import Integer, String
 
 from app.db import Base
@@ -12,8 +12,23 @@ class Image(Base):
     id = Column(Integer, primary_key=True)
     filename = Column(UUID(as_uuid=True), nullable=False, unique=True)
     extension = Column(String(length=8), nullable=False)
+    # Hex SHA-256 of the file served, as uploaded then as rewritten by process_image
+    checksum = Column(String(length=64))
+    # NULL for images stored flat in images_upload_path, before blobs
+    blob_checksum = Column(String(length=64), ForeignKey("image_blobs.checksum"))
+    # Filled in by the process_image job, NULL until it has run
+    width = Column(Integer)
+    height = Column(Integer)
+    size = Column(Integer)
+    # Resized copies, [{"width", "height", "format", "size", "checksum"}]
+    variants = Column(JSONB)
 
     classified_id = Column(Integer, ForeignKey("classifieds.id"), nullable=False)
     classified = relationship(
         "Classified", back_populates="images", cascade="all, delete"
     )
+
+    __table_args__ = (
+        Index("ix_images_classified_id_id", classified_id, id),
+        Index("ix_images_blob_checksum", blob_checksum),
+    )
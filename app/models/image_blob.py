@@ -0,0 +1,20 @@
+from sqlalchemy.sql.schema import Column
+from sqlalchemy.sql.sqltypes import Boolean, Integer, String
+
+from app.db import Base
+
+
+class ImageBlob(Base):
+    """A stored image file, shared by the images uploaded with the same bytes.
+
+    Addressed by the SHA-256 of the bytes as uploaded, which process_image
+    rewrites in place without metadata. The file is removed along with the
+    last image referencing it."""
+
+    __tablename__ = "image_blobs"
+
+    checksum = Column(String(length=64), primary_key=True)
+    extension = Column(String(length=8), nullable=False)
+    refcount = Column(Integer, nullable=False, default=1)
+    # Rewritten by process_image, with its variants written
+    processed = Column(Boolean, nullable=False, default=False)
@@ -1,7 +1,7 @@
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.schema import Column, ForeignKey
+from sqlalchemy.sql.schema import Column, ForeignKey, Index
 from sqlalchemy.sql.sqltypes import Boolean, DateTime, Integer, String
 
 from app.db import Base
@@ -21,3 +21,8 @@ class Message(Base):
     author = relationship("User", back_populates="messages")
 
     sent = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_messages_conversation_id_id", conversation_id, id),
+        Index("ix_messages_author_id_id", author_id, id),
+    )
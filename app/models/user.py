@@ -3,7 +3,7 @@ from uuid import uuid4
 from sqlalchemy import Column, DateTime
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.functions import func
-from sqlalchemy.sql.sqltypes import Boolean, String
+from sqlalchemy.sql.sqltypes import Boolean, Integer, String
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.db import Base
@@ -18,6 +18,8 @@ class User(Base):
     hashed_password = Column(String(length=72), nullable=False)
     is_active = Column(Boolean, default=True, nullable=False)
     is_superuser = Column(Boolean, default=False, nullable=False)
+    # Tokens carry the version they were issued for, bumping it revokes them
+    token_version = Column(Integer, default=0, server_default="0", nullable=False)
 
     created = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
     updated = Column(
@@ -0,0 +1,17 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class BulkIds(BaseModel):
+    """react-admin's deleteMany"""
+
+    ids: List[int] = Field(min_items=1)
+
+
+class BulkResult(BaseModel):
+    """Outcome of an item of a bulk request, results are in the request's order"""
+
+    id: Optional[int]
+    status: int
+    detail: Optional[str]
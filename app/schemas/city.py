@@ -1,9 +1,13 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 
 class CityCreate(BaseModel):
     name: str = Field(max_length=32)
     voivodeship_id: int
+    latitude: Optional[float] = Field(ge=-90, le=90)
+    longitude: Optional[float] = Field(ge=-180, le=180)
 
 
 class CityUpdate(CityCreate):
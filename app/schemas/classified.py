@@ -1,9 +1,13 @@
 from decimal import Decimal
+from typing import List, Optional
 from uuid import UUID
 
 from pydantic import BaseModel, Field
 
 from app.models.classified import ClassifiedStatus
+from app.schemas.category import Category
+from app.schemas.city import City
+from app.schemas.voivodeship import Voivodeship
 
 
 class ClassifiedCreate(BaseModel):
@@ -19,6 +23,22 @@ class ClassifiedUpdate(ClassifiedCreate):
     pass
 
 
+class ClassifiedPatch(BaseModel):
+    title: Optional[str] = Field(max_length=32)
+    content: Optional[str] = Field(max_length=8192)
+    price: Optional[Decimal]
+    category_id: Optional[int]
+    city_id: Optional[int]
+    status: Optional[ClassifiedStatus]
+
+
+class ClassifiedUpdateMany(BaseModel):
+    """react-admin's updateMany, the data is set on every classified"""
+
+    ids: List[int] = Field(min_items=1)
+    data: ClassifiedPatch
+
+
 class Classified(ClassifiedCreate):
     id: int
     status: ClassifiedStatus = Field(default=ClassifiedStatus.active)
@@ -28,6 +48,70 @@ class Classified(ClassifiedCreate):
         orm_mode = True
 
 
+class ClassifiedSeller(BaseModel):
+    id: UUID
+    username: str
+
+    class Config:
+        orm_mode = True
+
+
+class ClassifiedExpanded(Classified):
+    """Only the relations asked for with `expand` are set, and serialized"""
+
+    city: Optional[City]
+    voivodeship: Optional[Voivodeship]
+    category: Optional[Category]
+    user: Optional[ClassifiedSeller]
+    first_image_id: Optional[int]
+
+
+class ClassifiedPartial(ClassifiedExpanded):
+    """Listed classified, only the fields asked for with `fields` are set"""
+
+    title: Optional[str]
+    content: Optional[str]
+    price: Optional[Decimal]
+    category_id: Optional[int]
+    city_id: Optional[int]
+    status: Optional[ClassifiedStatus]
+    user_id: Optional[UUID]
+
+
+class ClassifiedSearchResult(ClassifiedPartial):
+    rank: float
+    headline: str
+
+
+class ClassifiedNearby(ClassifiedPartial):
+    distance_km: float
+
+
+class ClassifiedImport(BaseModel):
+    imported: int
+    rejected: int
+    # Invalid rows as NDJSON, on the server
+    rejects_file: Optional[str]
+
+
+class FacetCount(BaseModel):
+    value: int
+    count: int
+
+
+class PriceFacetCount(BaseModel):
+    min: Optional[Decimal]
+    max: Optional[Decimal]
+    count: int
+
+
+class ClassifiedFacets(BaseModel):
+    category_id: List[FacetCount] = []
+    voivodeship_id: List[FacetCount] = []
+    city_id: List[FacetCount] = []
+    price: List[PriceFacetCount] = []
+
+
 class ClassifiedDelete(BaseModel):
     id: int
 
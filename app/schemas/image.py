@@ -1,10 +1,24 @@
+from typing import List, Optional
+
 from pydantic import BaseModel, Field
 from uuid import UUID
 
 
+class ImageVariant(BaseModel):
+    width: int
+    height: int
+    format: str
+    size: int
+
+
 class Image(BaseModel):
     id: int
     classified_id: int
+    checksum: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    size: Optional[int]
+    variants: Optional[List[ImageVariant]]
 
     class Config:
         orm_mode = True
@@ -22,3 +36,6 @@ class ImageDB(Image):
 
 class ImageDelete(BaseModel):
     id: int
+
+    class Config:
+        orm_mode = True
@@ -1,3 +1,4 @@
+from typing import List
 from uuid import UUID
 
 from pydantic import BaseModel, Field
@@ -12,6 +13,13 @@ class MessageUpdate(BaseModel):
     displayed: bool
 
 
+class MessageUpdateMany(BaseModel):
+    """react-admin's updateMany, the data is set on every message"""
+
+    ids: List[int] = Field(min_items=1)
+    data: MessageUpdate
+
+
 class Message(MessageCreate):
     id: int
     author_id: UUID
@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, List, Optional
 
 from pydantic.main import BaseModel
 
@@ -6,4 +6,12 @@ from pydantic.main import BaseModel
 class RequestParams(BaseModel):
     skip: int
     limit: int
-    order_by: Any
+    order_by: List[Any]
+    filters: List[Any] = []
+    sort_column: str
+    sort_order: str
+    tie_breaker: str
+    keyset: bool = False
+    after: Any = None
+    # Primary keys filtered on, the rows are returned in their order
+    ids: Optional[List[Any]] = None
@@ -0,0 +1,107 @@
+"""Compares requests/s of the sync and async database paths.
+
+The same paginated classifieds query is served by a `def` endpoint on a
+Session (run in the anyio threadpool) and by an `async def` endpoint on an
+AsyncSession, in a uvicorn worker started for the benchmark. Each endpoint is
+then hit by concurrent clients for a fixed duration:
+
+    python -m benchmarks.async_db --concurrency 200 --duration 10
+"""
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, List
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.query import Query as ORMQuery
+from sqlalchemy.orm.session import Session
+from starlette.responses import Response
+
+from app.deps.db import get_async_db, get_db
+from app.deps.request_params import paginate, paginate_async
+from app.deps.request_params import parse_react_admin_params
+from app.models.classified import Classified
+from app.schemas.classified import Classified as ClassifiedSchema
+from app.schemas.request_params import RequestParams
+from benchmarks.utils import serve, summarize
+
+app = FastAPI()
+
+
+@app.get("/sync", response_model=List[ClassifiedSchema])
+def get_classifieds_sync(
+    response: Response,
+    db: Session = Depends(get_db),
+    request_params: RequestParams = Depends(parse_react_admin_params(Classified)),
+) -> Any:
+    return paginate(response, db.query(Classified), request_params)
+
+
+@app.get("/async", response_model=List[ClassifiedSchema])
+async def get_classifieds_async(
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    request_params: RequestParams = Depends(parse_react_admin_params(Classified)),
+) -> Any:
+    return await paginate_async(response, db, ORMQuery(Classified), request_params)
+
+
+async def run_client(client: httpx.AsyncClient, path: str, deadline: float, stats):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            resp = await client.get(path, params={"range": "[0, 19]"})
+            resp.raise_for_status()
+        except httpx.HTTPError:
+            stats["errors"] += 1
+            continue
+        stats["latencies"].append(time.monotonic() - started)
+
+
+async def benchmark(base_url: str, path: str, concurrency: int, duration: float):
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as c:
+        # Warm up the connection pools before measuring
+        await asyncio.gather(
+            *[c.get(path) for _ in range(concurrency)], return_exceptions=True
+        )
+
+        stats = {"errors": 0, "latencies": []}
+        deadline = time.monotonic() + duration
+        await asyncio.gather(
+            *[run_client(c, path, deadline, stats) for _ in range(concurrency)]
+        )
+
+    latencies = stats["latencies"]
+    print(
+        f"{path:>6}: {len(latencies) / duration:8.1f} req/s, "
+        f"{summarize(latencies)}, {stats['errors']} errors"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    # Keep per-request client logging out of the measurements
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # A fresh server for each path, so requests left over from one run can't
+    # slow down the next
+    for path in ("/sync", "/async"):
+        server = serve("benchmarks.async_db:app", args.port)
+        try:
+            base_url = f"http://127.0.0.1:{args.port}"
+            asyncio.run(benchmark(base_url, path, args.concurrency, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Measures /classifieds latency during a storm of logins.
+
+The application is served by a uvicorn worker started for the benchmark.
+/classifieds is first measured alone, then while logins are fired at a fixed
+rate. Classifieds requests carry the read-primary cookie, so they skip the
+response cache and query the database:
+
+    python -m benchmarks.login_storm --logins-per-second 100 --duration 10
+"""
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from app.core.config import settings
+from app.core.passwords import hash_password
+from app.deps.db import DBSessionManager
+from app.models.user import User
+from benchmarks.utils import serve, summarize
+
+
+async def run_client(client: httpx.AsyncClient, deadline: float, stats):
+    while time.monotonic() < deadline:
+        started = time.monotonic()
+        try:
+            resp = await client.get("/classifieds", params={"range": "[0, 19]"})
+            resp.raise_for_status()
+        except httpx.HTTPError:
+            stats["errors"] += 1
+            continue
+        stats["latencies"].append(time.monotonic() - started)
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str, results):
+    try:
+        resp = await client.post(
+            "/login", data={"username": username, "password": password}
+        )
+        results[resp.status_code] += 1
+    except httpx.HTTPError:
+        results["errors"] += 1
+
+
+async def storm(
+    client: httpx.AsyncClient, rate: float, deadline: float, user: User, password
+):
+    results = Counter()
+    logins = []
+    while time.monotonic() < deadline:
+        logins.append(
+            asyncio.create_task(login(client, user.username, password, results))
+        )
+        await asyncio.sleep(1 / rate)
+    await asyncio.gather(*logins)
+    return results
+
+
+async def benchmark(base_url: str, args, user: User, password: str):
+    cookies = {settings.read_primary_cookie: "1"}
+    async with httpx.AsyncClient(
+        base_url=base_url, cookies=cookies, timeout=30
+    ) as classifieds_client, httpx.AsyncClient(
+        base_url=base_url, limits=httpx.Limits(max_connections=None), timeout=30
+    ) as login_client:
+        for phase in ("alone", "login storm"):
+            stats = {"errors": 0, "latencies": []}
+            deadline = time.monotonic() + args.duration
+            clients = [
+                run_client(classifieds_client, deadline, stats)
+                for _ in range(args.concurrency)
+            ]
+            if phase == "alone":
+                await asyncio.gather(*clients)
+                logins = ""
+            else:
+                _, results = await asyncio.gather(
+                    asyncio.gather(*clients),
+                    storm(
+                        login_client, args.logins_per_second, deadline, user, password
+                    ),
+                )
+                logins = ", logins: " + ", ".join(
+                    f"{count} x {status}"
+                    for status, count in sorted(results.items(), key=str)
+                )
+            print(
+                f"/classifieds {phase:>11}: {summarize(stats['latencies'])}, "
+                f"{stats['errors']} errors{logins}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins-per-second", type=float, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    # Keep per-request client logging out of the measurements
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    password = uuid.uuid4().hex
+    with DBSessionManager() as db:
+        user = User(
+            username=f"benchmark-{uuid.uuid4().hex[:16]}",
+            email=f"{uuid.uuid4().hex}@example.com",
+            hashed_password=hash_password(password),
+        )
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+
+    server = serve("main:app", args.port)
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        asyncio.run(benchmark(base_url, args, user, password))
+    finally:
+        server.terminate()
+        server.wait()
+        with DBSessionManager() as db:
+            db.delete(db.get(User, user.id))
+            db.commit()
+
+
+if __name__ == "__main__":
+    main()
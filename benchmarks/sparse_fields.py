@@ -0,0 +1,120 @@
+"""Compares payload size and latency of full and summary classified listings.
+
+100 classifieds with long contents are created in a category of their own,
+then a 100-row page of /classifieds/category/{id} is requested with
+`fields=*`, every column as before sparse fieldsets, and with the default
+summary projection. Requests carry the read-primary cookie, so they skip the
+response cache and query the database:
+
+    python -m benchmarks.sparse_fields --duration 10
+"""
+import argparse
+import asyncio
+import logging
+import time
+import uuid
+
+import httpx
+
+from app.core.config import settings
+from app.deps.db import DBSessionManager
+from app.models.category import Category
+from app.models.city import City
+from app.models.classified import Classified
+from app.models.user import User
+from app.models.voivodeship import Voivodeship
+from benchmarks.utils import serve, summarize
+
+PAGE_SIZE = 100
+
+
+def create_classifieds(content_size: int) -> int:
+    """Returns the id of the category they're in"""
+    with DBSessionManager() as db:
+        user = User(
+            username=f"benchmark-{uuid.uuid4().hex[:16]}",
+            email=f"{uuid.uuid4().hex}@example.com",
+            hashed_password="",
+        )
+        city = City(
+            name=f"benchmark-{uuid.uuid4().hex[:16]}",
+            voivodeship=Voivodeship(name=f"benchmark-{uuid.uuid4().hex[:16]}"),
+        )
+        category = Category(
+            name=f"benchmark-{uuid.uuid4().hex[:16]}", description="benchmark"
+        )
+        db.add_all(
+            Classified(
+                title=f"Classified {i}",
+                content=("lorem ipsum " * content_size)[:content_size],
+                price=i,
+                user=user,
+                city=city,
+                category=category,
+            )
+            for i in range(PAGE_SIZE)
+        )
+        db.commit()
+        return category.id
+
+
+def delete_classifieds(category_id: int) -> None:
+    with DBSessionManager() as db:
+        category = db.get(Category, category_id)
+        classified = db.query(Classified).filter_by(category_id=category_id).first()
+        user, city = classified.user, classified.city
+        db.query(Classified).filter_by(category_id=category_id).delete()
+        for instance in (category, user, city, city.voivodeship):
+            db.delete(instance)
+        db.commit()
+
+
+async def benchmark(base_url: str, category_id: int, duration: float):
+    cookies = {settings.read_primary_cookie: "1"}
+    path = f"/classifieds/category/{category_id}"
+    async with httpx.AsyncClient(
+        base_url=base_url, cookies=cookies, timeout=30
+    ) as client:
+        for name, fields in (("full", "*"), ("summary", None)):
+            params = {"range": f"[0, {PAGE_SIZE - 1}]"}
+            if fields:
+                params["fields"] = fields
+            # Warm up the connection pools before measuring
+            resp = await client.get(path, params=params)
+            resp.raise_for_status()
+
+            latencies = []
+            deadline = time.monotonic() + duration
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                resp = await client.get(path, params=params)
+                resp.raise_for_status()
+                latencies.append(time.monotonic() - started)
+            print(
+                f"{name:>7}: {len(resp.content):8d} bytes per page, "
+                f"{summarize(latencies)}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--content-size", type=int, default=4096)
+    parser.add_argument("--port", type=int, default=8767)
+    args = parser.parse_args()
+    # Keep per-request client logging out of the measurements
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    category_id = create_classifieds(args.content_size)
+    server = serve("main:app", args.port)
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        asyncio.run(benchmark(base_url, category_id, args.duration))
+    finally:
+        server.terminate()
+        server.wait()
+        delete_classifieds(category_id)
+
+
+if __name__ == "__main__":
+    main()
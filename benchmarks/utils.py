@@ -0,0 +1,37 @@
+import subprocess
+import sys
+import time
+from typing import List
+
+import httpx
+
+
+def serve(app: str, port: int) -> subprocess.Popen:
+    """Starts a uvicorn worker for the app and waits until it accepts requests"""
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            app,
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ]
+    )
+    while True:
+        if server.poll() is not None:
+            raise SystemExit("The benchmark server exited")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/docs")
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+
+def summarize(latencies: List[float]) -> str:
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] if latencies else 0
+    p95 = latencies[int(len(latencies) * 0.95)] if latencies else 0
+    return f"p50 {p50 * 1000:6.1f} ms, p95 {p95 * 1000:6.1f} ms"
@@ -1,3 +1,5 @@
+import json
+
 from sqlalchemy.orm.session import Session
 from starlette.testclient import TestClient
 
@@ -29,6 +31,63 @@ class TestGetCategories:
         assert resp.headers["Content-Range"] == "0-1/1"
         assert len(resp.json()) == 1
 
+    def test_get_categories_count_mode(
+        self, db: Session, client: TestClient, create_user, create_category
+    ):
+        user: User = create_user()
+        create_category(user=user)
+        resp = client.get("/categories")
+        assert resp.status_code == 200
+        assert resp.headers["X-Total-Count-Mode"] == settings.count_strategy
+
+    def test_get_categories_cursor(
+        self, db: Session, client: TestClient, create_user, create_category
+    ):
+        user: User = create_user()
+        for _ in range(5):
+            create_category(user=user)
+        expected = [
+            category.id for category in db.query(Category).order_by(Category.id)
+        ]
+
+        received, cursor = [], "*"
+        while cursor:
+            resp = client.get(
+                "/categories",
+                params={
+                    "sort": json.dumps(["id", "ASC"]),
+                    "range": json.dumps([0, 1]),
+                    "cursor": cursor,
+                },
+            )
+            assert resp.status_code == 200, resp.text
+            assert len(resp.json()) <= 2
+            received.extend(category["id"] for category in resp.json())
+            # Only the first page is counted
+            total = resp.headers["Content-Range"].split("/")[1]
+            assert (total == "*") == (cursor != "*")
+            cursor = resp.headers.get("X-Next-Cursor")
+        assert received == expected
+
+    def test_get_categories_cursor_sort_mismatch(
+        self, db: Session, client: TestClient, create_user, create_category
+    ):
+        user: User = create_user()
+        create_category(user=user)
+        create_category(user=user)
+        resp = client.get("/categories", params={"range": "[0, 0]", "cursor": "*"})
+        assert resp.status_code == 200, resp.text
+        cursor = resp.headers["X-Next-Cursor"]
+
+        resp = client.get(
+            "/categories", params={"sort": '["name", "ASC"]', "cursor": cursor}
+        )
+        assert resp.status_code == 400, resp.text
+
+    def test_get_categories_invalid_cursor(self, client: TestClient):
+        resp = client.get("/categories", params={"cursor": "not-a-cursor"})
+        assert resp.status_code == 400, resp.text
+
 
 class TestGetSingleCategory:
     def test_get_single_category(
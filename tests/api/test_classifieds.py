@@ -0,0 +1,733 @@
+import json
+import uuid
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.cache import response_cache
+from app.core.config import settings
+from app.models.category import Category
+from app.models.city import City
+from app.deps.classifieds import installed_extensions, refresh_classified_facets
+from app.deps.geo import bounding_box
+from app.models.classified import Classified, ClassifiedStatus
+from app.models.image import Image
+from tests.utils import generate_random_string, get_jwt_header
+
+
+class TestGetClassifieds:
+    def test_get_classifieds_filter_price(
+        self, db: Session, client: TestClient, create_category, create_classified
+    ):
+        category: Category = create_category()
+        for price in (10, 50, 100):
+            create_classified(category=category, price=price)
+
+        resp = client.get(
+            "/classifieds",
+            params={
+                "filter": json.dumps(
+                    {"category_id": category.id, "price_gte": 20, "price_lt": 100}
+                )
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        assert [float(c["price"]) for c in resp.json()] == [50]
+
+    def test_get_classifieds_filter_in(
+        self, db: Session, client: TestClient, create_category, create_classified
+    ):
+        categories = [create_category() for _ in range(3)]
+        for category in categories:
+            create_classified(category=category)
+
+        resp = client.get(
+            "/classifieds",
+            params={
+                "filter": json.dumps({"category_id": [c.id for c in categories[:2]]})
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        assert {c["category_id"] for c in resp.json()} == {c.id for c in categories[:2]}
+
+    def test_get_classifieds_filter_voivodeship(
+        self,
+        db: Session,
+        client: TestClient,
+        create_city,
+        create_classified,
+    ):
+        city: City = create_city()
+        create_city(voivodeship=city.voivodeship)
+        classified = create_classified(city=city, status=ClassifiedStatus.active)
+        create_classified()
+
+        resp = client.get(
+            "/classifieds",
+            params={
+                "filter": json.dumps(
+                    {"voivodeship_id": city.voivodeship_id, "status": "active"}
+                )
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        assert [c["id"] for c in resp.json()] == [classified.id]
+
+    def test_get_classifieds_filter_ids(
+        self, client: TestClient, create_classified, record_statements
+    ):
+        classifieds = [create_classified() for _ in range(3)]
+        ids = [classifieds[1].id, classifieds[2].id, classifieds[1].id, 10**6]
+
+        classified_queries = record_statements("classifieds")
+        resp = client.get(
+            "/classifieds",
+            params={
+                "filter": json.dumps({"id": ids}),
+                "sort": '["price", "ASC"]',
+                "range": "[0, 0]",
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        assert [c["id"] for c in resp.json()] == [
+            classifieds[1].id,
+            classifieds[2].id,
+        ]
+        assert resp.headers["Content-Range"] == "0-2/2"
+        # A single lookup, without a count
+        assert len(classified_queries()) == 1
+
+    def test_get_classifieds_filter_ids_cursor(self, client: TestClient):
+        resp = client.get(
+            "/classifieds", params={"filter": '{"id": [1, 2]}', "cursor": "*"}
+        )
+        assert resp.status_code == 400, resp.text
+
+    def test_get_classifieds_filter_too_many_ids(self, client: TestClient, monkeypatch):
+        monkeypatch.setattr(settings, "filter_max_ids", 2)
+        resp = client.get("/classifieds", params={"filter": '{"id": [1, 2, 3]}'})
+        assert resp.status_code == 400, resp.text
+
+    def test_get_classifieds_filter_unsupported(self, client: TestClient):
+        resp = client.get("/classifieds", params={"filter": '{"content": "x"}'})
+        assert resp.status_code == 400, resp.text
+
+    def test_get_classifieds_filter_invalid_value(self, client: TestClient):
+        resp = client.get("/classifieds", params={"filter": '{"price_gte": "x"}'})
+        assert resp.status_code == 400, resp.text
+
+    def test_get_classifieds_sort_unsupported(self, client: TestClient):
+        resp = client.get("/classifieds", params={"sort": '["title", "ASC"]'})
+        assert resp.status_code == 400, resp.text
+
+
+def create_image(db: Session, classified) -> Image:
+    image = Image(filename=uuid.uuid4(), extension=".jpg", classified=classified)
+    db.add(image)
+    db.commit()
+    return image
+
+
+class TestClassifiedFields:
+    def test_get_classifieds_summary(
+        self, client: TestClient, create_category, create_classified
+    ):
+        category: Category = create_category()
+        classified = create_classified(category=category)
+
+        resp = client.get(f"/classifieds/category/{category.id}")
+        assert resp.status_code == 200, resp.text
+        [summary] = resp.json()
+        assert "content" not in summary
+        assert summary["title"] == classified.title
+
+        resp = client.get(
+            f"/classifieds/category/{category.id}", params={"fields": "*"}
+        )
+        assert resp.status_code == 200, resp.text
+        assert resp.json()[0]["content"] == classified.content
+
+    def test_get_classifieds_fields(
+        self, client: TestClient, create_category, create_classified, record_statements
+    ):
+        category: Category = create_category()
+        classified = create_classified(category=category)
+
+        statements = record_statements()
+        resp = client.get(
+            f"/classifieds/category/{category.id}",
+            params={"fields": "title,price", "expand": "city"},
+        )
+        assert resp.status_code == 200, resp.text
+        [partial] = resp.json()
+        assert set(partial) == {"id", "title", "price", "city"}
+        assert partial["city"]["id"] == classified.city_id
+        # Selected at SQL level
+        [page] = [s for s in statements() if "LIMIT" in s]
+        assert "classifieds.title" in page
+        assert "classifieds.content" not in page
+
+    def test_search_classifieds_fields(
+        self, client: TestClient, create_category, create_classified
+    ):
+        category: Category = create_category()
+        title = generate_random_string(16)
+        classified = create_classified(category=category, title=title)
+
+        resp = client.get("/classifieds/search", params={"q": title, "fields": "title"})
+        assert resp.status_code == 200, resp.text
+        [result] = resp.json()
+        assert set(result) == {"id", "title", "rank", "headline"}
+        assert result["id"] == classified.id
+
+    def test_get_classifieds_fields_unsupported(self, client: TestClient):
+        resp = client.get("/classifieds", params={"fields": "title,search_vector"})
+        assert resp.status_code == 400, resp.text
+
+
+class TestExpandClassifieds:
+    def test_get_classifieds_expand(
+        self, db: Session, client: TestClient, create_category, create_classified
+    ):
+        category: Category = create_category()
+        classified = create_classified(category=category)
+        without_images = create_classified(category=category)
+        first_image = create_image(db, classified)
+        create_image(db, classified)
+
+        resp = client.get(
+            f"/classifieds/category/{category.id}",
+            params={
+                "expand": "city,voivodeship,category,user,first_image",
+                "sort": '["id", "ASC"]',
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        expanded, expanded_without_images = resp.json()
+        assert expanded["city"]["name"] == classified.city.name
+        assert expanded["voivodeship"]["name"] == classified.city.voivodeship.name
+        assert expanded["category"]["name"] == category.name
+        assert expanded["user"] == {
+            "id": str(classified.user.id),
+            "username": classified.user.username,
+        }
+        assert expanded["first_image_id"] == first_image.id
+        assert expanded_without_images["id"] == without_images.id
+        assert expanded_without_images["first_image_id"] is None
+
+    def test_get_classifieds_not_expanded(
+        self, client: TestClient, create_category, create_classified
+    ):
+        category: Category = create_category()
+        create_classified(category=category)
+
+        resp = client.get(
+            f"/classifieds/category/{category.id}", params={"expand": "category"}
+        )
+        assert resp.status_code == 200, resp.text
+        [classified] = resp.json()
+        assert "category" in classified
+        assert not {"city", "voivodeship", "user", "first_image_id"} & set(classified)
+
+    def test_get_classifieds_expand_query_count(
+        self,
+        db: Session,
+        client: TestClient,
+        create_category,
+        create_classified,
+        record_statements,
+    ):
+        category: Category = create_category()
+        for _ in range(10):
+            create_image(db, create_classified(category=category))
+
+        counts = []
+        # The first request may set up a connection
+        for page_size in (2, 1, 10):
+            statements = record_statements()
+            resp = client.get(
+                f"/classifieds/category/{category.id}",
+                params={
+                    "expand": "city,voivodeship,category,user,first_image",
+                    "range": json.dumps([0, page_size - 1]),
+                },
+            )
+            assert resp.status_code == 200, resp.text
+            assert len(resp.json()) == page_size
+            assert all(c["first_image_id"] for c in resp.json())
+            counts.append(len(statements()))
+        # The category, the count, the page and its first images
+        assert counts[1:] == [4, 4]
+
+    def test_get_single_classified_expand(
+        self, db: Session, client: TestClient, create_classified
+    ):
+        classified = create_classified()
+        image = create_image(db, classified)
+
+        resp = client.get(
+            f"/classifieds/{classified.id}",
+            params={"expand": "city,first_image"},
+        )
+        assert resp.status_code == 200, resp.text
+        assert resp.json()["city"]["id"] == classified.city_id
+        assert resp.json()["first_image_id"] == image.id
+        assert "category" not in resp.json()
+
+    def test_get_classifieds_expand_unsupported(self, client: TestClient):
+        resp = client.get("/classifieds", params={"expand": "city,images"})
+        assert resp.status_code == 400, resp.text
+
+    def test_get_classifieds_cached_count(
+        self, client: TestClient, monkeypatch, create_category, create_classified
+    ):
+        class BlockingRedis:
+            def __getattr__(self, name):
+                raise AssertionError("sync Redis used on the event loop")
+
+        monkeypatch.setattr(settings, "count_strategy", "cached")
+        monkeypatch.setattr("app.deps.counts.redis_client", BlockingRedis())
+        category: Category = create_category()
+        create_classified(category=category)
+        params = {"filter": json.dumps({"category_id": category.id})}
+
+        resp = client.get("/classifieds", params=params)
+        assert resp.status_code == 200, resp.text
+        assert resp.headers["Content-Range"].endswith("/1")
+        assert resp.headers["X-Total-Count-Mode"] == "cached"
+
+        # The stored count is served until it expires
+        create_classified(category=category)
+        response_cache.clear()
+        resp = client.get("/classifieds", params=params)
+        assert resp.status_code == 200, resp.text
+        assert len(resp.json()) == 2
+        assert resp.headers["Content-Range"].endswith("/1")
+
+
+class TestBulkClassifieds:
+    @pytest.fixture(autouse=True)
+    def small_chunks(self, monkeypatch):
+        monkeypatch.setattr(settings, "bulk_chunk_size", 2)
+
+    def test_create_classifieds(
+        self, db: Session, client: TestClient, create_user, create_city
+    ):
+        user, city = create_user(), create_city()
+        category = Category(name=generate_random_string(16), description="d")
+        db.add(category)
+        db.commit()
+        item = {"content": "content", "price": 10, "city_id": city.id}
+        items = [
+            {**item, "title": "First", "category_id": category.id},
+            {**item, "title": "Missing", "category_id": 10**6},
+            {**item, "title": "Second", "category_id": category.id},
+            {**item, "title": "Third", "category_id": category.id},
+        ]
+
+        resp = client.post(
+            "/classifieds/bulk",
+            json=items,
+            headers=get_jwt_header(user, "classifieds_create"),
+        )
+        assert resp.status_code == 200, resp.text
+        results = resp.json()
+        assert [result["status"] for result in results] == [201, 422, 201, 201]
+        assert results[1]["id"] is None
+        titles = {
+            result["id"]: db.get(Classified, result["id"]).title
+            for result in results
+            if result["id"]
+        }
+        assert list(titles.values()) == ["First", "Second", "Third"]
+
+    def test_update_classifieds(
+        self, db: Session, client: TestClient, create_user, create_classified
+    ):
+        user = create_user()
+        own = [create_classified(user=user) for _ in range(3)]
+        other = create_classified()
+        ids = [own[0].id, other.id, own[1].id, 10**6, own[2].id, own[0].id]
+
+        resp = client.put(
+            "/classifieds/bulk",
+            json={"ids": ids, "data": {"status": ClassifiedStatus.hidden.value}},
+            headers=get_jwt_header(user, "classifieds_update"),
+        )
+        assert resp.status_code == 200, resp.text
+        assert [(r["id"], r["status"]) for r in resp.json()] == [
+            (own[0].id, 200),
+            (other.id, 401),
+            (own[1].id, 200),
+            (10**6, 404),
+            (own[2].id, 200),
+        ]
+        db.expire_all()
+        assert {c.status for c in own} == {ClassifiedStatus.hidden}
+        assert other.status == ClassifiedStatus.active
+
+    def test_update_classifieds_missing_category(
+        self, client: TestClient, create_classified
+    ):
+        classified = create_classified()
+        resp = client.put(
+            "/classifieds/bulk",
+            json={"ids": [classified.id], "data": {"category_id": 10**6}},
+            headers=get_jwt_header(classified.user, "classifieds_update"),
+        )
+        assert resp.status_code == 422, resp.text
+
+    def test_delete_classifieds(
+        self, db: Session, client: TestClient, create_user, create_classified
+    ):
+        user = create_user()
+        own = [create_classified(user=user) for _ in range(3)]
+        image = create_image(db, own[0])
+        other = create_classified()
+        ids = [c.id for c in own] + [other.id]
+        image_id = image.id
+
+        resp = client.request(
+            "DELETE",
+            "/classifieds/bulk",
+            json={"ids": ids},
+            headers=get_jwt_header(user, "classifieds_delete"),
+        )
+        assert resp.status_code == 200, resp.text
+        assert [r["status"] for r in resp.json()] == [200, 200, 200, 401]
+        db.expire_all()
+        assert db.query(Classified).filter(Classified.id.in_(ids)).all() == [other]
+        assert not db.query(Image).filter(Image.id == image_id).count()
+
+    @pytest.mark.parametrize("bulk", [True, False])
+    def test_delete_classifieds_legacy_image_files(
+        self,
+        db: Session,
+        client: TestClient,
+        create_classified,
+        monkeypatch,
+        tmp_path,
+        bulk,
+    ):
+        monkeypatch.setattr(settings, "images_upload_path", f"{tmp_path}/")
+        classified = create_classified()
+        image = create_image(db, classified)
+        # Stored flat, from before blobs
+        legacy_file = tmp_path / f"{image.filename}.jpg"
+        legacy_file.write_bytes(b"jpeg")
+        # Removed only once the deletion is committed
+        exists_at_commit = []
+
+        def before_commit(session):
+            exists_at_commit.append(legacy_file.exists())
+
+        event.listen(Session, "before_commit", before_commit)
+        try:
+            resp = client.request(
+                "DELETE",
+                "/classifieds/bulk" if bulk else f"/classifieds/{classified.id}",
+                json={"ids": [classified.id]} if bulk else None,
+                headers=get_jwt_header(classified.user, "classifieds_delete"),
+            )
+        finally:
+            event.remove(Session, "before_commit", before_commit)
+        assert resp.status_code == 200, resp.text
+        assert exists_at_commit and all(exists_at_commit)
+        assert not legacy_file.exists()
+
+    def test_delete_classifieds_too_many(
+        self, client: TestClient, create_user, monkeypatch
+    ):
+        monkeypatch.setattr(settings, "bulk_max_items", 2)
+        resp = client.request(
+            "DELETE",
+            "/classifieds/bulk",
+            json={"ids": [1, 2, 3]},
+            headers=get_jwt_header(create_user(), "classifieds_delete"),
+        )
+        assert resp.status_code == 400, resp.text
+
+
+class TestImportClassifieds:
+    def test_import_classifieds(
+        self,
+        db: Session,
+        client: TestClient,
+        create_superuser,
+        create_classified,
+        monkeypatch,
+        tmp_path,
+    ):
+        monkeypatch.setattr(settings, "imports_rejects_path", f"{tmp_path}/")
+        user, classified = create_superuser(), create_classified()
+        title = generate_random_string(16)
+        feed = (
+            "title,content,price,category_id,city_id\n"
+            f"{title},content,10,{classified.category_id},{classified.city_id}\n"
+            f"{title},content,free,{classified.category_id},{classified.city_id}\n"
+        )
+
+        resp = client.post(
+            "/classifieds/import",
+            params={"format": "csv"},
+            content=feed,
+            headers=get_jwt_header(user, "classifieds_create"),
+        )
+        assert resp.status_code == 200, resp.text
+        result = resp.json()
+        assert (result["imported"], result["rejected"]) == (1, 1)
+        with open(result["rejects_file"]) as f:
+            assert json.loads(f.read())["row"] == 2
+        assert db.query(Classified).filter(Classified.title == title).count() == 1
+
+    def test_import_classifieds_not_superuser(self, client: TestClient, create_user):
+        resp = client.post(
+            "/classifieds/import",
+            params={"format": "csv"},
+            content="title\n",
+            headers=get_jwt_header(create_user(), "classifieds_create"),
+        )
+        assert resp.status_code == 401, resp.text
+
+
+class TestGetSingleClassified:
+    def test_get_single_classified(
+        self, db: Session, client: TestClient, create_classified
+    ):
+        classified = create_classified()
+        resp = client.get(f"/classifieds/{classified.id}")
+        assert resp.status_code == 200, resp.text
+        assert resp.json()["id"] == classified.id
+        assert resp.json()["title"] == classified.title
+
+    def test_get_single_classified_does_not_exist(self, client: TestClient):
+        resp = client.get(f"/classifieds/{10**6}")
+        assert resp.status_code == 404, resp.text
+
+
+class TestSearchClassifieds:
+    def test_search_classifieds(
+        self, db: Session, client: TestClient, create_category, create_classified
+    ):
+        category: Category = create_category()
+        in_content = create_classified(
+            category=category, title="Bike", content="Blue rowerek, barely used"
+        )
+        in_title = create_classified(
+            category=category, title="Rowerek", content="Red, barely used"
+        )
+        create_classified(category=category, title="Chair", content="Wooden")
+
+        resp = client.get(
+            "/classifieds/search",
+            params={"q": "rowerek", "filter": json.dumps({"category_id": category.id})},
+        )
+        assert resp.status_code == 200, resp.text
+        assert [c["id"] for c in resp.json()] == [in_title.id, in_content.id]
+        assert resp.headers["Content-Range"] == "0-2/2"
+        assert "<mark>rowerek</mark>" in resp.json()[1]["headline"]
+
+    def test_search_classifieds_fuzzy(
+        self, db: Session, client: TestClient, create_category, create_classified
+    ):
+        available = db.execute(
+            text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        ).scalar()
+        if not available:
+            pytest.skip("pg_trgm is not available")
+        db.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        db.commit()
+        installed_extensions.clear()
+
+        category: Category = create_category()
+        classified = create_classified(category=category, title="iPhone 12 mini")
+        params = {"q": "iphnoe", "filter": json.dumps({"category_id": category.id})}
+
+        resp = client.get("/classifieds/search", params=params)
+        assert resp.status_code == 200, resp.text
+        assert resp.json() == []
+
+        resp = client.get("/classifieds/search", params={**params, "similarity": 0.3})
+        assert resp.status_code == 200, resp.text
+        assert [c["id"] for c in resp.json()] == [classified.id]
+
+    def test_search_classifieds_fuzzy_without_pg_trgm(
+        self,
+        client: TestClient,
+        monkeypatch,
+        create_category,
+        create_classified,
+        record_statements,
+    ):
+        monkeypatch.setitem(installed_extensions, "pg_trgm", False)
+        category: Category = create_category()
+        classified = create_classified(category=category, title="Rowerek górski")
+        params = {"filter": json.dumps({"category_id": category.id})}
+        statements = record_statements("classifieds")
+
+        # Full-text search alone, rather than a missing operator error
+        resp = client.get(
+            "/classifieds/search",
+            params={**params, "q": "rowerek", "similarity": 0.3},
+        )
+        assert resp.status_code == 200, resp.text
+        assert [c["id"] for c in resp.json()] == [classified.id]
+        assert not any("similarity" in statement for statement in statements())
+
+    def test_search_classifieds_cursor(self, client: TestClient):
+        resp = client.get("/classifieds/search", params={"q": "rower", "cursor": "*"})
+        assert resp.status_code == 400, resp.text
+
+    def test_search_classifieds_empty_query(self, client: TestClient):
+        resp = client.get("/classifieds/search", params={"q": ""})
+        assert resp.status_code == 422, resp.text
+
+
+class TestClassifiedFacets:
+    def test_classified_facets(
+        self,
+        db: Session,
+        client: TestClient,
+        create_category,
+        create_city,
+        create_classified,
+        run_async,
+    ):
+        category: Category = create_category()
+        city: City = create_city()
+        for price in (10, 20, 60):
+            create_classified(category=category, city=city, price=price)
+        create_classified(category=category, status=ClassifiedStatus.hidden)
+        run_async(refresh_classified_facets, {"job_id": "test"})
+
+        resp = client.get("/classifieds/facets")
+        assert resp.status_code == 200, resp.text
+        assert {"value": category.id, "count": 3} in resp.json()["category_id"]
+        assert {"value": city.voivodeship_id, "count": 3} in resp.json()[
+            "voivodeship_id"
+        ]
+
+    def test_classified_facets_filtered(
+        self,
+        db: Session,
+        client: TestClient,
+        create_category,
+        create_city,
+        create_classified,
+    ):
+        category: Category = create_category()
+        city: City = create_city()
+        for price in (10, 20, 60):
+            create_classified(category=category, city=city, price=price)
+        create_classified(category=category, price=60)
+
+        resp = client.get(
+            "/classifieds/facets",
+            params={"filter": json.dumps({"category_id": category.id})},
+        )
+        assert resp.status_code == 200, resp.text
+        facets = resp.json()
+        assert facets["category_id"] == [{"value": category.id, "count": 4}]
+        assert facets["city_id"][0] == {"value": city.id, "count": 3}
+        assert [(p["min"], p["max"], p["count"]) for p in facets["price"]] == [
+            (0, 50, 2),
+            (50, 100, 2),
+        ]
+
+    def test_classified_facets_unsupported_filter(self, client: TestClient):
+        resp = client.get("/classifieds/facets", params={"filter": '{"title": "x"}'})
+        assert resp.status_code == 400, resp.text
+
+
+class TestSuggestClassifieds:
+    def test_suggest_classifieds(
+        self, db: Session, client: TestClient, create_classified
+    ):
+        prefix = generate_random_string(8)
+        create_classified(title=f"{prefix} Bike")
+        create_classified(title=f"{prefix.upper()} bike")
+        create_classified(title=f"{prefix} Chair")
+        create_classified(title=f"{prefix} Hidden", status=ClassifiedStatus.hidden)
+        create_classified(title=f"Old {prefix}")
+
+        resp = client.get("/classifieds/suggest", params={"prefix": prefix.lower()})
+        assert resp.status_code == 200, resp.text
+        assert [title.lower() for title in resp.json()] == [
+            f"{prefix} bike".lower(),
+            f"{prefix} chair".lower(),
+        ]
+        assert "max-age" in resp.headers["Cache-Control"]
+
+    def test_suggest_classifieds_most_common(
+        self, db: Session, client: TestClient, create_classified
+    ):
+        prefix = generate_random_string(8)
+        create_classified(title=f"{prefix} armchair")
+        for _ in range(2):
+            create_classified(title=f"{prefix} table")
+
+        resp = client.get(
+            "/classifieds/suggest", params={"prefix": prefix.lower(), "limit": 1}
+        )
+        assert resp.status_code == 200, resp.text
+        assert [title.lower() for title in resp.json()] == [f"{prefix} table".lower()]
+
+    def test_suggest_classifieds_wildcards(
+        self, db: Session, client: TestClient, create_classified
+    ):
+        create_classified(title="100% cotton")
+
+        resp = client.get("/classifieds/suggest", params={"prefix": "%"})
+        assert resp.status_code == 200, resp.text
+        assert resp.json() == []
+
+
+class TestNearbyClassifieds:
+    def test_nearby_classifieds(
+        self,
+        db: Session,
+        client: TestClient,
+        create_category,
+        create_city,
+        create_classified,
+    ):
+        category: Category = create_category()
+        warsaw = create_city(latitude=52.2297, longitude=21.0122)
+        piaseczno = create_city(latitude=52.0814, longitude=21.0246)
+        cracow = create_city(latitude=50.0647, longitude=19.9450)
+        far = create_classified(category=category, city=piaseczno, price=10)
+        near = create_classified(category=category, city=warsaw, price=20)
+        create_classified(category=category, city=warsaw, price=500)
+        create_classified(category=category, city=cracow, price=10)
+
+        resp = client.get(
+            "/classifieds/nearby",
+            params={
+                "lat": 52.2319,
+                "lon": 21.0067,
+                "radius_km": 30,
+                "filter": json.dumps({"category_id": category.id, "price_lt": 100}),
+            },
+        )
+        assert resp.status_code == 200, resp.text
+        assert [c["id"] for c in resp.json()] == [near.id, far.id]
+        assert resp.json()[0]["distance_km"] < 1
+        assert 15 < resp.json()[1]["distance_km"] < 20
+
+    def test_nearby_classifieds_radius_too_large(self, client: TestClient):
+        resp = client.get(
+            "/classifieds/nearby", params={"lat": 52, "lon": 21, "radius_km": 10**6}
+        )
+        assert resp.status_code == 422, resp.text
+
+    def test_bounding_box_edges(self):
+        # Near a pole, the latitude range stops at it
+        (min_lat, max_lat), _ = bounding_box(89.9, 0, 100)
+        assert max_lat == 90.0 and min_lat < 89.9
+        # Across the antimeridian, every longitude
+        _, longitudes = bounding_box(0, 179.9, 100)
+        assert longitudes == (-180.0, 180.0)
+        _, (min_lon, max_lon) = bounding_box(0, 21, 100)
+        assert -180 < min_lon < 21 < max_lon < 180
@@ -0,0 +1,107 @@
+import pytest
+from fastapi import Depends, FastAPI, Security
+from sqlalchemy import event, text
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.config import settings
+from app.core.middleware import PoolCheckoutMiddleware, PrimarySessionsMiddleware
+from app.db import ReplicaSet, pool_stats
+from app.deps import db as deps_db
+from app.deps.db import get_db, get_read_db
+from app.deps.user_cache import user_cache
+from app.deps.users import manager
+from app.models.user import User
+from tests.utils import get_jwt_header
+
+
+def uncache(user: User) -> None:
+    user_cache.invalidate(str(user.id))
+
+
+def test_sync_handler_shares_session_with_auth(client: TestClient, create_user):
+    user = create_user()
+    uncache(user)
+    pool_stats.reset()
+
+    resp = client.get(f"/user/{user.id}", headers=get_jwt_header(user, "users"))
+    assert resp.status_code == 200, resp.text
+    assert pool_stats.checkouts_per_request == {1: 1}
+
+
+def test_async_handler_shares_session_with_auth(client: TestClient, create_user):
+    user = create_user()
+    uncache(user)
+    pool_stats.reset()
+
+    resp = client.get("/messages/conversation/0", headers=get_jwt_header(user))
+    assert resp.status_code == 404
+    assert pool_stats.checkouts_per_request == {1: 1}
+
+
+def test_cached_user_without_queries(client: TestClient, create_user):
+    user = create_user()
+    # The same token, cached users are keyed by its iat
+    headers = get_jwt_header(user, "users")
+    client.get("/users/me", headers=headers)
+    pool_stats.reset()
+
+    resp = client.get("/users/me", headers=headers)
+    assert resp.status_code == 200
+    assert pool_stats.checkouts_per_request == {0: 1}
+
+
+def test_pool_stats(client: TestClient, create_superuser):
+    resp = client.get("/db/pool-stats", headers=get_jwt_header(create_superuser()))
+    assert resp.status_code == 200
+    assert resp.json()["checkouts"] >= 1
+    assert resp.json()["max_wait_seconds"] >= resp.json()["mean_wait_seconds"]
+
+
+@pytest.fixture
+def sessions_client(monkeypatch) -> TestClient:
+    # Sync handlers and no Redis, requests of a second TestClient run on their
+    # own event loop and mustn't share the app's async connection pools
+    monkeypatch.setattr(settings, "user_cache_redis", False)
+    app = FastAPI()
+
+    @app.get("/auth-first")
+    def auth_first(user: User = Security(manager), db: Session = Depends(get_db)):
+        return db.execute(text("SELECT 1")).scalar()
+
+    @app.get("/read")
+    def read(db: Session = Depends(get_read_db), user: User = Security(manager)):
+        return db.execute(text("SELECT 1")).scalar()
+
+    app.add_middleware(PrimarySessionsMiddleware)
+    app.add_middleware(PoolCheckoutMiddleware)
+    return TestClient(app)
+
+
+def test_session_shared_whatever_the_order(sessions_client: TestClient, create_user):
+    user = create_user()
+    uncache(user)
+    pool_stats.reset()
+
+    resp = sessions_client.get("/auth-first", headers=get_jwt_header(user))
+    assert resp.status_code == 200, resp.text
+    assert pool_stats.checkouts_per_request == {1: 1}
+
+
+def test_read_handler_loads_user_from_primary(
+    sessions_client: TestClient, create_user, monkeypatch
+):
+    replica_set = ReplicaSet([settings.database_url])
+    monkeypatch.setattr(deps_db, "replicas", replica_set)
+    replica_statements = []
+    event.listen(
+        replica_set.replicas[0].engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: replica_statements.append(statement),
+    )
+    user = create_user()
+    uncache(user)
+
+    resp = sessions_client.get("/read", headers=get_jwt_header(user))
+    assert resp.status_code == 200, resp.text
+    assert replica_statements == ["SELECT 1"]
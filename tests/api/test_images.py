@@ -0,0 +1,568 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import uuid
+from io import BytesIO
+from pathlib import Path
+from typing import List
+
+import pytest
+from fastapi import HTTPException, Request
+from PIL import Image as PILImage
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.config import settings
+from app.core.files import BASE64_CHUNK_SIZE, parse_range
+from app.deps.images import process_image
+from app.deps.uploads import StreamingUpload
+from app.models.image import Image
+from app.models.image_blob import ImageBlob
+from tests.utils import get_jwt_header
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024
+
+
+@pytest.fixture
+def create_image(db: Session, create_classified, upload_path: Path):
+    def inner(format: str, size=(800, 600), **options):
+        buffer = BytesIO()
+        PILImage.new("RGB", size, "orange").save(buffer, format, **options)
+        extension = ".png" if format == "PNG" else ".jpg"
+        image = Image(
+            filename=uuid.uuid4(),
+            extension=extension,
+            checksum=hashlib.sha256(buffer.getvalue()).hexdigest(),
+            classified=create_classified(),
+        )
+        db.add(image)
+        db.commit()
+        (upload_path / f"{image.filename}{extension}").write_bytes(buffer.getvalue())
+        return image
+
+    return inner
+
+
+@pytest.fixture(autouse=True)
+def upload_path(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(settings, "images_upload_path", f"{tmp_path}/")
+    return tmp_path
+
+
+def stored_files(upload_path: Path) -> List[Path]:
+    return [path for path in upload_path.rglob("*") if path.is_file()]
+
+
+def test_create_image(
+    db: Session, client: TestClient, create_classified, upload_path: Path
+):
+    classified = create_classified()
+
+    resp = client.post(
+        "/images",
+        data={"classified_id": str(classified.id)},
+        # The declared type and name are ignored, the content is sniffed
+        files={"file": ("image.txt", PNG, "text/plain")},
+        headers=get_jwt_header(classified.user, "images_create"),
+    )
+    assert resp.status_code == 201
+    assert resp.json()["checksum"] == hashlib.sha256(PNG).hexdigest()
+
+    image = db.get(Image, resp.json()["id"])
+    assert image.extension == ".png"
+    checksum = image.blob_checksum
+    assert checksum == hashlib.sha256(PNG).hexdigest()
+    blob = upload_path / checksum[:2] / checksum[2:4] / f"{checksum}.png"
+    assert stored_files(upload_path) == [blob]
+    assert blob.read_bytes() == PNG
+
+
+def multipart_chunks(boundary: str, classified_id: int, chunks: int):
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="classified_id"\r\n\r\n'
+        f"{classified_id}\r\n"
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="a.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n"
+    ).encode() + PNG
+    for _ in range(chunks):
+        yield b"\x00" * 1024
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def test_create_image_chunked_too_large(
+    client: TestClient, create_classified, upload_path: Path, monkeypatch
+):
+    monkeypatch.setattr(settings, "images_max_size", 4096)
+    classified = create_classified()
+
+    resp = client.post(
+        "/images",
+        content=multipart_chunks("boundary", classified.id, 100),
+        headers={
+            "Content-Type": "multipart/form-data; boundary=boundary",
+            **get_jwt_header(classified.user, "images_create"),
+        },
+    )
+    assert resp.status_code == 413
+    assert stored_files(upload_path) == []
+
+
+def test_streaming_upload_stops_reading(upload_path: Path):
+    chunks = multipart_chunks("boundary", 1, 100)
+    received = []
+
+    async def receive():
+        received.append(1)
+        return {"type": "http.request", "body": next(chunks), "more_body": True}
+
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "headers": [
+                (b"content-type", b"multipart/form-data; boundary=boundary"),
+            ],
+        },
+        receive,
+    )
+    upload = StreamingUpload(request, upload_path, "image", 4096, ["image/png"])
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(upload.receive())
+    assert exc_info.value.status_code == 413
+    assert len(received) < 10
+    assert stored_files(upload_path) == []
+
+
+@pytest.mark.parametrize("content_length", [b"abc", b"-1", b"1e3"])
+def test_streaming_upload_invalid_content_length(upload_path: Path, content_length):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "headers": [
+                (b"content-length", content_length),
+                (b"content-type", b"multipart/form-data; boundary=boundary"),
+            ],
+        },
+        receive,
+    )
+    upload = StreamingUpload(request, upload_path, "image", 4096, ["image/png"])
+    with pytest.raises(HTTPException) as exc_info:
+        asyncio.run(upload.receive())
+    assert exc_info.value.status_code == 400
+
+
+def test_create_image_content_length_too_large(client: TestClient, create_user):
+    resp = client.post(
+        "/images",
+        content=b"",
+        headers={
+            "Content-Length": str(settings.images_max_size + 1),
+            **get_jwt_header(create_user(), "images_create"),
+        },
+    )
+    assert resp.status_code == 413
+
+
+def test_create_image_unsupported_type(
+    client: TestClient, create_classified, upload_path: Path
+):
+    classified = create_classified()
+
+    resp = client.post(
+        "/images",
+        data={"classified_id": str(classified.id)},
+        files={"file": ("image.png", b"GIF89a" + b"\x00" * 64, "image/png")},
+        headers=get_jwt_header(classified.user, "images_create"),
+    )
+    assert resp.status_code == 400
+    assert stored_files(upload_path) == []
+
+
+def test_create_image_other_users_classified(
+    client: TestClient, create_user, create_classified, upload_path: Path
+):
+    classified = create_classified()
+
+    resp = client.post(
+        "/images",
+        data={"classified_id": str(classified.id)},
+        files={"file": ("image.png", PNG, "image/png")},
+        headers=get_jwt_header(create_user(), "images_create"),
+    )
+    assert resp.status_code == 401
+    assert stored_files(upload_path) == []
+
+
+def test_create_image_missing_file(client: TestClient, create_classified):
+    classified = create_classified()
+
+    resp = client.post(
+        "/images",
+        data={"classified_id": str(classified.id)},
+        files={"other": ("other", b"other")},
+        headers=get_jwt_header(classified.user, "images_create"),
+    )
+    assert resp.status_code == 400
+
+
+def test_process_image(
+    db: Session,
+    client: TestClient,
+    create_image,
+    upload_path: Path,
+    monkeypatch,
+    run_async,
+):
+    monkeypatch.setattr(settings, "images_variant_widths", [320, 640, 1280])
+    image = create_image("PNG")
+
+    run_async(process_image, {"job_id": "test"}, image.id)
+
+    db.refresh(image)
+    assert (image.width, image.height) == (800, 600)
+    original = upload_path / f"{image.filename}.png"
+    assert image.size == original.stat().st_size
+    assert image.checksum == hashlib.sha256(original.read_bytes()).hexdigest()
+    # Nothing is upscaled
+    assert sorted((v["width"], v["format"]) for v in image.variants) == [
+        (320, "jpeg"),
+        (320, "webp"),
+        (640, "jpeg"),
+        (640, "webp"),
+    ]
+    assert {"width": 320, "height": 240} == {
+        key: image.variants[-1][key] for key in ("width", "height")
+    }
+
+    resp = client.get(
+        f"/images/file/{image.id}?w=300", headers={"Accept": "image/webp"}
+    )
+    assert resp.headers["Content-Type"] == "image/webp"
+    assert PILImage.open(BytesIO(resp.content)).size == (320, 240)
+    resp = client.get(f"/images/file/{image.id}?w=400", headers={"Accept": "image/*"})
+    assert resp.headers["Content-Type"] == "image/jpeg"
+    assert PILImage.open(BytesIO(resp.content)).size == (640, 480)
+    resp = client.get(f"/images/file/{image.id}?w=1000")
+    assert resp.content == original.read_bytes()
+
+
+def test_process_image_strips_exif(
+    db: Session, create_image, upload_path: Path, run_async
+):
+    exif = PILImage.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees
+    exif[0x010F] = "Camera maker"
+    image = create_image("JPEG", size=(400, 200), exif=exif)
+
+    run_async(process_image, {"job_id": "test"}, image.id)
+
+    db.refresh(image)
+    assert (image.width, image.height) == (200, 400)
+    original = PILImage.open(upload_path / f"{image.filename}.jpg")
+    assert original.size == (200, 400)
+    assert not original.getexif()
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=900-", 1000) == (900, 999)
+    assert parse_range("bytes=900-2000", 1000) == (900, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-2000", 1000) == (0, 999)
+    # Served whole
+    assert parse_range("bytes=0-9,20-29", 1000) is None
+    assert parse_range("bytes=9-0", 1000) is None
+    assert parse_range("items=0-9", 1000) is None
+    assert parse_range("bytes=a-b", 1000) is None
+    with pytest.raises(ValueError):
+        parse_range("bytes=1000-", 1000)
+
+
+def test_get_image_file_caching(
+    db: Session,
+    client: TestClient,
+    create_image,
+    upload_path: Path,
+    run_async,
+):
+    image = create_image("PNG")
+
+    resp = client.get(f"/images/file/{image.id}")
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "image/png"
+    # Awaiting process_image, the original still has its metadata
+    assert resp.headers["Cache-Control"] == "public, no-cache"
+
+    run_async(process_image, {"job_id": "test"}, image.id)
+    db.refresh(image)
+    resp = client.get(f"/images/file/{image.id}")
+    etag = resp.headers["ETag"]
+    assert etag == f'"{image.checksum}"'
+    assert "immutable" in resp.headers["Cache-Control"]
+
+    resp = client.get(f"/images/file/{image.id}", headers={"If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+    assert resp.headers["ETag"] == etag
+
+    resp = client.get(f"/images/file/{image.id}?w=200", headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+
+
+def test_get_image_file_range(client: TestClient, create_image, upload_path: Path):
+    image = create_image("PNG")
+    content = (upload_path / f"{image.filename}.png").read_bytes()
+
+    resp = client.get(f"/images/file/{image.id}", headers={"Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.content == content[10:20]
+    assert resp.headers["Content-Range"] == f"bytes 10-19/{len(content)}"
+
+    resp = client.get(f"/images/file/{image.id}", headers={"Range": "bytes=-5"})
+    assert resp.content == content[-5:]
+
+    resp = client.get(
+        f"/images/file/{image.id}",
+        headers={"Range": "bytes=10-19", "If-Range": '"outdated"'},
+    )
+    assert resp.status_code == 200
+    assert resp.content == content
+
+    resp = client.get(
+        f"/images/file/{image.id}", headers={"Range": f"bytes={len(content)}-"}
+    )
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{len(content)}"
+
+
+@pytest.mark.parametrize(
+    "sender, header",
+    [("x-accel-redirect", "X-Accel-Redirect"), ("x-sendfile", "X-Sendfile")],
+)
+def test_get_image_file_offloaded(
+    client: TestClient, create_image, upload_path: Path, monkeypatch, sender, header
+):
+    monkeypatch.setattr(settings, "files_sender", sender)
+    image = create_image("PNG")
+
+    resp = client.get(f"/images/file/{image.id}")
+    assert resp.status_code == 200
+    assert resp.content == b""
+    assert resp.headers[header].endswith(f"/{image.filename}.png")
+    assert resp.headers["Content-Type"] == "image/png"
+    assert resp.headers["ETag"]
+
+
+def test_get_image_file_offloaded_blob(
+    db: Session, client: TestClient, create_classified, monkeypatch
+):
+    monkeypatch.setattr(settings, "files_sender", "x-accel-redirect")
+    classified = create_classified()
+    resp = client.post(
+        "/images",
+        data={"classified_id": str(classified.id)},
+        files={"file": ("image.png", PNG, "image/png")},
+        headers=get_jwt_header(classified.user, "images_create"),
+    )
+    assert resp.status_code == 201
+    checksum = db.get(Image, resp.json()["id"]).blob_checksum
+
+    resp = client.get(f"/images/file/{resp.json()['id']}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Accel-Redirect"] == (
+        f"{settings.files_accel_redirect_prefix}"
+        f"{checksum[:2]}/{checksum[2:4]}/{checksum}.png"
+    )
+
+
+def test_get_image_base64(client: TestClient, create_image, upload_path: Path):
+    image = create_image("PNG")
+    # Spans several chunks, not aligned on them
+    content = os.urandom(3 * BASE64_CHUNK_SIZE + 2)
+    (upload_path / f"{image.filename}.png").write_bytes(content)
+
+    resp = client.get(f"/images/base64/{image.id}")
+    assert resp.status_code == 200
+    assert base64.b64decode(resp.json()) == content
+
+    (upload_path / f"{image.filename}.png").unlink()
+    resp = client.get(f"/images/base64/{image.id}")
+    assert resp.status_code == 404
+
+
+def test_get_images_base64(
+    client: TestClient,
+    create_image,
+    upload_path: Path,
+    monkeypatch,
+    run_async,
+):
+    monkeypatch.setattr(settings, "images_variant_widths", [320])
+    first, second = create_image("PNG"), create_image("JPEG")
+    run_async(process_image, {"job_id": "test"}, first.id)
+
+    resp = client.get(
+        f"/images/base64?ids={second.id},0,{first.id}&w=100",
+        headers={"Accept": "image/webp"},
+    )
+    assert resp.status_code == 200
+    assert resp.headers["Content-Type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in resp.text.splitlines()]
+    assert [line["id"] for line in lines] == [second.id, 0, first.id]
+    assert (
+        base64.b64decode(lines[0]["base64"])
+        == (upload_path / f"{second.filename}.jpg").read_bytes()
+    )
+    assert lines[0]["content_type"] == "image/jpeg"
+    assert lines[1] == {"id": 0, "detail": "Not Found"}
+    assert lines[2]["content_type"] == "image/webp"
+    thumbnail = PILImage.open(BytesIO(base64.b64decode(lines[2]["base64"])))
+    assert thumbnail.size == (320, 240)
+
+
+def test_get_images_base64_too_many(client: TestClient, monkeypatch):
+    monkeypatch.setattr(settings, "images_base64_batch_max", 2)
+    assert client.get("/images/base64?ids=1,2,3").status_code == 400
+    assert client.get("/images/base64?ids=1,a").status_code == 422
+
+
+def upload_image(client: TestClient, classified, content: bytes):
+    resp = client.post(
+        "/images",
+        data={"classified_id": str(classified.id)},
+        files={"file": ("image.png", content, "image/png")},
+        headers=get_jwt_header(classified.user, "images_create"),
+    )
+    assert resp.status_code == 201
+    return resp.json()["id"]
+
+
+def test_duplicate_uploads_share_blob(
+    db: Session, client: TestClient, create_classified, upload_path: Path
+):
+    content = PNG + os.urandom(16)
+    checksum = hashlib.sha256(content).hexdigest()
+    first, second = create_classified(), create_classified()
+    first_id = upload_image(client, first, content)
+    second_id = upload_image(client, second, content)
+
+    blob = db.get(ImageBlob, checksum)
+    assert blob.refcount == 2
+    assert [image.blob_checksum for image in first.images + second.images] == [
+        checksum,
+        checksum,
+    ]
+    assert len(stored_files(upload_path)) == 1
+    resp = client.get(f"/images/file/{second_id}")
+    assert resp.content == content
+
+    resp = client.delete(
+        f"/images/{first_id}", headers=get_jwt_header(first.user, "images_delete")
+    )
+    assert resp.status_code == 200
+    db.refresh(blob)
+    assert blob.refcount == 1
+    assert len(stored_files(upload_path)) == 1
+
+    # Through the classified's cascade
+    db.delete(second)
+    db.commit()
+    db.expire_all()
+    assert db.get(ImageBlob, checksum) is None
+    assert stored_files(upload_path) == []
+
+
+def test_delete_images_bulk(
+    db: Session, client: TestClient, create_user, create_classified, upload_path
+):
+    content = PNG + os.urandom(16)
+    checksum = hashlib.sha256(content).hexdigest()
+    user = create_user()
+    own = [create_classified(user=user) for _ in range(2)]
+    ids = [upload_image(client, classified, content) for classified in own]
+    other_id = upload_image(client, create_classified(), content)
+
+    resp = client.request(
+        "DELETE",
+        "/images/bulk",
+        json={"ids": [*ids, other_id, 10**6]},
+        headers=get_jwt_header(user, "images_delete"),
+    )
+    assert resp.status_code == 200, resp.text
+    assert [r["status"] for r in resp.json()] == [200, 200, 401, 404]
+    db.expire_all()
+    assert db.query(Image).filter(Image.id.in_(ids)).count() == 0
+    assert db.get(ImageBlob, checksum).refcount == 1
+    assert len(stored_files(upload_path)) == 1
+
+
+@pytest.mark.parametrize("bulk", [True, False])
+def test_delete_legacy_image_files(
+    db: Session, client: TestClient, create_image, upload_path: Path, bulk
+):
+    image = create_image("PNG")
+    # Removed only once the deletion is committed
+    exists_at_commit = []
+
+    def before_commit(session):
+        exists_at_commit.append(bool(stored_files(upload_path)))
+
+    event.listen(Session, "before_commit", before_commit)
+    try:
+        resp = client.request(
+            "DELETE",
+            "/images/bulk" if bulk else f"/images/{image.id}",
+            json={"ids": [image.id]} if bulk else None,
+            headers=get_jwt_header(image.classified.user, "images_delete"),
+        )
+    finally:
+        event.remove(Session, "before_commit", before_commit)
+    assert resp.status_code == 200, resp.text
+    assert exists_at_commit and all(exists_at_commit)
+    assert stored_files(upload_path) == []
+
+
+def test_blob_files_kept_on_rollback(
+    db: Session, client: TestClient, create_classified, upload_path: Path
+):
+    classified = create_classified()
+    image_id = upload_image(client, classified, PNG + os.urandom(16))
+
+    db.delete(db.get(Image, image_id))
+    db.flush()
+    db.rollback()
+    assert len(stored_files(upload_path)) == 1
+
+
+def test_process_image_shared_blob(
+    db: Session,
+    client: TestClient,
+    create_classified,
+    upload_path: Path,
+    run_async,
+):
+    buffer = BytesIO()
+    PILImage.new("RGB", (400, 300), "teal").save(buffer, "PNG")
+    first_id = upload_image(client, create_classified(), buffer.getvalue())
+    second_id = upload_image(client, create_classified(), buffer.getvalue())
+
+    run_async(process_image, {"job_id": "test"}, first_id)
+    db.expire_all()
+    first, second = db.get(Image, first_id), db.get(Image, second_id)
+    # Processed along with the image it shares the blob with
+    assert second.width == 400
+    assert second.variants == first.variants
+    files = stored_files(upload_path)
+
+    run_async(process_image, {"job_id": "test"}, second_id)
+    assert stored_files(upload_path) == files
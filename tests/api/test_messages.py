@@ -0,0 +1,81 @@
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.models.conversation import Conversation
+from app.models.conversation_user import ConversationUser
+from app.models.message import Message
+from tests.utils import get_jwt_header
+
+
+def create_conversation(db: Session, *users) -> Conversation:
+    conversation = Conversation(subject="subject")
+    db.add(conversation)
+    db.flush()
+    for user in users:
+        db.add(ConversationUser(conversation_id=conversation.id, user_id=user.id))
+    db.commit()
+    return conversation
+
+
+def test_create_messages_bulk(db: Session, client: TestClient, create_user):
+    user = create_user()
+    joined = create_conversation(db, user)
+    other = create_conversation(db, create_user())
+
+    resp = client.post(
+        "/messages/bulk",
+        json=[
+            {"conversation_id": joined.id, "content": "first"},
+            {"conversation_id": other.id, "content": "refused"},
+            {"conversation_id": 10**6, "content": "missing"},
+            {"conversation_id": joined.id, "content": "second"},
+        ],
+        headers=get_jwt_header(user, "messages_create"),
+    )
+    assert resp.status_code == 200, resp.text
+    results = resp.json()
+    assert [result["status"] for result in results] == [201, 401, 404, 201]
+    assert [db.get(Message, results[i]["id"]).content for i in (0, 3)] == [
+        "first",
+        "second",
+    ]
+
+
+def test_update_and_delete_messages_bulk(db: Session, client: TestClient, create_user):
+    user, other_user = create_user(), create_user()
+    conversation = create_conversation(db, user, other_user)
+    messages = [
+        Message(conversation_id=conversation.id, content="own", author_id=user.id),
+        Message(
+            conversation_id=conversation.id, content="other", author_id=other_user.id
+        ),
+        Message(
+            conversation_id=create_conversation(db, other_user).id,
+            content="elsewhere",
+            author_id=other_user.id,
+        ),
+    ]
+    db.add_all(messages)
+    db.commit()
+    ids = [message.id for message in messages]
+
+    resp = client.put(
+        "/messages/bulk",
+        json={"ids": ids, "data": {"displayed": True}},
+        headers=get_jwt_header(user, "messages_update"),
+    )
+    assert resp.status_code == 200, resp.text
+    assert [r["status"] for r in resp.json()] == [200, 200, 401]
+    db.expire_all()
+    assert [message.displayed for message in messages] == [True, True, False]
+
+    # Only the messages the user wrote
+    resp = client.request(
+        "DELETE",
+        "/messages/bulk",
+        json={"ids": ids},
+        headers=get_jwt_header(user, "messages_delete"),
+    )
+    assert resp.status_code == 200, resp.text
+    assert [r["status"] for r in resp.json()] == [200, 401, 401]
+    assert db.query(Message).filter(Message.id.in_(ids)).count() == 2
@@ -0,0 +1,64 @@
+import uuid
+
+from passlib.context import CryptContext
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.config import settings
+from app.core.passwords import pwd_context
+from app.models.user import User
+from tests.utils import generate_random_string
+
+
+def test_register_and_login(client: TestClient):
+    username = generate_random_string(16)
+    password = "Password1234567"
+    resp = client.post(
+        "/register",
+        json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": password,
+        },
+    )
+    assert resp.status_code == 201, resp.text
+
+    resp = client.post("/login", data={"username": username, "password": password})
+    assert resp.status_code == 200, resp.text
+    resp = client.post("/login", data={"username": username, "password": "wrong"})
+    assert resp.status_code == 401
+
+
+def test_login_overloaded(
+    client: TestClient, monkeypatch, create_user, default_password
+):
+    user = create_user()
+    monkeypatch.setattr(settings, "password_max_pending", 0)
+
+    resp = client.post(
+        "/login", data={"username": user.username, "password": default_password}
+    )
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "1"
+
+
+def test_outdated_hash_rehashed_on_login(db: Session, client: TestClient):
+    password = generate_random_string(16)
+    outdated_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(password)
+    user = User(
+        id=uuid.uuid4(),
+        username=generate_random_string(20),
+        email=f"{generate_random_string(20)}@example.com",
+        hashed_password=outdated_hash,
+    )
+    db.add(user)
+    db.commit()
+
+    resp = client.post("/login", data={"username": user.username, "password": password})
+    assert resp.status_code == 200, resp.text
+
+    # Background tasks have run once TestClient returns
+    db.refresh(user)
+    assert user.hashed_password != outdated_hash
+    assert not pwd_context.needs_update(user.hashed_password)
+    assert pwd_context.verify(password, user.hashed_password)
@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+from redis.exceptions import RedisError
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.redis import redis_client
+from app.deps.reference_data import ReferenceData, ReferenceTable, reference_data
+from app.deps.reference_data import VoivodeshipRecord
+from app.models.city import City
+from app.models.voivodeship import Voivodeship
+from app.schemas.voivodeship import Voivodeship as VoivodeshipSchema
+from tests.utils import generate_random_string
+
+
+def test_categories_served_from_memory(
+    db: Session, client: TestClient, create_category
+):
+    category = create_category()
+    resp = client.get(f"/categories/{category.id}")
+    assert resp.status_code == 200
+    assert resp.json() == {
+        "id": category.id,
+        "name": category.name,
+        "description": category.description,
+    }
+
+    # Not visible until the snapshot is invalidated
+    created = create_category()
+    assert client.get(f"/categories/{created.id}").status_code == 404
+    reference_data.invalidate()
+    assert client.get(f"/categories/{created.id}").status_code == 200
+
+
+def test_cities_sort_and_range_match_database(
+    db: Session, client: TestClient, create_city
+):
+    voivodeship = Voivodeship(name=generate_random_string(16))
+    for latitude in [52.2, None, 50.1, 52.2, None]:
+        create_city(voivodeship=voivodeship, latitude=latitude)
+    expected = [
+        city.id
+        for city in db.query(City)
+        .order_by(City.latitude.desc(), City.id.desc())
+        .offset(1)
+        .limit(3)
+    ]
+
+    resp = client.get(
+        "/cities",
+        params={"sort": json.dumps(["latitude", "DESC"]), "range": json.dumps([1, 3])},
+    )
+    assert resp.status_code == 200
+    assert [city["id"] for city in resp.json()] == expected
+    assert resp.headers["Content-Range"] == f"1-4/{db.query(City).count()}"
+
+
+def test_ordered_by_database_collation():
+    records = [
+        VoivodeshipRecord(1, "Łódzkie"),
+        VoivodeshipRecord(2, "Lubuskie"),
+        VoivodeshipRecord(3, "Mazowieckie"),
+    ]
+    # Ranks as a Polish collation gives them, unlike code point order
+    table = ReferenceTable(
+        VoivodeshipSchema,
+        records,
+        {"id": {1: 1, 2: 2, 3: 3}, "name": {2: 1, 1: 2, 3: 3}},
+    )
+    assert [record.id for record in table.ordered("name", "asc")] == [2, 1, 3]
+    assert [record.id for record in table.ordered("name", "desc")] == [3, 1, 2]
+
+
+def test_categories_get_many(client: TestClient, create_category):
+    categories = [create_category() for _ in range(3)]
+    ids = [categories[2].id, categories[0].id, categories[2].id, 10**6]
+
+    resp = client.get("/categories", params={"filter": json.dumps({"id": ids})})
+    assert resp.status_code == 200
+    assert [category["id"] for category in resp.json()] == [
+        categories[2].id,
+        categories[0].id,
+    ]
+    assert resp.headers["Content-Range"] == "0-2/2"
+
+
+def test_missed_invalidation_expires_snapshot(monkeypatch, create_category):
+    cache = ReferenceData()
+    cache.load()
+    category = create_category()
+    assert category.id not in cache.table("categories").records
+
+    monkeypatch.setattr(cache, "loaded_at", 0.0)
+    assert category.id in cache.table("categories").records
+
+
+def test_invalidation_published_to_workers(client: TestClient):
+    try:
+        redis_client.ping()
+    except RedisError:
+        pytest.skip("Redis is not available")
+
+    reference_data.load()
+    # Published by another worker, the app's listener expires the snapshot
+    redis_client.publish(ReferenceData.channel, 12345)
+    for _ in range(50):
+        if reference_data.snapshot is None:
+            break
+        time.sleep(0.02)
+    assert reference_data.snapshot is None
+    assert reference_data.version == 12345
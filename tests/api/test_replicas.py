@@ -0,0 +1,118 @@
+import asyncio
+import uuid
+
+from fastapi import FastAPI, HTTPException
+from sqlalchemy import event
+from sqlalchemy.orm.session import Session
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from app.core.config import settings
+from app.core.middleware import ReadYourWritesMiddleware
+from app.db import ReplicaSet
+from app.deps import db as deps_db
+from app.models.image import Image
+
+UNREACHABLE_URL = "postgresql://postgres@127.0.0.1:1/app"
+
+
+def make_request(cookies: str = "") -> Request:
+    return Request({"type": "http", "headers": [(b"cookie", cookies.encode())]})
+
+
+def test_replica_set_skips_unhealthy_replicas():
+    replica_set = ReplicaSet([settings.database_url, UNREACHABLE_URL])
+
+    async def check():
+        await replica_set.check()
+        await replica_set.dispose()
+
+    asyncio.run(check())
+    healthy, unreachable = replica_set.replicas
+    assert healthy.healthy and not unreachable.healthy
+    assert {replica_set.choose() for _ in range(4)} == {healthy}
+
+
+def test_replica_set_round_robin():
+    replica_set = ReplicaSet([settings.database_url, settings.database_url])
+    first, second = replica_set.replicas
+    assert [replica_set.choose() for _ in range(4)] == [first, second, first, second]
+
+
+def test_replica_set_all_down():
+    replica_set = ReplicaSet([UNREACHABLE_URL])
+    replica_set.replicas[0].healthy = False
+    assert replica_set.choose() is None
+
+
+def test_read_primary_cookie(monkeypatch):
+    replica_set = ReplicaSet([settings.database_url])
+    monkeypatch.setattr(deps_db, "replicas", replica_set)
+
+    assert deps_db.choose_replica(make_request()) is replica_set.replicas[0]
+    cookie = f"{settings.read_primary_cookie}=1"
+    assert deps_db.choose_replica(make_request(cookie)) is None
+
+
+def test_read_handlers_use_replica(db: Session, client: TestClient, monkeypatch):
+    replica_set = ReplicaSet([settings.database_url])
+    monkeypatch.setattr(deps_db, "replicas", replica_set)
+    checkouts = []
+    event.listen(
+        replica_set.replicas[0].engine, "checkout", lambda *args: checkouts.append(args)
+    )
+
+    resp = client.get("/classifieds/search", params={"q": "bike"})
+    assert resp.status_code == 200, resp.text
+    assert checkouts
+
+
+def test_image_file_uses_replica(
+    db: Session, client: TestClient, create_classified, monkeypatch
+):
+    image = Image(
+        filename=uuid.uuid4(), extension=".jpg", classified=create_classified()
+    )
+    db.add(image)
+    db.commit()
+    replica_set = ReplicaSet([settings.database_url])
+    monkeypatch.setattr(deps_db, "replicas", replica_set)
+    checkouts = []
+    event.listen(
+        replica_set.replicas[0].engine, "checkout", lambda *args: checkouts.append(args)
+    )
+
+    # Found on the replica, its file is missing
+    resp = client.get(f"/images/file/{image.id}")
+    assert resp.status_code == 404, resp.text
+    assert checkouts
+
+
+def test_read_your_writes_cookie():
+    # A separate app, requests of a second TestClient run on their own event
+    # loop and mustn't share the app's async connection pools
+    app = FastAPI()
+
+    @app.post("/writes", status_code=201)
+    def create_write():
+        return {}
+
+    @app.post("/invalid-writes")
+    def create_invalid_write():
+        raise HTTPException(400)
+
+    @app.get("/reads")
+    def get_reads():
+        return []
+
+    client = TestClient(ReadYourWritesMiddleware(app))
+    resp = client.post("/writes")
+    assert resp.status_code == 201
+    assert resp.cookies[settings.read_primary_cookie] == "1"
+
+    resp = client.post("/invalid-writes")
+    assert resp.status_code == 400
+    assert settings.read_primary_cookie not in resp.cookies
+
+    resp = client.get("/reads")
+    assert settings.read_primary_cookie not in resp.cookies
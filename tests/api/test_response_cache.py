@@ -0,0 +1,133 @@
+import pytest
+from redis.exceptions import RedisError
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.cache import normalize_query, response_cache
+from app.core.redis import redis_client
+from tests.utils import get_jwt_header
+
+
+@pytest.fixture(autouse=True)
+def require_redis():
+    try:
+        redis_client.ping()
+    except RedisError:
+        pytest.skip("Redis is not available")
+
+
+def test_normalize_query():
+    assert normalize_query('sort=["id", "ASC"]&range=[0,9]') == normalize_query(
+        'range=[0, 9]&sort=["id","ASC"]'
+    )
+    assert normalize_query("range=[0,9]") != normalize_query("range=[0,19]")
+
+
+def test_get_classified_cached(client: TestClient, create_classified):
+    classified = create_classified()
+
+    resp = client.get(f"/classifieds/{classified.id}")
+    assert resp.status_code == 200
+    assert resp.headers["X-Cache"] == "MISS"
+
+    cached = client.get(f"/classifieds/{classified.id}")
+    assert cached.headers["X-Cache"] == "HIT"
+    assert cached.json() == resp.json()
+    assert cached.headers["Content-Type"] == resp.headers["Content-Type"]
+
+
+def test_not_found_not_cached(client: TestClient):
+    for _ in range(2):
+        resp = client.get("/classifieds/0")
+        assert resp.status_code == 404
+        assert resp.headers.get("X-Cache") != "HIT"
+
+
+def test_get_classifieds_equivalent_queries(client: TestClient, create_classified):
+    create_classified()
+
+    resp = client.get('/classifieds?range=[0,9]&sort=["id","ASC"]')
+    assert resp.headers["X-Cache"] == "MISS"
+    resp = client.get('/classifieds?sort=["id", "ASC"]&range=[0, 9]')
+    assert resp.headers["X-Cache"] == "HIT"
+    assert resp.headers["Content-Range"]
+
+
+def test_update_invalidates(
+    db: Session, client: TestClient, create_user, create_classified
+):
+    user = create_user()
+    classified = create_classified(user=user)
+    client.get(f"/classifieds/{classified.id}")
+    client.get("/classifieds")
+
+    response_cache.invalidate("classifieds", f"classified:{classified.id}")
+
+    resp = client.get(f"/classifieds/{classified.id}")
+    assert resp.headers["X-Cache"] == "MISS"
+    resp = client.get("/classifieds")
+    assert resp.headers["X-Cache"] == "MISS"
+
+
+def test_invalidation_is_scoped(client: TestClient, create_classified):
+    first, second = create_classified(), create_classified()
+    client.get(f"/classifieds/{first.id}")
+    client.get(f"/classifieds/{second.id}")
+    client.get(f"/images/classified/{first.id}")
+
+    response_cache.invalidate(f"classified:{first.id}")
+
+    assert client.get(f"/classifieds/{first.id}").headers["X-Cache"] == "MISS"
+    assert client.get(f"/classifieds/{second.id}").headers["X-Cache"] == "HIT"
+    assert client.get(f"/images/classified/{first.id}").headers["X-Cache"] == "HIT"
+
+
+def test_invalidate_async(client: TestClient, create_classified, run_async):
+    first, second = create_classified(), create_classified()
+    client.get(f"/classifieds/{first.id}")
+    client.get(f"/classifieds/{second.id}")
+
+    run_async(response_cache.invalidate_async, f"classified:{first.id}")
+
+    assert client.get(f"/classifieds/{first.id}").headers["X-Cache"] == "MISS"
+    assert client.get(f"/classifieds/{second.id}").headers["X-Cache"] == "HIT"
+
+
+@pytest.mark.parametrize("resource", ["categories", "cities"])
+def test_reference_delete_invalidates_classifieds(
+    client: TestClient, create_superuser, create_classified, resource
+):
+    classified = create_classified()
+    classified_id = classified.id
+    client.get(f"/classifieds/{classified_id}")
+    assert client.get("/classifieds").headers["X-Cache"] == "MISS"
+    assert client.get("/classifieds").headers["X-Cache"] == "HIT"
+
+    reference_id = (
+        classified.category_id if resource == "categories" else classified.city_id
+    )
+    resp = client.delete(
+        f"/{resource}/{reference_id}",
+        headers=get_jwt_header(create_superuser(), f"{resource}_delete"),
+    )
+    assert resp.status_code == 200, resp.text
+
+    # The classifieds of the category or city are deleted along with it
+    assert client.get("/classifieds").headers["X-Cache"] == "MISS"
+    assert client.get(f"/classifieds/{classified_id}").status_code == 404
+
+
+def test_cache_stats(client: TestClient, create_superuser, create_classified):
+    classified = create_classified()
+    for _ in range(3):
+        client.get(f"/classifieds/{classified.id}")
+
+    resp = client.get("/cache/stats", headers=get_jwt_header(create_superuser()))
+    assert resp.status_code == 200
+    assert resp.json()["/classifieds/{classified_id}:hits"] == 2
+    assert resp.json()["/classifieds/{classified_id}:misses"] == 1
+
+
+def test_cache_stats_superuser_only(client: TestClient, create_user):
+    resp = client.get("/cache/stats", headers=get_jwt_header(create_user()))
+    assert resp.status_code == 401
@@ -0,0 +1,130 @@
+import jwt
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.config import settings
+from app.deps.scopes import query_scope_names_for_user, scope_catalog
+from app.deps.users import manager
+from app.models.scope import Scope
+from app.models.user import User
+from app.models.user_scope import UserScope
+from tests.utils import generate_random_string
+
+
+def create_scope(db: Session, **kwargs) -> Scope:
+    scope = Scope(
+        scope_name=generate_random_string(16), description="description", **kwargs
+    )
+    db.add(scope)
+    db.commit()
+    scope_catalog.invalidate()
+    return scope
+
+
+def login(client: TestClient, user: User, password: str) -> dict:
+    resp = client.post("/login", data={"username": user.username, "password": password})
+    assert resp.status_code == 200, resp.text
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+
+def test_login_token_carries_scopes_and_version(
+    db: Session, client: TestClient, create_user, default_password
+):
+    user = create_user()
+    scope = create_scope(db)
+    db.add(UserScope(user_id=user.id, scope_name=scope.scope_name))
+    db.commit()
+
+    headers = login(client, user, default_password)
+    token = headers["Authorization"].split()[1]
+    payload = jwt.decode(token, settings.secret_key, algorithms=[manager.algorithm])
+    assert payload["scopes"] == [scope.scope_name]
+    assert payload["ver"] == 0
+
+
+def test_login_caches_scope_names_asynchronously(
+    db: Session,
+    client: TestClient,
+    monkeypatch,
+    create_user,
+    default_password,
+    record_statements,
+):
+    class BlockingRedis:
+        def __getattr__(self, name):
+            raise AssertionError("sync Redis used on the event loop")
+
+    user = create_user()
+    scope = create_scope(db)
+    db.add(UserScope(user_id=user.id, scope_name=scope.scope_name))
+    db.commit()
+
+    with monkeypatch.context() as m:
+        m.setattr("app.deps.scopes.redis_client", BlockingRedis())
+        login(client, user, default_password)
+
+    # The names cached by the login are shared with the sync lookup
+    user_scope_queries = record_statements("users_scopes")
+    assert query_scope_names_for_user(user, db) == [scope.scope_name]
+    assert user_scope_queries() == []
+
+
+def test_scope_catalog_cached(
+    db: Session, client: TestClient, create_superuser, record_statements
+):
+    scope_catalog.load()
+    scope_queries = record_statements("scopes")
+    names = query_scope_names_for_user(create_superuser(), db)
+    assert scope_queries() == []
+
+    scope = create_scope(db)
+    assert scope.scope_name not in names
+    assert scope.scope_name in query_scope_names_for_user(create_superuser(), db)
+
+
+def test_user_scope_names_cached(
+    db: Session, client: TestClient, create_user, record_statements
+):
+    user = create_user()
+    assert query_scope_names_for_user(user, db) == []
+    user_scope_queries = record_statements("users_scopes")
+    assert query_scope_names_for_user(user, db) == []
+    assert user_scope_queries() == []
+
+    scope = create_scope(db)
+    db.add(UserScope(user_id=user.id, scope_name=scope.scope_name))
+    db.commit()
+    assert query_scope_names_for_user(user, db) == [scope.scope_name]
+
+
+def test_scope_revocation_revokes_tokens(
+    db: Session, client: TestClient, create_superuser, default_password
+):
+    user = create_superuser()
+    scope = create_scope(db)
+    user_scope = UserScope(user_id=user.id, scope_name=scope.scope_name)
+    db.add(user_scope)
+    db.commit()
+    headers = login(client, user, default_password)
+    assert client.get("/cache/stats", headers=headers).status_code == 200
+
+    db.delete(user_scope)
+    db.commit()
+    db.refresh(user)
+    assert user.token_version == 1
+    assert client.get("/cache/stats", headers=headers).status_code == 401
+
+    headers = login(client, user, default_password)
+    assert client.get("/cache/stats", headers=headers).status_code == 200
+
+
+def test_scope_grant_keeps_tokens(
+    db: Session, client: TestClient, create_superuser, default_password
+):
+    user = create_superuser()
+    headers = login(client, user, default_password)
+
+    scope = create_scope(db)
+    db.add(UserScope(user_id=user.id, scope_name=scope.scope_name))
+    db.commit()
+    assert client.get("/cache/stats", headers=headers).status_code == 200
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.orm.exc import DetachedInstanceError
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.core.redis import redis_client
+from app.db import AsyncSessionLocal
+from app.deps.scopes import user_scopes_key
+from app.deps.user_cache import user_cache
+from app.models.user import User
+from app.models.scope import Scope
+from app.models.user_scope import UserScope
+from tests.utils import generate_random_string, get_jwt_header
+
+
+def test_authentication_cached(client: TestClient, create_superuser, record_statements):
+    user = create_superuser()
+    headers = get_jwt_header(user)
+    user_queries = record_statements("users")
+
+    for _ in range(3):
+        resp = client.get("/cache/stats", headers=headers)
+        assert resp.status_code == 200, resp.text
+    assert len(user_queries()) == 1
+
+
+def test_cached_in_redis(client: TestClient, create_superuser, record_statements):
+    user = create_superuser()
+    headers = get_jwt_header(user)
+    client.get("/cache/stats", headers=headers)
+
+    # Another worker has an empty LRU
+    user_cache.evict(None)
+    user_queries = record_statements("users")
+    resp = client.get("/cache/stats", headers=headers)
+    assert resp.status_code == 200
+    assert len(user_queries()) == 0
+
+
+def test_superuser_change_invalidates(
+    db: Session, client: TestClient, create_superuser
+):
+    user = create_superuser()
+    headers = get_jwt_header(user)
+    assert client.get("/cache/stats", headers=headers).status_code == 200
+
+    user.is_superuser = False
+    db.commit()
+    assert client.get("/cache/stats", headers=headers).status_code == 401
+
+
+def test_scope_change_invalidates(
+    db: Session, client: TestClient, create_superuser, record_statements
+):
+    user = create_superuser()
+    headers = get_jwt_header(user)
+    client.get("/cache/stats", headers=headers)
+
+    scope = Scope(scope_name=generate_random_string(16), description="description")
+    db.add(UserScope(user_id=user.id, scope=scope))
+    db.commit()
+    user_queries = record_statements("users")
+    client.get("/cache/stats", headers=headers)
+    assert len(user_queries()) == 1
+
+
+def test_unrelated_change_keeps_entry(
+    db: Session, client: TestClient, create_superuser, record_statements
+):
+    user = create_superuser()
+    headers = get_jwt_header(user)
+    client.get("/cache/stats", headers=headers)
+
+    user.email = f"changed-{user.email}"
+    db.commit()
+    user_queries = record_statements("users")
+    client.get("/cache/stats", headers=headers)
+    assert len(user_queries()) == 0
+
+
+def test_cached_without_password(client: TestClient, create_superuser):
+    user = create_superuser()
+    client.get("/cache/stats", headers=get_jwt_header(user))
+
+    cached = redis_client.hgetall(user_cache.redis_key(str(user.id)))
+    assert cached
+    for values in cached.values():
+        assert "hashed_password" not in json.loads(values)
+
+
+def test_cached_users_not_shared(create_superuser, run_async):
+    user = create_superuser()
+    run_async(user_cache.set, str(user.id), 1, user)
+
+    first = run_async(user_cache.get, str(user.id), 1)
+    second = run_async(user_cache.get, str(user.id), 1)
+    assert first is not second
+    assert first.id == second.id == user.id
+    with pytest.raises(DetachedInstanceError):
+        first.hashed_password
+
+
+def test_async_commit_invalidates_without_sync_redis(
+    create_user, monkeypatch, run_async
+):
+    class BlockingRedis:
+        def __getattr__(self, name):
+            raise AssertionError("sync Redis used on the event loop")
+
+    user = create_user()
+    redis_client.set(user_scopes_key(user.id), "[]")
+    monkeypatch.setattr("app.deps.user_cache.redis_client", BlockingRedis())
+
+    async def revoke_tokens():
+        async with AsyncSessionLocal() as session:
+            db_user = await session.get(User, user.id)
+            db_user.token_version += 1
+            await session.commit()
+        await asyncio.gather(*user_cache.tasks)
+
+    run_async(revoke_tokens)
+    assert redis_client.get(user_scopes_key(user.id)) is None
@@ -0,0 +1,136 @@
+import io
+import json
+import sys
+import time
+
+from sqlalchemy.orm.session import Session
+from starlette.testclient import TestClient
+
+from app.commands.import_classifieds import main
+from app.core.config import settings
+from app.deps.imports import import_classifieds, read_rows, text_feed
+from app.models.classified import Classified, ClassifiedStatus
+from tests.utils import generate_random_string
+
+
+def test_import_classifieds_csv(
+    db: Session, create_user, create_category, create_city, monkeypatch
+):
+    monkeypatch.setattr(settings, "imports_batch_size", 2)
+    user, category, city = create_user(), create_category(), create_city()
+    # Same name, told apart by voivodeship
+    other_city = create_city(name=city.name)
+    title = generate_random_string(16)
+    feed = io.StringIO(
+        "title,content,price,category,city,voivodeship\n"
+        f"{title},first,10.50,{category.name.upper()},{city.name},{city.voivodeship.name}\n"
+        f"{title},unknown category,10,{generate_random_string(16)},{city.name},{city.voivodeship.name}\n"
+        f"{title},ambiguous city,10,{category.name},{city.name},\n"
+        f"{title},not a price,x,{category.name},{city.name},{city.voivodeship.name}\n"
+        f'{title},"second, quoted",20,{category.name},{other_city.name},{other_city.voivodeship.name}\n'
+    )
+    rejects = io.StringIO()
+
+    assert import_classifieds(db, read_rows(feed, "csv"), user.id, rejects) == (2, 3)
+
+    imported = db.query(Classified).filter(Classified.title == title).all()
+    assert sorted((c.content, c.city_id, float(c.price)) for c in imported) == [
+        ("first", city.id, 10.5),
+        ("second, quoted", other_city.id, 20),
+    ]
+    assert {(c.user_id, c.category_id, c.status) for c in imported} == {
+        (user.id, category.id, ClassifiedStatus.active)
+    }
+    assert [json.loads(line)["row"] for line in rejects.getvalue().splitlines()] == [
+        2,
+        3,
+        4,
+    ]
+
+
+def test_import_classifieds_ndjson(db: Session, create_user, create_classified):
+    user, classified = create_user(), create_classified()
+    title = generate_random_string(16)
+    row = {
+        "title": title,
+        "content": "content",
+        "price": 5,
+        "category_id": classified.category_id,
+        "city_id": classified.city_id,
+    }
+    lines = [
+        row,
+        {**row, "title": "x" * 33},
+        {**row, "category_id": 10**6},
+        {**row, "city_id": 10**6},
+        {**row, "content": "nul \x00"},
+        {**row, "price": "1e20"},
+        [row],
+    ]
+    feed = io.StringIO("\n".join(json.dumps(line) for line in lines) + "\n\nnot json\n")
+    rejects = io.StringIO()
+
+    rows = read_rows(feed, "ndjson")
+    assert import_classifieds(db, rows, user.id, rejects) == (1, 7)
+    assert db.query(Classified).filter(Classified.title == title).count() == 1
+    errors = [json.loads(line) for line in rejects.getvalue().splitlines()]
+    assert [error["row"] for error in errors] == [2, 3, 4, 5, 6, 7, 8]
+    assert errors[1]["errors"] == ["Unknown category 1000000"]
+    assert errors[5]["errors"] == ["Not a JSON object"]
+    assert errors[6]["errors"][0].startswith("Invalid JSON")
+
+
+def test_import_classifieds_malformed_csv(db: Session, create_user, create_classified):
+    user, classified = create_user(), create_classified()
+    title = generate_random_string(16)
+    ids = f"{classified.category_id},{classified.city_id}"
+    feed = text_feed(
+        io.BytesIO(
+            b"title,content,price,category_id,city_id\n"
+            + f"{title},first,1,{ids}\n".encode()
+            + f"{title},bad \xff bytes,1,{ids}\n".encode("latin-1")
+            # Past the field size limit of the csv module
+            + f'{title},"{"x" * 200_000}",1,{ids}\n'.encode()
+            + f"{title},second,1,{ids}\n".encode()
+        )
+    )
+    rejects = io.StringIO()
+
+    rows = read_rows(feed, "csv")
+    assert import_classifieds(db, rows, user.id, rejects) == (2, 2)
+    assert db.query(Classified).filter(Classified.title == title).count() == 2
+    errors = [json.loads(line) for line in rejects.getvalue().splitlines()]
+    assert errors[0]["errors"] == ["Invalid UTF-8 in content"]
+    assert errors[1]["errors"][0].startswith("Invalid CSV")
+
+
+def test_import_classifieds_command(
+    db: Session,
+    client: TestClient,
+    create_user,
+    create_classified,
+    monkeypatch,
+    tmp_path,
+):
+    user, classified = create_user(), create_classified()
+    row = {
+        "title": generate_random_string(16),
+        "content": "content",
+        "price": 5,
+        "category_id": classified.category_id,
+        "city_id": classified.city_id,
+    }
+    feed = tmp_path / "feed.ndjson"
+    feed.write_text(json.dumps(row) + "\n")
+    rejects = tmp_path / "rejects.ndjson"
+    assert client.get("/classifieds").headers["X-Cache"] == "MISS"
+    argv = ["import_classifieds", str(feed), "--user", user.username]
+    monkeypatch.setattr(sys, "argv", [*argv, "--rejects", str(rejects)])
+    # A clock too coarse to measure the import
+    monkeypatch.setattr(time, "monotonic", lambda: 0.0)
+
+    main()
+
+    assert db.query(Classified).filter(Classified.title == row["title"]).count() == 1
+    assert not rejects.exists()
+    assert client.get("/classifieds").headers["X-Cache"] == "MISS"
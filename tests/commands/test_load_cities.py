@@ -0,0 +1,62 @@
+from sqlalchemy.orm.session import Session
+
+from app.commands.load_cities import load_cities
+from app.deps.reference_data import reference_data
+from app.models.city import City
+from tests.utils import generate_random_string
+
+
+def test_load_cities(db: Session, create_city):
+    city: City = create_city()
+    new_voivodeship = generate_random_string(16)
+    rows = [
+        {
+            "voivodeship": city.voivodeship.name,
+            "name": city.name,
+            "latitude": "52.2297",
+            "longitude": "21.0122",
+        },
+        {
+            "voivodeship": new_voivodeship,
+            "name": "Kraków",
+            "latitude": "50.0647",
+            "longitude": "19.9450",
+        },
+        {
+            "voivodeship": new_voivodeship,
+            "name": "Kraków",
+            "latitude": "50.0614",
+            "longitude": "19.9366",
+        },
+    ]
+
+    # Loaded before, served from memory
+    reference_data.table("cities")
+    assert load_cities(db, rows) == (1, 1)
+
+    db.refresh(city)
+    assert (city.latitude, city.longitude) == (52.2297, 21.0122)
+    created = db.query(City).filter(City.name == "Kraków").one()
+    assert created.voivodeship.name == new_voivodeship
+    assert (created.latitude, created.longitude) == (50.0614, 19.9366)
+    cities = reference_data.table("cities").records
+    assert cities[city.id].latitude == 52.2297
+    assert cities[created.id].name == "Kraków"
+
+
+def test_load_cities_invalid_coordinates(db: Session):
+    voivodeship = generate_random_string(16)
+    rows = [
+        {"voivodeship": voivodeship, "name": name, "latitude": lat, "longitude": lon}
+        for name, lat, lon in (
+            ("Gdańsk", "54.3520", "18.6466"),
+            ("Malformed", "54,35", "18.64"),
+            ("Missing", "", "18.64"),
+            ("Out of range", "154.35", "18.64"),
+            ("Not a number", "nan", "18.64"),
+        )
+    ]
+
+    assert load_cities(db, rows) == (1, 0)
+    names = db.query(City.name).join(City.voivodeship).filter_by(name=voivodeship)
+    assert [name for name, in names] == ["Gdańsk"]
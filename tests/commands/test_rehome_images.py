@@ -0,0 +1,77 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+
+import pytest
+from PIL import Image as PILImage
+from sqlalchemy.orm.session import Session
+
+from app.commands.rehome_images import rehome_images
+from app.core.config import settings
+from app.deps.images import image_path, process_image
+from app.models.image import Image
+from app.models.image_blob import ImageBlob
+
+
+@pytest.fixture(autouse=True)
+def upload_path(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(settings, "images_upload_path", f"{tmp_path}/")
+    return tmp_path
+
+
+def create_flat_image(db: Session, classified, upload_path: Path, content: bytes):
+    image = Image(filename=uuid.uuid4(), extension=".png", classified=classified)
+    db.add(image)
+    db.commit()
+    (upload_path / f"{image.filename}.png").write_bytes(content)
+    return image
+
+
+def test_rehome_images(db: Session, create_classified, upload_path: Path):
+    # Images of earlier runs would be rehomed too
+    db.query(Image).filter(Image.blob_checksum.is_(None)).delete()
+    db.commit()
+    content = b"\x89PNG\r\n\x1a\n" + os.urandom(64)
+    classified = create_classified()
+    first = create_flat_image(db, classified, upload_path, content)
+    second = create_flat_image(db, classified, upload_path, content)
+    missing = Image(filename=uuid.uuid4(), extension=".png", classified=classified)
+    db.add(missing)
+    db.commit()
+
+    assert rehome_images(db) == (2, 1)
+
+    checksum = hashlib.sha256(content).hexdigest()
+    db.expire_all()
+    assert first.blob_checksum == second.blob_checksum == checksum
+    assert missing.blob_checksum is None
+    assert db.get(ImageBlob, checksum).refcount == 2
+    files = [path for path in upload_path.rglob("*") if path.is_file()]
+    assert files == [Path(image_path(first))]
+    assert files[0].read_bytes() == content
+
+
+def test_rehome_processed_image(
+    db: Session, create_classified, upload_path: Path, run_async
+):
+    db.query(Image).filter(Image.blob_checksum.is_(None)).delete()
+    db.commit()
+    image = create_flat_image(db, create_classified(), upload_path, b"")
+    PILImage.new("RGB", (400, 300), "navy").save(upload_path / f"{image.filename}.png")
+    run_async(process_image, {"job_id": "test"}, image.id)
+
+    assert rehome_images(db) == (1, 1)
+
+    db.expire_all()
+    assert db.get(ImageBlob, image.blob_checksum).processed
+    files = sorted(path.name for path in upload_path.rglob("*") if path.is_file())
+    assert files == sorted(
+        [f"{image.blob_checksum}.png"]
+        + [
+            f"{image.blob_checksum}_{variant['width']}.{variant['format']}".replace(
+                ".jpeg", ".jpg"
+            )
+            for variant in image.variants
+        ]
+    )
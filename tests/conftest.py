@@ -1,19 +1,27 @@
+import re
 import uuid
-from typing import Callable, Generator
+from typing import Callable, Generator, List, Optional
 
 import pytest
 
-from sqlalchemy.engine import create_engine
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, create_engine
 from sqlalchemy.orm.session import Session, sessionmaker
 from starlette.testclient import TestClient
 
+from app.core.cache import response_cache
 from app.core.config import settings
+from app.core.passwords import hash_password
 from app.db import Base
 from app.deps.db import get_db
+from app.deps.reference_data import reference_data
 from app.factory import create_app
 from app.models.category import Category
+from app.models.city import City
+from app.models.classified import Classified
 from app.models.user import User
-from app.deps.users import get_password_hash
+from app.models.voivodeship import Voivodeship
 from tests.utils import generate_random_string
 
 engine = create_engine(
@@ -71,13 +79,36 @@ def auto_rollback(db: Session):
     db.rollback()
 
 
+@pytest.fixture(scope="function", autouse=True)
+def clear_response_cache():
+    # Tests write through the session, which doesn't invalidate cached responses
+    try:
+        response_cache.clear()
+    except RedisError:
+        pass
+
+
+@pytest.fixture(scope="session")
+def run_async(client: TestClient) -> Callable:
+    # Coroutines run on the client's event loop, the one the app's async Redis
+    # and database connections belong to
+    return client.portal.call
+
+
+@pytest.fixture(scope="function", autouse=True)
+def expire_reference_data():
+    # Tests write through the session, which doesn't publish invalidations
+    reference_data.expire()
+
+
 @pytest.fixture(scope="session")
 def create_user(db: Session, default_password: str):
     def inner():
         user = User(
             id=uuid.uuid4(),
+            username=generate_random_string(20),
             email=f"{generate_random_string(20)}@{generate_random_string(10)}.com",
-            hashed_password=get_password_hash(default_password),
+            hashed_password=hash_password(default_password),
         )
         db.add(user)
         db.commit()
@@ -91,8 +122,9 @@ def create_superuser(db: Session, default_password: str):
     def inner():
         user = User(
             id=uuid.uuid4(),
+            username=generate_random_string(20),
             email=f"{generate_random_string(20)}@{generate_random_string(10)}.com",
-            hashed_password=get_password_hash(default_password),
+            hashed_password=hash_password(default_password),
         )
         user.is_superuser = True
         db.add(user)
@@ -108,7 +140,7 @@ def create_category(db: Session, create_user: Callable):
         if not user:
             user = create_user()
         category = Category(
-            name="name",
+            name=generate_random_string(16),
             description="description",
         )
         db.add(category)
@@ -116,3 +148,60 @@ def create_category(db: Session, create_user: Callable):
         return category
 
     return inner
+
+
+@pytest.fixture(scope="session")
+def create_city(db: Session):
+    def inner(voivodeship=None, **kwargs):
+        if not voivodeship:
+            voivodeship = Voivodeship(name=generate_random_string(16))
+        city = City(
+            name=kwargs.pop("name", generate_random_string(16)),
+            voivodeship=voivodeship,
+            **kwargs,
+        )
+        db.add(city)
+        db.commit()
+        return city
+
+    return inner
+
+
+@pytest.fixture(scope="session")
+def create_classified(
+    db: Session, create_user: Callable, create_category: Callable, create_city: Callable
+):
+    def inner(user=None, category=None, city=None, **kwargs):
+        classified = Classified(
+            title=kwargs.pop("title", generate_random_string(16)),
+            content=kwargs.pop("content", "content"),
+            price=kwargs.pop("price", 100),
+            user=user or create_user(),
+            category=category or create_category(),
+            city=city or create_city(),
+            **kwargs,
+        )
+        db.add(classified)
+        db.commit()
+        return classified
+
+    return inner
+
+
+@pytest.fixture
+def record_statements():
+    """Starts recording the statements run by any engine, the async one too.
+    Returns a function listing those reading from `table`, or all of them."""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    def start(table: Optional[str] = None) -> Callable[[], List[str]]:
+        statements.clear()
+        pattern = re.compile(rf"\bFROM {table}\b" if table else "")
+        return lambda: [s for s in statements if pattern.search(s)]
+
+    event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+    yield start
+    event.remove(Engine, "before_cursor_execute", before_cursor_execute)
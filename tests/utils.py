@@ -1,5 +1,6 @@
 import secrets
 import string
+from datetime import datetime
 from typing import Any
 
 from app.deps.users import manager
@@ -10,6 +11,9 @@ def generate_random_string(length: int) -> str:
     return "".join(secrets.choice(string.ascii_lowercase) for i in range(length))
 
 
-def get_jwt_header(user: User) -> Any:
-    token = manager.create_access_token(data={"sub": str(user.id)})
+def get_jwt_header(user: User, *scopes: str) -> Any:
+    """Authorization header with a token like the ones /login issues"""
+    token = manager.create_access_token(
+        data={"sub": str(user.id), "iat": datetime.utcnow()}, scopes=scopes
+    )
     return {"Authorization": f"Bearer {token}"}